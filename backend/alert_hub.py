@@ -0,0 +1,187 @@
+"""
+Alert fan-out to WebSocket dashboards.
+
+Publishing an alert never waits on a client: each connection has a bounded
+queue drained by its own sender task, so one slow or half-dead dashboard
+cannot hold up the others, or the analysis that raised the alert. When a
+client falls behind and its queue is full, the hub's policy decides:
+- drop_oldest: drop the oldest pending alert (the default);
+- drop_newest: drop the incoming alert;
+- coalesce: the incoming alert replaces a pending one of the same type from the
+  same source (stream, job), else the oldest pending alert is dropped;
+- disconnect: close the connection; the dashboard reconnects and catches up.
+A send that takes longer than send_timeout also closes the connection.
+
+Clients subscribe with filters on ward, bed and minimum severity, so nurse
+stations only receive the alerts for their own beds.
+"""
+import asyncio
+from collections import deque
+
+SEVERITIES = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+POLICIES = ("drop_oldest", "drop_newest", "coalesce", "disconnect")
+
+def parse_filters(ward=None, bed=None, severity=None):
+    """
+    Filters from comma-separated query values; severity is the lowest one
+    to receive. Raises ValueError for an unknown severity.
+    """
+    def values(text):
+        if not text:
+            return None
+        return {value.strip() for value in str(text).split(",") if value.strip()} or None
+
+    filters = {"ward": values(ward), "bed": values(bed), "severity": None}
+    if severity:
+        severity = str(severity).upper()
+        if severity not in SEVERITIES:
+            raise ValueError(f"severity must be one of {', '.join(SEVERITIES)}")
+        filters["severity"] = severity
+    return filters
+
+def _source(alert):
+    return alert.get("stream_id") or alert.get("job_id"), alert.get("type")
+
+class AlertSubscriber:
+    """One connected client: its filters, pending alerts and sender task"""
+
+    def __init__(self, websocket, filters=None, queue_size=256, policy="drop_oldest", send_timeout=10.0):
+        self.websocket = websocket
+        self.filters = filters or parse_filters()
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self._pending = deque()
+        self._wake = asyncio.Event()
+        self._task = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+
+    def wants(self, alert):
+        for key in ("ward", "bed"):
+            allowed = self.filters[key]
+            if allowed is not None and str(alert.get(key)) not in allowed:
+                return False
+        minimum = self.filters["severity"]
+        if minimum is not None:
+            severity = alert.get("severity")
+            if severity not in SEVERITIES or SEVERITIES.index(severity) < SEVERITIES.index(minimum):
+                return False
+        return True
+
+    def offer(self, alert):
+        """Queue an alert without waiting; applies the policy when the queue is full"""
+        if len(self._pending) >= self.queue_size:
+            self.dropped += 1
+            if self.policy == "disconnect":
+                self.close()
+                return
+            if self.policy == "drop_newest":
+                return
+            if self.policy == "coalesce":
+                source = _source(alert)
+                for index, pending in enumerate(self._pending):
+                    if _source(pending) == source:
+                        del self._pending[index]
+                        break
+                else:
+                    self._pending.popleft()
+            else:
+                self._pending.popleft()
+        self._pending.append(alert)
+        self._wake.set()
+
+    async def _send_loop(self):
+        try:
+            while not self.closed:
+                if not self._pending:
+                    self._wake.clear()
+                    await self._wake.wait()
+                    continue
+                alert = self._pending.popleft()
+                await asyncio.wait_for(self.websocket.send_json(alert), self.send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Alert client dropped: {e!r}")
+        self.closed = True
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+    def start(self):
+        self._task = asyncio.create_task(self._send_loop())
+
+    def close(self):
+        """Stop sending; the sender task closes the socket"""
+        self.closed = True
+        self._wake.set()
+
+    def stats(self):
+        return {"pending": len(self._pending), "sent": self.sent, "dropped": self.dropped, "filters": {
+            key: sorted(value) if isinstance(value, set) else value for key, value in self.filters.items()
+        }}
+
+class AlertHub:
+    def __init__(self, queue_size=256, policy="drop_oldest", send_timeout=10.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Alert queue policy must be one of {', '.join(POLICIES)}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0  # by clients that have since disconnected
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, websocket, filters=None):
+        """Register an accepted WebSocket and start its sender task; call on the event loop"""
+        subscriber = AlertSubscriber(websocket, filters, self.queue_size, self.policy, self.send_timeout)
+        subscriber.start()
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def _forget(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            self.dropped += subscriber.dropped
+
+    async def unsubscribe(self, subscriber):
+        self._forget(subscriber)
+        subscriber.close()
+        if subscriber._task is not None:
+            subscriber._task.cancel()
+            try:
+                await subscriber._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def publish(self, alert):
+        """Hand an alert to every matching client; never waits. Call on the event loop."""
+        self.published += 1
+        for subscriber in list(self.subscribers):
+            if subscriber.closed:
+                self._forget(subscriber)
+            elif subscriber.wants(alert):
+                subscriber.offer(alert)
+
+    async def close(self):
+        for subscriber in list(self.subscribers):
+            await self.unsubscribe(subscriber)
+
+    def stats(self):
+        subscribers = list(self.subscribers)
+        return {
+            "clients": len(subscribers),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "published": self.published,
+            "pending": sum(len(subscriber._pending) for subscriber in subscribers),
+            "sent": sum(subscriber.sent for subscriber in subscribers),
+            "dropped": self.dropped + sum(subscriber.dropped for subscriber in subscribers),
+        }
@@ -0,0 +1,237 @@
+"""
+Persistent alert store.
+
+Every broadcast alert is kept in an SQLite database in WAL mode, so shift
+reports can be queried without re-running video analysis. add() only puts the
+alert on a queue: a writer thread inserts them in batches, one transaction per
+batch, off the event loop. Reads open their own connections and, with WAL,
+never wait for the writer.
+
+Alerts are indexed on time, type, severity, video and bed. query() pages
+through them newest first; aggregate() counts them per time bucket and group,
+e.g. falls per bed per hour.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    type TEXT NOT NULL,
+    severity TEXT,
+    event TEXT,
+    episode_id TEXT,
+    video TEXT,
+    job_id TEXT,
+    stream_id TEXT,
+    ward TEXT,
+    bed TEXT,
+    video_time REAL,
+    frame INTEGER,
+    duration REAL,
+    confidence REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts);
+CREATE INDEX IF NOT EXISTS alerts_type_ts ON alerts (type, ts);
+CREATE INDEX IF NOT EXISTS alerts_severity_ts ON alerts (severity, ts);
+CREATE INDEX IF NOT EXISTS alerts_video_ts ON alerts (video, ts);
+CREATE INDEX IF NOT EXISTS alerts_bed_ts ON alerts (bed, ts);
+"""
+COLUMNS = ("ts", "type", "severity", "event", "episode_id", "video", "job_id", "stream_id", "ward", "bed",
+           "video_time", "frame", "duration", "confidence", "data")
+# Columns that can be filtered on; a comma-separated filter value matches any of its values
+FILTERS = ("type", "severity", "event", "episode_id", "video", "job_id", "stream_id", "ward", "bed")
+GROUPS = ("type", "severity", "video", "ward", "bed", "stream_id")
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+
+def parse_time(value):
+    """Epoch seconds from a number or an ISO 8601 string; None stays None"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time: {value!r} (use epoch seconds or ISO 8601)")
+
+class AlertStore:
+    def __init__(self, path, batch_size=500, flush_seconds=1.0, queue_size=100000, retention_days=None):
+        """
+        batch_size: alerts inserted per transaction at most
+        flush_seconds: longest an alert waits in the queue before it is written
+        queue_size: alerts waiting to be written; more are dropped (and counted)
+        retention_days: alerts older than this are deleted (None = keep all)
+        """
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def start(self):
+        """Create the schema and start the writer thread"""
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        self._thread = threading.Thread(target=self._write_loop, name="alert-store", daemon=True)
+        self._thread.start()
+        print(f"Alert store: {self.path}")
+        return self
+
+    def close(self):
+        """Write what is queued and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def add(self, alert):
+        """Queue an alert for writing; never blocks"""
+        try:
+            self._queue.put_nowait((time.time(), alert))
+        except queue.Full:
+            self.dropped += 1
+
+    @staticmethod
+    def _row(ts, alert):
+        confidence = alert.get("peak_confidence", alert.get("confidence"))
+        return (
+            ts, alert.get("type", "UNKNOWN"), alert.get("severity"), alert.get("event"), alert.get("episode_id"),
+            alert.get("video"), alert.get("job_id"), alert.get("stream_id"),
+            None if alert.get("ward") is None else str(alert["ward"]),
+            None if alert.get("bed") is None else str(alert["bed"]),
+            alert.get("timestamp"), alert.get("frame"), alert.get("duration"), confidence,
+            json.dumps(alert, default=str),
+        )
+
+    def _write_loop(self):
+        connection = self._connect()
+        connection.execute("PRAGMA synchronous=NORMAL")
+        last_prune = 0.0
+        stopping = False
+        try:
+            while not stopping:
+                batch = []
+                deadline = time.monotonic() + self.flush_seconds
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()) if batch else None)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(self._row(*item))
+                if batch:
+                    try:
+                        with connection:
+                            connection.executemany(
+                                f"INSERT INTO alerts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                                batch,
+                            )
+                        self.written += len(batch)
+                        self.batches += 1
+                    except sqlite3.Error as e:
+                        self.errors += 1
+                        print(f"Alert store: failed to write {len(batch)} alerts: {e}")
+                if self.retention_days and time.monotonic() - last_prune > 3600:
+                    last_prune = time.monotonic()
+                    with connection:
+                        connection.execute("DELETE FROM alerts WHERE ts < ?",
+                                           (time.time() - self.retention_days * 86400,))
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _where(filters, start=None, end=None):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        for column in FILTERS:
+            value = filters.get(column)
+            if value is None:
+                continue
+            values = [item.strip() for item in str(value).split(",") if item.strip()]
+            if not values:
+                continue
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, start=None, end=None, limit=100, before_id=None, **filters):
+        """
+        Alerts newest first, filtered by time (epoch seconds) and by any of
+        FILTERS (comma-separated values). Pass the returned next_cursor as
+        before_id for the next page.
+        """
+        limit = max(1, min(int(limit), 1000))
+        where, params = self._where(filters, start, end)
+        if before_id is not None:
+            where += (" AND " if where else " WHERE ") + "id < ?"
+            params.append(int(before_id))
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT id, ts, data FROM alerts{where} ORDER BY id DESC LIMIT ?", params + [limit + 1]
+            ).fetchall()
+        finally:
+            connection.close()
+        alerts = [dict(json.loads(row["data"]), id=row["id"], stored_at=row["ts"]) for row in rows[:limit]]
+        return {"alerts": alerts, "next_cursor": rows[limit - 1]["id"] if len(rows) > limit else None}
+
+    def aggregate(self, bucket="hour", group_by="type", start=None, end=None, **filters):
+        """
+        Alert counts per time bucket (minute, hour, day; UTC) and group_by
+        column, oldest bucket first: [{"bucket": epoch seconds, "group": ..., "count": n}].
+        Episodes count once, by their start event, unless an event filter is given.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        if group_by not in GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+        size = BUCKETS[bucket]
+        where, params = self._where(filters, start, end)
+        if filters.get("event") is None:
+            where += (" AND " if where else " WHERE ") + "(event IS NULL OR event = 'start')"
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT CAST(ts / {size} AS INTEGER) * {size} AS bucket, {group_by} AS grp, COUNT(*) AS count "
+                f"FROM alerts{where} GROUP BY bucket, grp ORDER BY bucket, grp", params
+            ).fetchall()
+        finally:
+            connection.close()
+        return [{"bucket": row["bucket"], "group": row["grp"], "count": row["count"]} for row in rows]
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
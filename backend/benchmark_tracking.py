@@ -0,0 +1,78 @@
+"""
+Per-frame pose inference latency of the two landmarker running modes:
+IMAGE (full detection on every frame, the old path) against VIDEO (pose
+tracked between frames, fed the frames' CAP_PROP_POS_MSEC timestamps).
+
+    python benchmark_tracking.py uploads/video.mp4 --fps 6
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from detector import ActivityDetector, create_pose_landmarker
+from kernels import NUM_LANDMARKS
+from sampling import FrameSampler
+
+def run(file_path, running_mode, sample_rate=None, stride=5, limit=None):
+    """Returns (per-frame latencies in ms, (T, 33, 4) poses with NaN where none was found)"""
+    landmarker = create_pose_landmarker(running_mode=running_mode)
+    detector = ActivityDetector(landmarker, tracking=running_mode == "VIDEO")
+    cap = cv2.VideoCapture(str(file_path))
+    if not cap.isOpened():
+        raise IOError("Failed to open video")
+
+    latencies, poses = [], []
+    try:
+        for _, _, frame, media_msec in FrameSampler(cap, sample_rate=sample_rate, stride=stride):
+            started = time.perf_counter()
+            pose = detector.detect_pose(frame, media_msec if detector.tracking else None)
+            latencies.append((time.perf_counter() - started) * 1000)
+            poses.append(np.full((NUM_LANDMARKS, 4), np.nan) if pose is None else pose.copy())
+            if limit and len(latencies) >= limit:
+                break
+    finally:
+        cap.release()
+        landmarker.close()
+    return np.array(latencies), np.array(poses).reshape(-1, NUM_LANDMARKS, 4)
+
+def summarize(latencies, poses, warmup=5):
+    measured = latencies[warmup:] if len(latencies) > warmup else latencies
+    return {
+        "frames": len(latencies),
+        "mean_ms": float(measured.mean()),
+        "p50_ms": float(np.percentile(measured, 50)),
+        "p95_ms": float(np.percentile(measured, 95)),
+        "detected": float(np.mean(~np.isnan(poses[:, 0, 0]))),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare IMAGE and VIDEO mode pose inference latency")
+    parser.add_argument("video")
+    parser.add_argument("--fps", type=float, default=None, help="analyses per second (overrides --stride)")
+    parser.add_argument("--stride", type=int, default=5, help="analyse every Nth frame")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many sampled frames")
+    parser.add_argument("--warmup", type=int, default=5, help="frames left out of the latency statistics")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("IMAGE", "VIDEO"):
+        latencies, poses = run(args.video, mode, args.fps, args.stride, args.limit)
+        results[mode] = (summarize(latencies, poses, args.warmup), poses)
+
+    print(f"{'mode':<6} {'frames':>7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'detected':>9}")
+    for mode, (stats, _) in results.items():
+        print(f"{mode:<6} {stats['frames']:>7} {stats['mean_ms']:>8.2f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p95_ms']:>8.2f} {stats['detected']:>9.1%}")
+
+    image, video = results["IMAGE"][1], results["VIDEO"][1]
+    both = ~np.isnan(image[:, 0, 0]) & ~np.isnan(video[:, 0, 0])
+    if both.any():
+        drift = np.abs(image[both, :, :2] - video[both, :, :2]).mean()
+        print(f"Mean landmark difference where both found a pose: {drift:.4f} (normalized units)")
+    speedup = results["IMAGE"][0]["mean_ms"] / results["VIDEO"][0]["mean_ms"]
+    print(f"VIDEO mode speedup: {speedup:.2f}x")
+
+if __name__ == "__main__":
+    main()
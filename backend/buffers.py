@@ -0,0 +1,86 @@
+"""
+Fixed-size history buffers for the detectors.
+
+Both buffers preallocate their storage once; appending never allocates and
+costs O(1). RingBuffer keeps every item twice (at i and i + capacity) so the
+current window is always one contiguous, oldest-first NumPy view.
+"""
+import numpy as np
+
+class RingBuffer:
+    """FIFO of the last `capacity` items, each a float array of `shape`"""
+
+    def __init__(self, capacity, shape=(), dtype=np.float64):
+        self.capacity = capacity
+        self._data = np.zeros((2 * capacity,) + tuple(shape), dtype=dtype)
+        self._next = 0  # slot the next item goes to
+        self._count = 0
+
+    def append(self, item):
+        slot = self._next
+        self._data[slot] = item
+        self._data[slot + self.capacity] = item
+        self._next = (slot + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def oldest(self):
+        """The item the next append will evict (only meaningful when full)"""
+        return self._data[self._next]
+
+    def last(self, offset=1):
+        """The offset-th most recent item (1 = newest), as a view"""
+        return self._data[self._next + self.capacity - offset]
+
+    def view(self):
+        """All items, oldest first, as a contiguous view (valid until the next append)"""
+        start = (self._next - self._count) % self.capacity
+        return self._data[start:start + self._count]
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def is_full(self):
+        return self._count == self.capacity
+
+    def __len__(self):
+        return self._count
+
+class RollingWindow(RingBuffer):
+    """Scalar ring buffer with O(1) running mean and variance"""
+
+    def __init__(self, capacity):
+        super().__init__(capacity)
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def append(self, value):
+        value = float(value)
+        if self.is_full():
+            evicted = float(self.oldest())
+            self._sum -= evicted
+            self._sum_sq -= evicted * evicted
+        super().append(value)
+        self._sum += value
+        self._sum_sq += value * value
+        if self._next == 0:
+            # Re-sum once per wrap so floating-point drift can't build up
+            window = self.view()
+            self._sum = float(window.sum())
+            self._sum_sq = float(np.dot(window, window))
+
+    def clear(self):
+        super().clear()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def mean(self):
+        return self._sum / self._count if self._count else 0.0
+
+    def var(self):
+        """Population variance, like np.var"""
+        if not self._count:
+            return 0.0
+        mean = self._sum / self._count
+        return max(0.0, self._sum_sq / self._count - mean * mean)
@@ -0,0 +1,611 @@
+"""
+Pose-based activity detection shared by the API server and the video workers.
+Kept free of FastAPI state so worker processes can import it cheaply.
+"""
+import contextlib
+import cv2
+import mediapipe as mp
+import numpy as np
+import os
+import urllib.request
+
+from buffers import RingBuffer, RollingWindow
+from episodes import EpisodeEngine
+from kernels import (
+    NUM_LANDMARKS, POSTURE_TYPES, PoseLandmark, bed_bounds_around, bed_exit_kernel, body_center,
+    displacement, fall_kernel, hip_center, landmarks_to_array, posture_kernel,
+    rapid_movement_kernel, seizure_decision, seizure_points, shoulder_level,
+)
+from pipeline import VideoPipeline
+from sampling import FrameSampler
+from spectral import SlidingSpectrum
+
+MODEL_PATH = "pose_landmarker.task"
+MODEL_URL = "https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_lite/float16/1/pose_landmarker_lite.task"
+
+def create_pose_landmarker(running_mode="IMAGE"):
+    """
+    Create a MediaPipe PoseLandmarker, downloading the model if needed.
+    running_mode "VIDEO" tracks the pose between frames (detect_for_video
+    with increasing timestamps) instead of running full detection on each.
+    """
+    from mediapipe.tasks import python
+    from mediapipe.tasks.python import vision
+    
+    # Download pose landmarker model if not exists
+    if not os.path.exists(MODEL_PATH):
+        print("Downloading pose landmarker model...")
+        urllib.request.urlretrieve(MODEL_URL, MODEL_PATH)
+        print("Model downloaded successfully")
+    
+    # Create pose landmarker
+    base_options = python.BaseOptions(model_asset_path=MODEL_PATH)
+    options = vision.PoseLandmarkerOptions(
+        base_options=base_options,
+        running_mode=getattr(vision.RunningMode, running_mode),
+        output_segmentation_masks=False,
+        min_pose_detection_confidence=0.5,
+        min_pose_presence_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+    return vision.PoseLandmarker.create_from_options(options)
+
+class ActivityDetector:
+    def __init__(self, pose_detector=None, pose_lock=None, sample_rate=6.0, tracking=False,
+                 motion_gate=None, roi=None):
+        self.pose_detector = pose_detector
+        # Guards a landmarker shared with other detectors on other threads
+        self.pose_lock = pose_lock if pose_lock is not None else contextlib.nullcontext()
+        # pose_detector is a VIDEO-mode landmarker owned by this detector: frames
+        # need increasing timestamps and the pose is tracked between them
+        self.tracking = tracking
+        # Optional motion.MotionGate: still frames reuse the last pose without inference
+        self.motion_gate = motion_gate
+        self.breathing_held = False  # The breathing signal was held on the last frame
+        # Optional roi.PoseROI: inference runs on a downscaled crop around the person
+        self.roi = roi
+        self.bed_region = None  # Will be set based on first detection
+        self.fall_threshold = 0.3  # Vertical position threshold
+        self.rapid_movement_threshold = 0.08  # Movement speed threshold (lowered from 0.15)
+        self.frame_buffer_size = 10
+        self.seizure_buffer_size = 30  # Frames to analyze for seizure
+        self.sample_rate = sample_rate  # Analysed frames per second (30fps, every 5th frame)
+        self.breathing_window_seconds = 20.0
+        self.breathing_band = (0.1, 1.0)  # Hz, 6-60 breaths per minute
+        self.seizure_window_seconds = 2.0
+        self.seizure_band = (3.0, 8.0)  # Hz, convulsive movement
+        self.allocate_buffers()
+    
+    def use_tracking_landmarker(self, pose_detector):
+        """Switch to a VIDEO-mode landmarker used only by this detector"""
+        self.pose_detector = pose_detector
+        self.pose_lock = contextlib.nullcontext()
+        self.tracking = True
+    
+    def set_sample_rate(self, sample_rate):
+        """Match the spectral windows to the real analysis rate (clears history)"""
+        if sample_rate != self.sample_rate:
+            self.sample_rate = sample_rate
+            self.allocate_buffers()
+    
+    def allocate_buffers(self):
+        """(Re)create the fixed-size histories; call after changing a buffer size"""
+        self.pose = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)  # Current frame's landmarks
+        self.last_pose = None  # self.pose, or None if the last frame had no pose
+        self.prev_positions = RingBuffer(self.frame_buffer_size, (2,))
+        self.prev_landmarks_history = RingBuffer(self.seizure_buffer_size, (4, 2))  # For seizure detection
+        # Frame-to-frame movement of the seizure history, with running mean/variance
+        self.seizure_movements = RollingWindow(self.seizure_buffer_size - 1)
+        # Sliding spectra of shoulder height (breathing) and shoulder/hip positions (seizure)
+        self.breathing_buffer_size = max(8, int(round(self.breathing_window_seconds * self.sample_rate)))
+        self.breathing_spectrum = SlidingSpectrum(
+            self.breathing_buffer_size, self.sample_rate, *self.breathing_band
+        )
+        self.seizure_spectrum = SlidingSpectrum(
+            max(8, int(round(self.seizure_window_seconds * self.sample_rate))), self.sample_rate,
+            *self.seizure_band, channels=8
+        )
+        # Scratch space so per-frame work doesn't allocate
+        self._seizure_diff = np.zeros((4, 2))
+    
+    def reset(self):
+        """Reset detector state for new video"""
+        self.prev_positions.clear()
+        self.prev_landmarks_history.clear()
+        self.seizure_movements.clear()
+        self.seizure_spectrum.clear()
+        self.bed_region = None
+        self.breathing_spectrum.clear()
+        self.last_pose = None
+        if self.motion_gate is not None:
+            self.motion_gate.reset(self.sample_rate)
+        if self.roi is not None:
+            self.roi.reset()
+        print("Detector state reset for new video")
+    
+    @property
+    def bed_region(self):
+        return self._bed_region
+    
+    @bed_region.setter
+    def bed_region(self, region):
+        """Bed area as a dict of normalized x_min/x_max/y_min/y_max, or None"""
+        self._bed_region = region
+        self._bed_bounds = None if region is None else np.array(
+            [region['x_min'], region['x_max'], region['y_min'], region['y_max']]
+        )
+        
+    def detect_fall(self, pose):
+        """Detect fall based on pose landmarks"""
+        if pose is None:
+            return False, 0.0
+        
+        is_fall, hip_y = fall_kernel(pose, self.fall_threshold)
+        return bool(is_fall), float(hip_y)
+    
+    def detect_rapid_movement(self, pose):
+        """Detect rapid movement based on position changes"""
+        if pose is None:
+            return False, 0.0
+        
+        # Store position history (centre of mass of key points)
+        self.prev_positions.append(body_center(pose))
+        
+        # Calculate movement speed
+        if len(self.prev_positions) >= 2:
+            is_rapid, movement = rapid_movement_kernel(
+                self.prev_positions.last(1), self.prev_positions.last(2), self.rapid_movement_threshold
+            )
+            return bool(is_rapid), float(movement)
+        
+        return False, 0.0
+    
+    def detect_seizure(self, pose):
+        """Detect seizure-like convulsive movements"""
+        if pose is None:
+            return False, 0.0
+        
+        # Track shoulders and hips for erratic movement
+        positions = seizure_points(pose)
+        
+        # Movement since the previous frame feeds the running statistics
+        if len(self.prev_landmarks_history):
+            self.seizure_movements.append(
+                displacement(positions, self.prev_landmarks_history.last(), self._seizure_diff)
+            )
+        
+        # Store landmark history
+        self.prev_landmarks_history.append(positions)
+        self.seizure_spectrum.append(positions)
+        
+        if self.seizure_spectrum.observable:
+            # Convulsions: most of the movement is rhythmic in the seizure band
+            if not self.seizure_spectrum.ready:
+                return False, 0.0
+            band_ratio = self.seizure_spectrum.band_ratio()
+            is_seizure = bool(band_ratio > 0.5 and self.seizure_spectrum.band_rms() > 0.01)
+            return is_seizure, band_ratio
+        
+        # The seizure band is above Nyquist at this sample rate, so fall back
+        # to movement statistics. Need enough history to detect seizure
+        if len(self.prev_landmarks_history) < 20:
+            return False, 0.0
+        
+        # High variance + high frequency = seizure
+        movement_variance = self.seizure_movements.var()
+        is_seizure = seizure_decision(movement_variance, self.seizure_movements.mean())
+        
+        return bool(is_seizure), float(movement_variance)
+    
+    def detect_bed_exit(self, pose, frame_shape=None):
+        """Detect when patient exits bed area"""
+        if pose is None:
+            return False, 0.0
+        
+        # Get hip position (center of body)
+        hips = hip_center(pose)
+        
+        # Initialize bed region on first detection (assume patient starts in bed)
+        if self.bed_region is None:
+            x_min, x_max, y_min, y_max = bed_bounds_around(hips).tolist()
+            self.bed_region = {'x_min': x_min, 'x_max': x_max, 'y_min': y_min, 'y_max': y_max}
+            return False, 0.0
+        
+        is_outside, distance = bed_exit_kernel(hips, self._bed_bounds)
+        return bool(is_outside), float(distance)
+    
+    def detect_abnormal_posture(self, pose):
+        """Detect unusual body positions"""
+        if pose is None:
+            return False, 0.0, "None"
+        
+        is_abnormal, confidence, code = posture_kernel(pose)
+        return bool(is_abnormal), float(confidence), POSTURE_TYPES[int(code)]
+    
+    def detect_breathing_rate(self, pose):
+        """Estimate breathing rate from chest movement"""
+        if pose is None:
+            return 0.0, "Unknown"
+        
+        # Track shoulder movement (rises with breathing)
+        self.breathing_spectrum.append(shoulder_level(pose))
+        
+        # Need a full window to estimate breathing
+        if not self.breathing_spectrum.ready:
+            return 0.0, "Calculating..."
+        
+        # No clear rhythm in the breathing band (e.g. the patient is moving)
+        if self.breathing_spectrum.band_ratio() < 0.3:
+            return 0.0, "Irregular"
+        
+        # Dominant breathing frequency, at the real sample rate
+        breaths_per_minute = self.breathing_spectrum.dominant_frequency() * 60
+        
+        # Classify breathing rate
+        if breaths_per_minute < 12:
+            status = "Slow (Bradypnea)"
+        elif breaths_per_minute > 20:
+            status = "Fast (Tachypnea)"
+        else:
+            status = "Normal"
+        
+        return float(breaths_per_minute), status
+    
+    def detect_pose(self, frame, timestamp_ms=None):
+        """
+        Run pose inference on a BGR frame; returns a (33, 4) pose array or None.
+        Pass timestamp_ms (increasing) when the landmarker is in VIDEO mode.
+        """
+        # Crop around the person and downscale first, so fewer pixels are converted
+        box = None
+        if self.roi is not None:
+            frame, box = self.roi.crop(frame, self.bed_region)
+        
+        # Convert to RGB for MediaPipe
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        
+        # Create MediaPipe Image
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+        
+        # Detect pose
+        with self.pose_lock:
+            if timestamp_ms is None:
+                detection_result = self.pose_detector.detect(mp_image)
+            else:
+                detection_result = self.pose_detector.detect_for_video(mp_image, int(timestamp_ms))
+        
+        pose = None
+        if detection_result.pose_landmarks:
+            # Get first person
+            pose = landmarks_to_array(detection_result.pose_landmarks[0], out=self.pose)
+        if self.roi is not None:
+            # Back to full-frame coordinates
+            pose = self.roi.restore(pose, box)
+        return pose
+    
+    def next_pose(self, frame, timestamp_ms=None):
+        """
+        Pose for the next frame (None if there is none). With a motion gate,
+        still frames reuse the last pose without inference. The gate keeps
+        inferring still frames at its breathing cadence, so breathing goes on
+        being measured. A gate without that cadence holds breathing
+        (breathing_held) on every frame not inferred because of motion: held
+        and sparse heartbeat poses would read as a false breathing rhythm.
+        """
+        self.breathing_held = False
+        if self.motion_gate is not None:
+            decision = self.motion_gate.check(frame)
+            self.breathing_held = not self.motion_gate.samples_breathing and decision != self.motion_gate.MOTION
+            if decision == self.motion_gate.STILL:
+                return self.last_pose
+        self.last_pose = self.detect_pose(frame, timestamp_ms)
+        return self.last_pose
+    
+    def analyze_pose(self, pose, hold_breathing=False):
+        """
+        Run every detector on one frame's pose array (None if no pose was found).
+        hold_breathing restarts the breathing window instead of measuring.
+        """
+        activities = {
+            "fall_detected": False,
+            "rapid_movement": False,
+            "seizure_detected": False,
+            "bed_exit_detected": False,
+            "abnormal_posture_detected": False,
+            "fall_confidence": 0.0,
+            "movement_speed": 0.0,
+            "seizure_confidence": 0.0,
+            "bed_exit_distance": 0.0,
+            "posture_confidence": 0.0,
+            "posture_type": "Normal",
+            "breathing_rate": 0.0,
+            "breathing_status": "Unknown",
+            "pose_detected": False
+        }
+        
+        if hold_breathing:
+            # Held poses carry no breathing signal; a rate needs a full window of inferred frames
+            self.breathing_spectrum.clear()
+        
+        if pose is None:
+            # Keep the spectral signals evenly sampled across the gap
+            self.breathing_spectrum.repeat_last()
+            self.seizure_spectrum.repeat_last()
+            return activities
+        
+        activities["pose_detected"] = True
+        
+        # 1. Detect fall
+        is_fall, fall_conf = self.detect_fall(pose)
+        activities["fall_detected"] = is_fall
+        activities["fall_confidence"] = fall_conf
+        
+        # 2. Detect rapid movement
+        is_rapid, speed = self.detect_rapid_movement(pose)
+        activities["rapid_movement"] = is_rapid
+        activities["movement_speed"] = speed
+        
+        # 3. Detect seizure
+        is_seizure, seizure_conf = self.detect_seizure(pose)
+        activities["seizure_detected"] = is_seizure
+        activities["seizure_confidence"] = seizure_conf
+        
+        # 4. Detect bed exit
+        is_bed_exit, exit_distance = self.detect_bed_exit(pose)
+        activities["bed_exit_detected"] = is_bed_exit
+        activities["bed_exit_distance"] = exit_distance
+        
+        # 5. Detect abnormal posture
+        is_abnormal, posture_conf, posture_type = self.detect_abnormal_posture(pose)
+        activities["abnormal_posture_detected"] = is_abnormal
+        activities["posture_confidence"] = posture_conf
+        activities["posture_type"] = posture_type
+        
+        # 6. Detect breathing rate
+        if hold_breathing:
+            breathing_rate, breathing_status = 0.0, "Paused (still)"
+        else:
+            breathing_rate, breathing_status = self.detect_breathing_rate(pose)
+        activities["breathing_rate"] = breathing_rate
+        activities["breathing_status"] = breathing_status
+        
+        return activities
+    
+    def draw_activities(self, frame, pose, activities):
+        """Draw landmarks and alert text onto a BGR frame in place"""
+        # Draw pose landmarks on frame (simple circles)
+        height, width = frame.shape[:2]
+        for x, y in (pose[:, :2] * (width, height)).astype(int):
+            cv2.circle(frame, (int(x), int(y)), 5, (0, 255, 0), -1)
+        
+        # Draw alerts on frame
+        y_offset = 30
+        if activities["fall_detected"]:
+            cv2.putText(frame, "FALL DETECTED!", (10, y_offset), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+            y_offset += 40
+        if activities["seizure_detected"]:
+            cv2.putText(frame, "SEIZURE DETECTED!", (10, y_offset), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2)
+            y_offset += 40
+        if activities["bed_exit_detected"]:
+            cv2.putText(frame, "BED EXIT DETECTED!", (10, y_offset), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 165, 0), 2)
+            y_offset += 40
+        if activities["abnormal_posture_detected"]:
+            cv2.putText(frame, f"ABNORMAL POSTURE: {activities['posture_type']}", (10, y_offset), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+            y_offset += 40
+        
+        # Display breathing rate
+        cv2.putText(frame, f"Breathing: {activities['breathing_rate']:.1f} bpm ({activities['breathing_status']})", 
+                   (10, height - 20), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+    
+    def analyze_frame(self, frame, annotate=False, timestamp_ms=None):
+        """Analyze a single frame for unusual activities"""
+        if self.pose_detector is None:
+            # MediaPipe not available
+            self.last_pose = None
+            return {
+                "fall_detected": False,
+                "rapid_movement": False,
+                "seizure_detected": False,
+                "bed_exit_detected": False,
+                "abnormal_posture_detected": False,
+                "fall_confidence": 0.0,
+                "movement_speed": 0.0,
+                "breathing_rate": 0.0,
+                "breathing_status": "Unknown",
+                "posture_type": "Unknown",
+                "pose_detected": False
+            }, frame
+        
+        pose = self.next_pose(frame, timestamp_ms)
+        activities = self.analyze_pose(pose, self.breathing_held)
+        
+        # Drawing is only needed when someone looks at the frame
+        if annotate and pose is not None:
+            self.draw_activities(frame, pose, activities)
+        
+        return activities, frame
+
+def build_alerts(activities, timestamp, frame_count):
+    """Turn one frame's activity flags into alert dicts"""
+    alerts = []
+    
+    # Generate alerts for all detection types
+    if activities["fall_detected"]:
+        alerts.append({
+            "type": "FALL",
+            "severity": "CRITICAL",
+            "timestamp": timestamp,
+            "frame": frame_count,
+            "confidence": activities["fall_confidence"],
+            "message": "🚨 Fall detected - Immediate attention required!"
+        })
+        print(f"ALERT: Fall detected at frame {frame_count}")
+    
+    if activities["seizure_detected"]:
+        alerts.append({
+            "type": "SEIZURE",
+            "severity": "CRITICAL",
+            "timestamp": timestamp,
+            "frame": frame_count,
+            "confidence": activities["seizure_confidence"],
+            "message": "🚨 Seizure detected - Emergency response needed!"
+        })
+        print(f"ALERT: Seizure detected at frame {frame_count}")
+    
+    if activities["bed_exit_detected"]:
+        alerts.append({
+            "type": "BED_EXIT",
+            "severity": "HIGH",
+            "timestamp": timestamp,
+            "frame": frame_count,
+            "distance": activities["bed_exit_distance"],
+            "message": "⚠️ Patient left bed - Check immediately!"
+        })
+        print(f"ALERT: Bed exit detected at frame {frame_count}")
+    
+    if activities["abnormal_posture_detected"]:
+        alerts.append({
+            "type": "ABNORMAL_POSTURE",
+            "severity": "MEDIUM",
+            "timestamp": timestamp,
+            "frame": frame_count,
+            "posture_type": activities["posture_type"],
+            "confidence": activities["posture_confidence"],
+            "message": f"⚠️ Abnormal posture detected: {activities['posture_type']}"
+        })
+        print(f"ALERT: Abnormal posture detected at frame {frame_count}: {activities['posture_type']}")
+    
+    if activities["rapid_movement"]:
+        alerts.append({
+            "type": "RAPID_MOVEMENT",
+            "severity": "MEDIUM",
+            "timestamp": timestamp,
+            "frame": frame_count,
+            "speed": activities["movement_speed"],
+            "message": "⚡ Rapid movement detected - Check patient"
+        })
+        print(f"ALERT: Rapid movement detected at frame {frame_count}, speed: {activities['movement_speed']:.4f}")
+    
+    # Monitor breathing rate (alert if abnormal)
+    if activities["breathing_rate"] > 0:
+        if activities["breathing_rate"] < 10 or activities["breathing_rate"] > 25:
+            alerts.append({
+                "type": "ABNORMAL_BREATHING",
+                "severity": "HIGH",
+                "timestamp": timestamp,
+                "frame": frame_count,
+                "breathing_rate": activities["breathing_rate"],
+                "status": activities["breathing_status"],
+                "message": f"⚠️ Abnormal breathing: {activities['breathing_rate']:.1f} bpm ({activities['breathing_status']})"
+            })
+    
+    return alerts
+
+def summarize_alerts(alerts):
+    """Count alerts per type for the process-video response"""
+    return {
+        "fall_count": len([a for a in alerts if a["type"] == "FALL"]),
+        "seizure_count": len([a for a in alerts if a["type"] == "SEIZURE"]),
+        "bed_exit_count": len([a for a in alerts if a["type"] == "BED_EXIT"]),
+        "abnormal_posture_count": len([a for a in alerts if a["type"] == "ABNORMAL_POSTURE"]),
+        "rapid_movement_count": len([a for a in alerts if a["type"] == "RAPID_MOVEMENT"]),
+        "abnormal_breathing_count": len([a for a in alerts if a["type"] == "ABNORMAL_BREATHING"])
+    }
+
+def analyze_video(file_path, detector, on_alert=None, on_progress=None, should_stop=None,
+                  sample_rate=None, stride=5, start_frame=0, end_frame=None,
+                  alerts_from_frame=0, bed_region=None, recorder=None, episodes=None):
+    """
+    Run the detector over a whole video file, or over frames
+    (start_frame, end_frame] of it.
+    
+    Frames are sampled at sample_rate analyses per second, or every
+    stride-th frame if sample_rate is not set (see sampling.FrameSampler),
+    and flow through a decode -> inference -> emit VideoPipeline.
+    Alerts for frames up to alerts_from_frame are suppressed (segment
+    warm-up), and bed_region presets the calibrated bed area.
+    recorder (an offline.LandmarkRecorder) receives every sampled frame's pose.
+    episodes (EpisodeEngine keyword arguments) coalesces detections into
+    episodes: on_alert then gets their start/update/end events and the
+    result lists one alert per episode.
+    on_alert(alert) is called from the emit stage for each alert,
+    on_progress(frame_count, total_frames, pipeline_stats) about every
+    30 frames, and should_stop() is polled as often to allow cancellation.
+    Raises IOError if the video cannot be opened.
+    """
+    # Open video
+    cap = cv2.VideoCapture(str(file_path))
+    
+    if not cap.isOpened():
+        raise IOError("Failed to open video")
+    
+    # Process video
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    sampler = FrameSampler(cap, sample_rate=sample_rate, stride=stride,
+                           start_frame=start_frame, end_frame=end_frame)
+    engine = EpisodeEngine(**episodes) if episodes else None
+    
+    def frame_alerts(activities, timestamp, frame_count):
+        if recorder is not None:
+            recorder.add(frame_count, timestamp, detector.last_pose, detector.breathing_held)
+        if frame_count <= alerts_from_frame:
+            return []
+        alerts = build_alerts(activities, timestamp, frame_count)
+        if engine is not None:
+            return engine.feed(alerts, timestamp, frame_count)
+        return alerts
+    
+    pipeline = VideoPipeline(sampler, detector, frame_alerts, on_alert)
+    
+    def report_progress(frame_count):
+        if on_progress is not None:
+            on_progress(frame_count, total_frames, pipeline.stats())
+    
+    # Reset detector state for new video
+    detector.set_sample_rate(sampler.sample_rate)
+    detector.reset()
+    if bed_region is not None:
+        detector.bed_region = dict(bed_region)
+    print(f"Processing video: {file_path}, Total frames: {total_frames}, FPS: {sampler.fps}, "
+          f"Sampling: {sampler.sample_rate:.2f}/s, Frames: {start_frame}-{end_frame or 'end'}")
+    
+    try:
+        alerts = pipeline.run(on_progress=report_progress, should_stop=should_stop)
+    finally:
+        cap.release()
+    
+    if engine is not None:
+        # Episodes still open at the end of the video end with it
+        for event in engine.flush():
+            if on_alert is not None:
+                on_alert(event)
+        alerts = engine.summaries()
+    
+    print(f"Video processing complete: {len(alerts)} total alerts")
+    print(f"  - Falls: {len([a for a in alerts if a['type'] == 'FALL'])}")
+    print(f"  - Rapid movements: {len([a for a in alerts if a['type'] == 'RAPID_MOVEMENT'])}")
+    print(f"  - Seizures: {len([a for a in alerts if a['type'] == 'SEIZURE'])}")
+    print(f"  - Bed exits: {len([a for a in alerts if a['type'] == 'BED_EXIT'])}")
+    print(f"  - Abnormal postures: {len([a for a in alerts if a['type'] == 'ABNORMAL_POSTURE'])}")
+    print(f"  - Breathing alerts: {len([a for a in alerts if a['type'] == 'ABNORMAL_BREATHING'])}")
+    
+    result = {
+        "total_frames": total_frames,
+        "processed_frames": sampler.position,
+        "sampling": sampler.stats(),
+        "pipeline": pipeline.stats(),
+        "alerts": alerts,
+        "summary": summarize_alerts(alerts)
+    }
+    if detector.motion_gate is not None:
+        result["motion_gate"] = detector.motion_gate.stats()
+    if detector.roi is not None:
+        result["roi"] = detector.roi.stats()
+    if engine is not None:
+        result["episodes"] = engine.stats()
+    return result
@@ -0,0 +1,189 @@
+"""
+Alert episodes.
+
+The detectors flag conditions frame by frame, so a 10-second fall is dozens of
+FALL detections. EpisodeEngine sits between build_alerts and delivery and turns
+them into episodes:
+- onset: a condition must be detected for min_seconds before its episode
+  starts (critical ones start on the first detection); a "start" event is sent;
+- while it lasts, an "update" event every update_seconds with the peak so far;
+- it ends once the condition has not been seen for release_seconds
+  (hysteresis, so a flickering detection stays one episode); the "end" event
+  is the episode summary: start, end, duration, detections and peak.
+
+Ending an episode only depends on detection times, so feeding every sampled
+frame (live) or only the frames with detections (offline scoring) gives the
+same episodes; the first ends episodes as soon as they expire.
+"""
+
+# Per alert type: seconds the condition must hold before an episode starts,
+# seconds without it before the episode ends, and the field whose peak is reported
+RULES = {
+    "FALL": {"min_seconds": 0.0, "release_seconds": 5.0, "peak": "confidence"},
+    "SEIZURE": {"min_seconds": 0.0, "release_seconds": 3.0, "peak": "confidence"},
+    "BED_EXIT": {"min_seconds": 1.0, "release_seconds": 5.0, "peak": "distance"},
+    "ABNORMAL_POSTURE": {"min_seconds": 3.0, "release_seconds": 5.0, "peak": "confidence"},
+    "RAPID_MOVEMENT": {"min_seconds": 1.0, "release_seconds": 3.0, "peak": "speed"},
+    "ABNORMAL_BREATHING": {"min_seconds": 10.0, "release_seconds": 10.0, "peak": "breathing_rate"},
+}
+DEFAULT_RULE = {"min_seconds": 0.0, "release_seconds": 5.0, "peak": "confidence"}
+NORMAL_BREATHING = 17.5  # bpm, the middle of the 10-25 range build_alerts accepts
+
+def _peak_score(alert, field):
+    value = alert.get(field)
+    if value is None:
+        return None
+    if field == "breathing_rate":
+        # The most abnormal rate, slow or fast
+        return abs(value - NORMAL_BREATHING)
+    return value
+
+class EpisodeEngine:
+    def __init__(self, update_seconds=30.0, rules=None):
+        """
+        update_seconds: interval of "update" events while an episode lasts (0 = none)
+        rules: per-type overrides of RULES, e.g. {"FALL": {"release_seconds": 10}}
+        """
+        self.update_seconds = update_seconds
+        self.rules = {kind: dict(rule) for kind, rule in RULES.items()}
+        for kind, rule in (rules or {}).items():
+            self.rules[kind] = dict(self.rules.get(kind, DEFAULT_RULE), **rule)
+        self.reset()
+
+    def reset(self):
+        self._open = {}  # type -> episode state, pending onset or started
+        self.episodes = []  # finished episode summaries
+        self.detections = 0
+        self.suppressed = 0  # onsets that never held for min_seconds
+        self.events = 0
+
+    def _rule(self, kind):
+        return self.rules.get(kind, DEFAULT_RULE)
+
+    @staticmethod
+    def _record(state, event):
+        """An event dict: the peak detection's fields plus the episode's"""
+        record = dict(state["peak_alert"])
+        record.update({
+            "event": event,
+            "episode_id": state["episode_id"],
+            "timestamp": state["started_at"],
+            "frame": state["start_frame"],
+            "started_at": state["started_at"],
+            "start_frame": state["start_frame"],
+            "last_seen_at": state["last_seen"],
+            "duration": round(state["last_seen"] - state["started_at"], 3),
+            "detections": state["detections"],
+            "peak_" + state["peak_field"]: state["peak_alert"].get(state["peak_field"]),
+        })
+        if event == "end":
+            record["ended_at"] = state["last_seen"]
+            record["end_frame"] = state["last_frame"]
+        return record
+
+    def _expire(self, timestamp):
+        """End (or discard, if never started) episodes not seen for release_seconds"""
+        events = []
+        for kind, state in list(self._open.items()):
+            if timestamp is None or timestamp - state["last_seen"] > self._rule(kind)["release_seconds"]:
+                del self._open[kind]
+                if state["started"]:
+                    summary = self._record(state, "end")
+                    self.episodes.append(summary)
+                    events.append(summary)
+                else:
+                    self.suppressed += 1
+        return events
+
+    def feed(self, alerts, timestamp, frame):
+        """
+        Take one frame's detections (build_alerts output, possibly empty) and
+        return the episode events to deliver, in order
+        """
+        events = self._expire(timestamp)
+        for alert in alerts:
+            self.detections += 1
+            kind = alert["type"]
+            rule = self._rule(kind)
+            state = self._open.get(kind)
+            score = _peak_score(alert, rule["peak"])
+            if state is None:
+                state = self._open[kind] = {
+                    "episode_id": f"{kind.lower()}-{frame}",
+                    "started": False,
+                    "started_at": timestamp,
+                    "start_frame": frame,
+                    "last_seen": timestamp,
+                    "last_frame": frame,
+                    "last_update": timestamp,
+                    "detections": 0,
+                    "peak_field": rule["peak"],
+                    "peak_alert": alert,
+                    "peak_score": score,
+                }
+            elif score is not None and (state["peak_score"] is None or score > state["peak_score"]):
+                state["peak_alert"], state["peak_score"] = alert, score
+            state["last_seen"], state["last_frame"] = timestamp, frame
+            state["detections"] += 1
+
+            if not state["started"]:
+                if timestamp - state["started_at"] >= rule["min_seconds"]:
+                    state["started"] = True
+                    state["last_update"] = timestamp
+                    events.append(self._record(state, "start"))
+            elif self.update_seconds and timestamp - state["last_update"] >= self.update_seconds:
+                state["last_update"] = timestamp
+                events.append(self._record(state, "update"))
+        self.events += len(events)
+        return events
+
+    def flush(self):
+        """End every open episode (end of the video or stream); returns the end events"""
+        events = self._expire(None)
+        self.events += len(events)
+        return events
+
+    def summaries(self):
+        """Finished episodes in start order"""
+        return sorted(self.episodes, key=lambda episode: (episode["timestamp"], episode["frame"], episode["type"]))
+
+    def stats(self):
+        return {
+            "detections": self.detections,
+            "episodes": len(self.episodes),
+            "open": len(self._open),
+            "suppressed_onsets": self.suppressed,
+            "events": self.events,
+        }
+
+def join_episodes(episodes, rules=None):
+    """
+    Join episodes that a segment boundary split in two: consecutive ones of
+    a type at most release_seconds apart. Returns them in start order.
+    """
+    rule_for = EpisodeEngine(rules=rules)._rule
+    joined = []
+    last = {}  # type -> index in joined of its latest episode
+    for episode in sorted(episodes, key=lambda e: (e["timestamp"], e["frame"], e["type"])):
+        kind = episode["type"]
+        rule = rule_for(kind)
+        previous = joined[last[kind]] if kind in last else None
+        if previous is None or episode["started_at"] - previous["ended_at"] > rule["release_seconds"]:
+            last[kind] = len(joined)
+            joined.append(episode)
+            continue
+        merged = dict(previous)
+        score, best = _peak_score(episode, rule["peak"]), _peak_score(previous, rule["peak"])
+        if score is not None and (best is None or score > best):
+            # The later part holds the peak: take its detection fields
+            merged.update({key: value for key, value in episode.items() if key not in (
+                "episode_id", "timestamp", "frame", "started_at", "start_frame")})
+        merged.update({
+            "last_seen_at": episode["last_seen_at"],
+            "ended_at": episode["ended_at"],
+            "end_frame": episode["end_frame"],
+            "duration": round(episode["ended_at"] - previous["started_at"], 3),
+            "detections": previous["detections"] + episode["detections"],
+        })
+        joined[last[kind]] = merged
+    return joined
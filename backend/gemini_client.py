@@ -0,0 +1,179 @@
+"""
+Shared async client for Gemini calls.
+
+The ward image endpoints used to call the synchronous SDK inside async
+handlers, so every multi-second round trip stalled the event loop, live
+alert delivery included. GeminiClient uses the SDK's async API and adds:
+- a concurrency limit: at most max_concurrency calls in flight, the rest wait;
+- a deadline per call (timeout seconds, waiting for a slot included);
+- retries of transient failures (timeouts, 429, 5xx, connection errors) with
+  exponential backoff and full jitter, within the deadline;
+- a circuit breaker: after breaker_failures consecutive failed calls, calls
+  fail fast for breaker_reset seconds, then one trial call decides whether
+  to close it again.
+base_url points the SDK at another server, e.g. a local stub in tests.
+"""
+import asyncio
+import random
+import time
+
+from google import genai
+from google.genai import errors, types
+
+class ModelError(Exception):
+    """A model call that failed; status_code is the HTTP status to answer with"""
+    status_code = 502
+
+class ModelTimeout(ModelError):
+    status_code = 504
+
+class ModelUnavailable(ModelError):
+    """The circuit breaker is open: the model is failing, calls are not attempted"""
+    status_code = 503
+
+def _retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError)):
+        return True
+    if isinstance(error, errors.APIError):
+        return error.code == 429 or error.code >= 500
+    # httpx transport errors (connection refused, reset, read timeout)
+    return type(error).__module__.startswith("httpx")
+
+def image_part(data, mime_type="image/jpeg"):
+    """Encoded image bytes as a generate() content part"""
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
+
+class GeminiClient:
+    def __init__(self, api_key, model="gemini-2.5-flash", base_url=None, max_concurrency=4, timeout=60.0,
+                 retries=2, backoff=0.5, max_backoff=8.0, breaker_failures=5, breaker_reset=30.0):
+        """
+        timeout: seconds per call, including waiting for a slot and retries
+        retries: extra attempts after a transient failure
+        backoff: base of the exponential backoff, in seconds (capped at max_backoff)
+        """
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        self._client = genai.Client(api_key=api_key, http_options=http_options)
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._failures = 0  # consecutive failed calls
+        self._opened_at = None  # when the breaker opened, None while closed
+        self._trial = False  # a half-open trial call is in flight
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+
+    @property
+    def breaker_state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.breaker_reset:
+            return "open"
+        return "half_open"
+
+    def _admit(self):
+        """Raise ModelUnavailable unless the breaker lets this call through"""
+        state = self.breaker_state
+        if state == "open" or (state == "half_open" and self._trial):
+            self.rejected += 1
+            retry_in = max(0.0, self.breaker_reset - (time.monotonic() - self._opened_at))
+            raise ModelUnavailable(f"Gemini is unavailable after repeated failures; retry in {retry_in:.0f}s")
+        if state == "half_open":
+            self._trial = True
+
+    def _record(self, ok):
+        self._trial = False
+        if ok:
+            self._failures = 0
+            self._opened_at = None
+            return
+        self._failures += 1
+        if self._failures >= self.breaker_failures or self._opened_at is not None:
+            if self._opened_at is None:
+                print(f"Gemini circuit breaker open after {self._failures} failures")
+            self._opened_at = time.monotonic()
+
+    async def generate(self, contents, model=None):
+        """Run generate_content and return the response text; raises ModelError"""
+        self._admit()
+        self.calls += 1
+        deadline = time.monotonic() + self.timeout
+        try:
+            text = await self._call(contents, model or self.model, deadline)
+        except ModelError:
+            self.failed += 1
+            self._record(False)
+            raise
+        except Exception:
+            # A request the model rejected (4xx): the model itself is fine
+            self.failed += 1
+            self._record(True)
+            raise
+        except BaseException:
+            # Cancelled (the client went away): says nothing about the model, but a
+            # half-open trial must give way so the next call can be the trial
+            self._trial = False
+            raise
+        self._record(True)
+        return text
+
+    async def _call(self, contents, model, deadline):
+        attempt = 0
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise ModelTimeout(f"No Gemini call slot within {self.timeout:.0f}s ({self.max_concurrency} in flight)")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ModelTimeout(f"Gemini call exceeded its {self.timeout:.0f}s deadline")
+                try:
+                    response = await asyncio.wait_for(
+                        self._client.aio.models.generate_content(model=model, contents=contents), remaining
+                    )
+                    return response.text or ""
+                except Exception as e:
+                    if not _retryable(e):
+                        raise
+                    if attempt >= self.retries:
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise ModelTimeout(f"Gemini call exceeded its {self.timeout:.0f}s deadline")
+                        raise ModelError(f"Gemini call failed after {attempt + 1} attempts: {e}") from e
+                    # Full jitter, so callers that failed together don't retry together
+                    delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                    if time.monotonic() + delay >= deadline:
+                        raise ModelTimeout(f"Gemini call exceeded its {self.timeout:.0f}s deadline") from e
+                    attempt += 1
+                    self.retried += 1
+                    print(f"Gemini call failed ({e!r}), retry {attempt} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "breaker": self.breaker_state,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+        }
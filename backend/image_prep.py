@@ -0,0 +1,108 @@
+"""
+Ward image preparation before a model call.
+
+Nurse stations upload full-resolution phone photos (12 MP and more, with EXIF)
+and the model needs far less to tell an empty bed from an occupied one.
+ImagePreparer turns the uploaded bytes into a small upload:
+- JPEGs are decoded in draft mode, scaled down by the decoder itself, so a
+  12 MP photo is never decoded at full size;
+- the EXIF orientation is applied, so portrait photos reach the model upright,
+  and the metadata is dropped;
+- the picture is downsized to max_edge pixels on its longest side;
+- it is re-encoded as JPEG or WebP, lowering the quality (then the size)
+  until it fits in max_bytes.
+The work is CPU-bound, so it runs on a small thread pool of its own instead of
+the event loop (Pillow releases the GIL while decoding and encoding).
+"""
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+QUALITIES = (85, 75, 65, 55, 45)
+
+def prepare_image(data, max_edge=1536, max_bytes=512 * 1024, fmt="jpeg", crop=None):
+    """
+    Return (bytes, mime type, info) of the downsized, upright, re-encoded
+    image; crop is an optional (x0, y0, x1, y1) box in fractions of the upright picture
+    """
+    pil_format, mime_type = FORMATS[fmt]
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+    # JPEG only: decode at the smallest 1/2, 1/4 or 1/8 scale still at least max_edge
+    image.draft("RGB", (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if crop:
+        image = image.crop((round(crop[0] * image.width), round(crop[1] * image.height),
+                            round(crop[2] * image.width), round(crop[3] * image.height)))
+        # A crop keeps the scale the whole picture would be sent at
+        max_edge = max(256, round(max_edge * max(crop[2] - crop[0], crop[3] - crop[1])))
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    while True:
+        for quality in QUALITIES:
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, quality=quality)
+            if buffer.tell() <= max_bytes:
+                break
+        if buffer.tell() <= max_bytes or max(image.size) <= 256:
+            break
+        image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.LANCZOS)
+    return buffer.getvalue(), mime_type, {
+        "original_size": original_size,
+        "size": image.size,
+        "quality": quality,
+        "bytes_in": len(data),
+        "bytes_out": buffer.tell(),
+    }
+
+class ImagePreparer:
+    def __init__(self, max_edge=1536, max_bytes=512 * 1024, fmt="jpeg", workers=2):
+        """
+        max_edge: longest side in pixels sent to the model
+        max_bytes: size the re-encoded image should fit in
+        fmt: "jpeg" or "webp"
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Image format must be one of {', '.join(FORMATS)}")
+        self.max_edge = max_edge
+        self.max_bytes = max_bytes
+        self.fmt = fmt
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-prep")
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    async def prepare(self, data, crop=None):
+        """prepare_image on the pool; returns (bytes, mime type, info)"""
+        started = time.monotonic()
+        prepared, mime_type, info = await asyncio.get_running_loop().run_in_executor(
+            self._executor, prepare_image, data, self.max_edge, self.max_bytes, self.fmt, crop
+        )
+        self.images += 1
+        self.bytes_in += info["bytes_in"]
+        self.bytes_out += info["bytes_out"]
+        self.seconds += time.monotonic() - started
+        return prepared, mime_type, info
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "max_edge": self.max_edge,
+            "max_bytes": self.max_bytes,
+            "format": self.fmt,
+            "workers": self.workers,
+            "images": self.images,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "avg_ms": round(self.seconds / self.images * 1000, 1) if self.images else 0.0,
+        }
@@ -0,0 +1,570 @@
+"""
+Background video-analysis jobs.
+
+Videos are analysed in a pool of worker processes so the API event loop stays
+responsive. Each worker holds its own PoseLandmarker and a DetectorRegistry
+that gives every job its own ActivityDetector state.
+Alerts and progress are relayed back to the API process through a queue.
+With max_workers=0 jobs run on threads in the API process instead.
+Long recordings are split into segments that run on several workers at once
+(see segments.py) and are merged back into one result.
+"""
+import asyncio
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import CancelledError as FutureCancelledError
+from datetime import datetime
+
+import cv2
+
+from detector import ActivityDetector, analyze_video, create_pose_landmarker
+from motion import MotionGate
+from roi import PoseROI
+from offline import LandmarkRecorder, analyze_video_offline
+from pool import LandmarkerPool
+from registry import DetectorRegistry
+from sampling import FrameSampler
+from segments import find_bed_region, merge_segment_results, plan_segments, warmup_samples
+
+# Per-worker-process state, set up by _init_worker
+_worker_registry = None
+_worker_events = None
+_worker_cancelled = None
+_worker_cache = None
+_worker_tracking_pool = None
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job was cancelled mid-run"""
+
+def _init_worker(events, cancelled, pose_detector=None, pose_lock=None, landmark_cache=None,
+                 tracking_pool=None):
+    """
+    Give each worker process its own landmarker and detector registry.
+    tracking_pool is a LandmarkerPool of VIDEO landmarkers for tracking jobs,
+    or its size to create and warm one up pinned to this process.
+    """
+    global _worker_registry, _worker_events, _worker_cancelled, _worker_cache, _worker_tracking_pool
+    if pose_detector is None:
+        try:
+            pose_detector = create_pose_landmarker()
+        except Exception as e:
+            print(f"Warning: MediaPipe pose detection not available in worker: {e}")
+    if isinstance(tracking_pool, int):
+        try:
+            tracking_pool = LandmarkerPool(tracking_pool, "VIDEO", name="tracking").start() if tracking_pool else None
+        except Exception as e:
+            print(f"Warning: tracking landmarkers not available in worker: {e}")
+            tracking_pool = None
+    _worker_registry = DetectorRegistry(pose_detector, pose_lock=pose_lock)
+    _worker_events = events
+    _worker_cancelled = cancelled
+    _worker_cache = landmark_cache
+    _worker_tracking_pool = tracking_pool
+
+def _tracking_landmarker(detector):
+    """
+    Give a job's detector its own VIDEO-mode landmarker, so poses are tracked
+    between frames. Returns it (to close after the job), or None to stay in IMAGE mode.
+    """
+    if detector.pose_detector is None:
+        return None
+    try:
+        if _worker_tracking_pool is not None:
+            # A warm landmarker; closing the lease returns it to the pool
+            landmarker = _worker_tracking_pool.acquire()
+        else:
+            landmarker = create_pose_landmarker(running_mode="VIDEO")
+    except Exception as e:
+        print(f"Warning: tracking landmarker not available, using IMAGE mode: {e}")
+        return None
+    detector.use_tracking_landmarker(landmarker)
+    return landmarker
+
+def _frame_stages(detector, options):
+    """
+    Pop the motion_gate and roi keyword arguments from options and give the
+    detector those stages; returns the popped settings (they change the landmarks)
+    """
+    stages = {name: options.pop(name, None) for name in ("motion_gate", "roi")}
+    if stages["motion_gate"]:
+        detector.motion_gate = MotionGate(**stages["motion_gate"])
+    if stages["roi"]:
+        detector.roi = PoseROI(**stages["roi"])
+    return stages
+
+def _run_job(job_id, file_path, options, segment=None):
+    """Worker entry point: analyse one video (or one segment) and return the result dict"""
+    _worker_events.put(("started", job_id, None))
+
+    # Each job or segment is its own stream, so they never share history
+    stream_id = job_id if segment is None else f"{job_id}:{segment}"
+    # Pinned: a long job must not lose its detector to idle or LRU eviction
+    detector = _worker_registry.get(stream_id, pin=True)
+    options = dict(options)
+    analyze = analyze_video_offline if options.pop("offline", False) else analyze_video
+    tracking = options.pop("tracking", False)
+    stages = _frame_stages(detector, options)
+
+    # Cached landmarks skip decoding and inference; otherwise record them for next time
+    cache_key = recorder = None
+    if _worker_cache is not None and detector.pose_detector is not None:
+        cache_key = _worker_cache.key(file_path, dict(options, tracking=tracking, **stages))
+        series = _worker_cache.get(cache_key)
+        _worker_events.put(("cache", job_id, {"hits": int(series is not None), "misses": int(series is None)}))
+        if series is not None:
+            analyze = analyze_video_offline
+            options["landmarks"] = series
+        else:
+            recorder = LandmarkRecorder()
+            options["recorder"] = recorder
+    landmarker = _tracking_landmarker(detector) if tracking and "landmarks" not in options else None
+    try:
+        result = analyze(
+            file_path,
+            detector,
+            on_alert=lambda alert: _worker_events.put(("alert", job_id, alert)),
+            on_progress=lambda done, total, stats: _worker_events.put(
+                ("progress", job_id, (segment, done, total, stats))
+            ),
+            should_stop=lambda: job_id in _worker_cancelled,
+            **options,
+        )
+        sample_rate = detector.sample_rate
+    finally:
+        _worker_registry.evict(stream_id)
+        if landmarker is not None:
+            landmarker.close()
+
+    if job_id in _worker_cancelled:
+        raise JobCancelled(job_id)
+    if recorder is not None:
+        series = recorder.series(sample_rate, result["total_frames"], result["processed_frames"], result["sampling"])
+        evicted = _worker_cache.put(cache_key, series)
+        _worker_events.put(("cache", job_id, {"stores": 1, "evictions": evicted}))
+    return result
+
+def _run_bed_scan(job_id, file_path, options, end_frame):
+    """Worker entry point: find the bed region a sequential run would calibrate"""
+    stream_id = f"{job_id}:scan"
+    detector = _worker_registry.get(stream_id, pin=True)
+    _frame_stages(detector, dict(options))
+    landmarker = _tracking_landmarker(detector) if options.get("tracking") else None
+    try:
+        return find_bed_region(
+            file_path,
+            detector,
+            sample_rate=options.get("sample_rate"),
+            stride=options.get("stride", 5),
+            end_frame=end_frame,
+        )
+    finally:
+        _worker_registry.evict(stream_id)
+        if landmarker is not None:
+            landmarker.close()
+
+def _probe_video(file_path, options):
+    """Return (total_frames, fps, sample step) without decoding any frames"""
+    cap = cv2.VideoCapture(str(file_path))
+    try:
+        if not cap.isOpened():
+            return 0, 0.0, 1.0
+        sampler = FrameSampler(cap, sample_rate=options.get("sample_rate"), stride=options.get("stride", 5))
+        return sampler.frame_count, sampler.fps, sampler.step
+    finally:
+        cap.release()
+
+class VideoJobManager:
+    """Submits video analyses to a process pool and tracks their status"""
+
+    def __init__(self, max_workers=None, threads=2, analysis_options=None, segment_seconds=600,
+                 landmark_cache=None, job_ttl=3600.0, max_finished_jobs=200):
+        """
+        job_ttl: seconds a finished job (and its result) is kept (None = no limit)
+        max_finished_jobs: finished jobs kept at most; the oldest go first
+        """
+        self.max_workers = multiprocessing.cpu_count() if max_workers is None else max_workers
+        self.threads = threads
+        # Recordings longer than two segments are split across worker processes
+        self.segment_seconds = segment_seconds
+        # Default keyword arguments for detector.analyze_video (offline=True
+        # runs offline.analyze_video_offline instead; tracking=True gives each
+        # job its own VIDEO-mode landmarker; motion_gate holds MotionGate
+        # keyword arguments to skip inference on still frames, roi PoseROI
+        # keyword arguments to crop frames around the person)
+        self.analysis_options = analysis_options or {}
+        # Shared on-disk LandmarkCache (None disables); workers report their hits and misses
+        self.landmark_cache = landmark_cache
+        self.cache_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # job_id -> callbacks on_event(kind, job, payload) for "started", "progress", "alert" and "finished"
+        self._subscribers = {}
+        self.jobs = {}
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self._finished = OrderedDict()  # job_id -> time.monotonic() it finished, oldest first
+        self._prune_lock = threading.Lock()
+        self.evicted = 0
+        self._executor = None
+        self._mp_manager = None
+        self._events = None
+        self._cancelled = None
+        self._loop = None
+        self._on_alert = None
+        self._pump_thread = None
+
+    def start(self, loop, on_alert=None, pose_detector=None, tracking_pool=None):
+        """
+        Create the worker pool; on_alert is an async callback run on loop.
+        pose_detector (a landmarker or an IMAGE LandmarkerPool) and
+        tracking_pool (a VIDEO LandmarkerPool) are only used in in-process
+        mode (max_workers=0); worker processes each warm up their own.
+        """
+        if self.max_workers > 0:
+            # Spawn rather than fork: MediaPipe and the event loop own threads
+            ctx = multiprocessing.get_context("spawn")
+            self._mp_manager = ctx.Manager()
+            self._cancelled = self._mp_manager.dict()
+            self._events = ctx.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(self._events, self._cancelled, None, None, self.landmark_cache,
+                          1 if self.analysis_options.get("tracking") else 0),
+            )
+            print(f"Video job pool started with {self.max_workers} worker processes")
+        else:
+            # Jobs share the API's landmarkers: a pool lends them out per frame,
+            # a single landmarker needs its calls serialised
+            self._cancelled = {}
+            self._events = queue.Queue()
+            pose_lock = None if isinstance(pose_detector, LandmarkerPool) else threading.Lock()
+            _init_worker(self._events, self._cancelled, pose_detector, pose_lock, self.landmark_cache, tracking_pool)
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="video-job")
+            print(f"Video jobs running in-process on {self.threads} threads")
+        self._loop = loop
+        self._on_alert = on_alert
+        self._pump_thread = threading.Thread(target=self._pump_events, daemon=True)
+        self._pump_thread.start()
+
+    def shutdown(self):
+        """Cancel queued jobs and stop the worker pool"""
+        if self._executor is None:
+            return
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._events.put(None)
+        self._pump_thread.join(timeout=5)
+        if self._mp_manager is not None:
+            self._mp_manager.shutdown()
+        self._executor = None
+
+    def submit(self, filename, file_path, on_event=None, labels=None, **options):
+        """
+        Queue a video for analysis and return its job record.
+        options override analysis_options for this job; None values are ignored.
+        on_event is subscribed before the job starts (see subscribe).
+        labels (e.g. ward, bed) are added to each of the job's alerts.
+        """
+        if self._executor is None:
+            raise RuntimeError("Video job pool is not running")
+        self._prune()
+
+        job_options = dict(self.analysis_options)
+        job_options.update({key: value for key, value in options.items() if value is not None})
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "filename": filename,
+            "status": "queued",
+            "submitted_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "processed_frames": 0,
+            "total_frames": 0,
+            "alert_count": 0,
+            "pipeline": None,
+            "segments": None,
+            "error": None,
+            "labels": {key: value for key, value in (labels or {}).items() if value is not None},
+        }
+        self.jobs[job_id] = job
+        if on_event is not None:
+            self.subscribe(job_id, on_event)
+
+        if self.max_workers < 2 or not self.segment_seconds:
+            future = self._executor.submit(_run_job, job_id, str(file_path), job_options)
+        else:
+            # Opening the video to plan segments blocks, so it runs in the pool too
+            future = self._submit_planned(job, str(file_path), job_options)
+        job["future"] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job
+
+    def _plan(self, probe, options):
+        """
+        Return the segment plan for a video from its _probe_video result;
+        a single-segment plan means it runs in one pass.
+        """
+        total_frames, fps, step = probe
+        return plan_segments(
+            total_frames,
+            step,
+            segment_frames=int(self.segment_seconds * fps),
+            max_segments=self.max_workers * 4,
+            warmup=warmup_samples(ActivityDetector(sample_rate=fps / step)),
+        )
+
+    def _submit_planned(self, job, file_path, options):
+        """
+        Probe the video in the pool, then run it in one pass or in segments.
+        Returns a Future that resolves to the result.
+        """
+        job_id = job["job_id"]
+        composite = Future()
+        # Mark running so cancel() goes through the worker flag, not Future.cancel
+        composite.set_running_or_notify_cancel()
+
+        def forward(future):
+            if future.cancelled():
+                composite.set_exception(JobCancelled(job_id))
+            elif future.exception() is not None:
+                composite.set_exception(future.exception())
+            else:
+                composite.set_result(future.result())
+
+        def planned(probe):
+            try:
+                plan = self._plan(probe.result(), options)
+                if job_id in self._cancelled:
+                    raise JobCancelled(job_id)
+                if len(plan) > 1:
+                    job["total_frames"] = probe.result()[0]
+                    self._submit_segmented(job, file_path, options, plan, composite)
+                    return
+                future = self._executor.submit(_run_job, job_id, file_path, options)
+            except BaseException as e:
+                composite.set_exception(e)
+                return
+            job["segment_futures"] = [future]
+            future.add_done_callback(forward)
+
+        self._executor.submit(_probe_video, file_path, options).add_done_callback(planned)
+        return composite
+
+    def _submit_segmented(self, job, file_path, options, plan, composite):
+        """
+        Run a bed-region scan, then every segment in parallel; composite (a
+        running Future) resolves to the merged result.
+        """
+        job_id = job["job_id"]
+        job["segments"] = [
+            {"start_frame": seg["start_frame"], "end_frame": seg["end_frame"], "processed_frames": 0}
+            for seg in plan
+        ]
+
+        def start_segments(scan):
+            try:
+                bed_region = scan.result()
+                if job_id in self._cancelled:
+                    raise JobCancelled(job_id)
+                futures = []
+                for index, seg in enumerate(plan):
+                    segment_options = dict(
+                        options,
+                        start_frame=seg["warmup_frame"],
+                        end_frame=seg["end_frame"],
+                        alerts_from_frame=seg["start_frame"],
+                        bed_region=bed_region,
+                    )
+                    futures.append(self._executor.submit(_run_job, job_id, file_path, segment_options, index))
+            except BaseException as e:
+                composite.set_exception(e)
+                return
+            job["segment_futures"] = futures
+            self._gather_segments(job, futures, composite, options.get("episodes"))
+
+        self._executor.submit(_run_bed_scan, job_id, file_path, options, plan[0]["end_frame"]).add_done_callback(
+            start_segments
+        )
+
+    def _gather_segments(self, job, futures, composite, episodes=None):
+        """Resolve composite once every segment future is done; episodes as for merge_segment_results"""
+        job_id = job["job_id"]
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def segment_done(future):
+            if not future.cancelled() and future.exception() is not None:
+                # One failed segment fails the job; don't start the rest
+                for other in futures:
+                    other.cancel()
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+
+            if job_id in self._cancelled or any(f.cancelled() for f in futures):
+                errors = [f.exception() for f in futures if not f.cancelled() and f.exception() is not None]
+                failures = [e for e in errors if not isinstance(e, JobCancelled)]
+                composite.set_exception(failures[0] if failures else JobCancelled(job_id))
+                return
+            for f in futures:
+                if f.exception() is not None:
+                    composite.set_exception(f.exception())
+                    return
+            composite.set_result(merge_segment_results([f.result() for f in futures], job["total_frames"], episodes))
+
+        for future in futures:
+            future.add_done_callback(segment_done)
+
+    def cancel(self, job_id):
+        """Cancel a job; returns False if it is unknown or already finished"""
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] in ("completed", "failed", "cancelled"):
+            return False
+
+        if job["future"].cancel():
+            # Never started; the done callback marks it cancelled
+            return True
+        # Running: the worker polls this flag and stops at its next check
+        self._cancelled[job_id] = True
+        for future in job.get("segment_futures", ()):
+            future.cancel()
+        job["status"] = "cancelling"
+        return True
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def subscribe(self, job_id, on_event):
+        """
+        Call on_event(kind, job, payload) from the event thread as the job
+        starts, progresses, raises an alert and finishes
+        """
+        self._subscribers.setdefault(job_id, []).append(on_event)
+
+    def unsubscribe(self, job_id, on_event):
+        callbacks = self._subscribers.get(job_id, [])
+        if on_event in callbacks:
+            callbacks.remove(on_event)
+        if not callbacks:
+            self._subscribers.pop(job_id, None)
+
+    def _notify(self, job_id, kind, job, payload=None):
+        for on_event in list(self._subscribers.get(job_id, ())):
+            try:
+                on_event(kind, job, payload)
+            except Exception as e:
+                print(f"Video job {job_id}: event subscriber failed: {e}")
+
+    def describe(self, job):
+        """Public view of a job record (without the future or result)"""
+        return {
+            key: value for key, value in job.items()
+            if key not in ("future", "segment_futures", "result")
+        }
+
+    def stats(self):
+        self._prune()
+        counts = {}
+        for job in list(self.jobs.values()):
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        stats = {"workers": self.max_workers, "jobs": counts, "evicted_jobs": self.evicted}
+        if self.max_workers == 0 and _worker_registry is not None:
+            stats["detectors"] = _worker_registry.stats()
+        if self.landmark_cache is not None:
+            stats["landmark_cache"] = {**self.landmark_cache.usage(), **self.cache_counters}
+        return stats
+
+    def _finish(self, job_id, future):
+        self._settle(job_id, future)
+        self._notify(job_id, "finished", self.jobs[job_id])
+        with self._prune_lock:
+            self._finished[job_id] = time.monotonic()
+        self._prune()
+
+    def _prune(self):
+        """Forget finished jobs past job_ttl, and the oldest beyond max_finished_jobs"""
+        now = time.monotonic()
+        with self._prune_lock:
+            while self._finished:
+                job_id, finished = next(iter(self._finished.items()))
+                expired = self.job_ttl is not None and now - finished > self.job_ttl
+                if not expired and len(self._finished) <= self.max_finished_jobs:
+                    break
+                del self._finished[job_id]
+                self.jobs.pop(job_id, None)
+                self._subscribers.pop(job_id, None)
+                self.evicted += 1
+
+    def _settle(self, job_id, future):
+        job = self.jobs[job_id]
+        job["finished_at"] = datetime.now().isoformat()
+        self._cancelled.pop(job_id, None)
+
+        try:
+            result = future.result()
+        except (FutureCancelledError, JobCancelled):
+            job["status"] = "cancelled"
+            return
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"Video job {job_id} failed: {e}")
+            return
+
+        for alert in result["alerts"]:
+            alert.update(job["labels"])
+        job["result"] = result
+        job["status"] = "completed"
+        job["processed_frames"] = result["processed_frames"]
+        job["total_frames"] = result["total_frames"]
+        job["pipeline"] = result["pipeline"]
+
+    def _pump_events(self):
+        """Relay worker progress and alerts into the API process"""
+        while True:
+            event = self._events.get()
+            if event is None:
+                break
+            kind, job_id, payload = event
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+
+            if kind == "started":
+                if job["status"] == "queued":
+                    job["status"] = "running"
+                    job["started_at"] = datetime.now().isoformat()
+                    self._notify(job_id, "started", job)
+            elif kind == "progress":
+                # Progress can arrive after the final result; don't rewind it
+                if job["finished_at"] is not None:
+                    continue
+                segment, done, total, stats = payload
+                if segment is None:
+                    job["processed_frames"], job["total_frames"], job["pipeline"] = done, total, stats
+                else:
+                    progress = job["segments"][segment]
+                    progress["processed_frames"] = max(0, done - progress["start_frame"])
+                    progress["pipeline"] = stats
+                    job["processed_frames"] = sum(seg["processed_frames"] for seg in job["segments"])
+                self._notify(job_id, "progress", job)
+            elif kind == "cache":
+                for counter, value in payload.items():
+                    self.cache_counters[counter] += value
+            elif kind == "alert":
+                job["alert_count"] += 1
+                payload["job_id"] = job_id
+                payload["video"] = job["filename"]
+                payload.update(job["labels"])
+                self._notify(job_id, "alert", job, dict(payload))
+                if self._on_alert is not None:
+                    asyncio.run_coroutine_threadsafe(self._on_alert(payload), self._loop)
@@ -0,0 +1,146 @@
+"""
+Vectorized pose kernels used by ActivityDetector.
+
+A pose is a (33, 4) float32 array holding (x, y, z, visibility) for each
+MediaPipe landmark. Every kernel also accepts a batch with extra leading
+dimensions, e.g. (streams, 33, 4) for all cameras of a ward or (T, 33, 4) for
+a whole recording, and returns arrays over those leading dimensions.
+"""
+import numpy as np
+
+NUM_LANDMARKS = 33
+
+# Pose landmark indices (same as old MediaPipe)
+class PoseLandmark:
+    NOSE = 0
+    LEFT_SHOULDER = 11
+    RIGHT_SHOULDER = 12
+    LEFT_HIP = 23
+    RIGHT_HIP = 24
+
+X, Y, Z, VISIBILITY = range(4)
+
+CENTER_POINTS = [PoseLandmark.NOSE, PoseLandmark.LEFT_SHOULDER, PoseLandmark.RIGHT_SHOULDER,
+                 PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP]
+SEIZURE_POINTS = [PoseLandmark.LEFT_SHOULDER, PoseLandmark.RIGHT_SHOULDER,
+                  PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP]
+
+POSTURE_TYPES = ("Normal", "Upside Down", "Extreme Lean", "Twisted Body", "Curled Up")
+
+def landmarks_to_array(landmarks, out=None):
+    """Convert one MediaPipe landmark list to a (33, 4) float32 pose array"""
+    if out is None:
+        out = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+    for i, landmark in enumerate(landmarks):
+        out[i] = (landmark.x, landmark.y, landmark.z, landmark.visibility or 0.0)
+    return out
+
+def _midpoint(poses, left, right, axis):
+    return (poses[..., left, axis] + poses[..., right, axis]) / 2
+
+def hip_center(poses):
+    """(..., 2) midpoint of the hips"""
+    return (poses[..., PoseLandmark.LEFT_HIP, :2] + poses[..., PoseLandmark.RIGHT_HIP, :2]) / 2
+
+def shoulder_level(poses):
+    """(...) mean shoulder height, which rises and falls with breathing"""
+    return _midpoint(poses, PoseLandmark.LEFT_SHOULDER, PoseLandmark.RIGHT_SHOULDER, Y)
+
+def fall_kernel(poses, fall_threshold=0.3):
+    """
+    Fall: nose close to hip level (person horizontal) and low in frame.
+    Returns (is_fall, hip_y).
+    """
+    hip_y = _midpoint(poses, PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP, Y)
+    vertical_distance = np.abs(poses[..., PoseLandmark.NOSE, Y] - hip_y)
+    is_fall = (hip_y > 0.7) & (vertical_distance < fall_threshold)
+    return is_fall, hip_y
+
+def body_center(poses):
+    """(..., 2) centre of mass approximated by nose, shoulders and hips"""
+    return poses[..., CENTER_POINTS, :2].mean(axis=-2)
+
+def rapid_movement_kernel(centers, prev_centers, threshold=0.08):
+    """Speed between consecutive body centres; returns (is_rapid, speed)"""
+    delta = centers - prev_centers
+    speed = np.hypot(delta[..., 0], delta[..., 1])
+    return speed > threshold, speed
+
+def seizure_points(poses):
+    """(..., 4, 2) shoulder and hip positions tracked for seizure detection"""
+    return poses[..., SEIZURE_POINTS, :2]
+
+def displacement(current, previous, scratch=None):
+    """Frobenius norm of the change in tracked points between two frames"""
+    diff = np.subtract(current, previous, out=scratch)
+    return np.sqrt(np.square(diff, out=diff).sum(axis=(-2, -1)))
+
+def seizure_kernel(history, variance_threshold=0.01, mean_threshold=0.05):
+    """
+    Seizure over a (..., T, 4, 2) history of seizure_points: high variance
+    with consistently high frame-to-frame movement.
+    Returns (is_seizure, movement_variance, movement_mean).
+    """
+    movements = displacement(history[..., 1:, :, :], history[..., :-1, :, :])
+    movement_variance = movements.var(axis=-1)
+    movement_mean = movements.mean(axis=-1)
+    return seizure_decision(movement_variance, movement_mean, variance_threshold, mean_threshold), \
+        movement_variance, movement_mean
+
+def seizure_decision(movement_variance, movement_mean, variance_threshold=0.01, mean_threshold=0.05):
+    return (movement_variance > variance_threshold) & (movement_mean > mean_threshold)
+
+def bed_bounds_around(hips, half_size=0.2):
+    """(..., 4) bed bounds (x_min, x_max, y_min, y_max) centred on the hips"""
+    return np.stack([
+        hips[..., 0] - half_size, hips[..., 0] + half_size,
+        hips[..., 1] - half_size, hips[..., 1] + half_size,
+    ], axis=-1)
+
+def bed_exit_kernel(hips, bounds):
+    """
+    Hips outside the (..., 4) bed bounds; returns (is_outside, distance
+    from the bed centre).
+    """
+    hip_x, hip_y = hips[..., 0], hips[..., 1]
+    is_outside = (
+        (hip_x < bounds[..., 0]) | (hip_x > bounds[..., 1]) |
+        (hip_y < bounds[..., 2]) | (hip_y > bounds[..., 3])
+    )
+    bed_center_x = (bounds[..., 0] + bounds[..., 1]) / 2
+    bed_center_y = (bounds[..., 2] + bounds[..., 3]) / 2
+    distance = np.sqrt((hip_x - bed_center_x) ** 2 + (hip_y - bed_center_y) ** 2)
+    return is_outside, distance
+
+def posture_kernel(poses):
+    """
+    Abnormal postures, later checks overriding earlier ones as before.
+    Returns (is_abnormal, confidence, posture code into POSTURE_TYPES).
+    """
+    nose_y = poses[..., PoseLandmark.NOSE, Y]
+    left_shoulder = poses[..., PoseLandmark.LEFT_SHOULDER, :]
+    right_shoulder = poses[..., PoseLandmark.RIGHT_SHOULDER, :]
+    hip_y = _midpoint(poses, PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP, Y)
+
+    code = np.zeros(nose_y.shape, dtype=np.int8)
+    confidence = np.zeros(nose_y.shape, dtype=np.float64)
+
+    def apply(condition, posture, value):
+        code[condition] = posture
+        confidence[condition] = value[condition] if np.ndim(value) else value
+
+    # 1. Upside down (head below hips)
+    apply(nose_y > hip_y + 0.1, 1, np.abs(nose_y - hip_y))
+    # 2. Extreme lean (shoulders very tilted)
+    shoulder_tilt = np.abs(left_shoulder[..., Y] - right_shoulder[..., Y])
+    apply(shoulder_tilt > 0.15, 2, shoulder_tilt)
+    # 3. Twisted body (shoulders and hips misaligned)
+    shoulder_center_x = (left_shoulder[..., X] + right_shoulder[..., X]) / 2
+    hip_center_x = _midpoint(poses, PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP, X)
+    body_twist = np.abs(shoulder_center_x - hip_center_x)
+    apply(body_twist > 0.2, 3, body_twist)
+    # 4. Curled up (very compressed vertically)
+    body_height = np.abs(nose_y - hip_y)
+    apply(body_height < 0.15, 4, 1.0 - body_height)
+
+    return code > 0, confidence, code
@@ -0,0 +1,153 @@
+"""
+On-disk cache of extracted landmark series (see offline.py).
+
+Entries are keyed by a SHA-256 of the video content plus the pose model, its
+running mode, the motion gate, the crop, the preset bed region (it seeds the
+crop) and the sampling settings, so re-analysing an unchanged upload (e.g. after a
+threshold change) skips decoding and inference entirely. Each entry is a
+directory holding the series as .npy arrays, which are loaded memory-mapped,
+and a small JSON header. The cache is bounded in bytes and evicts the least
+recently used entries. Worker processes share it through the filesystem:
+entries are written to a temporary directory and renamed into place.
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from detector import MODEL_URL
+
+CACHE_VERSION = 3
+ARRAYS = ("poses", "frames", "timestamps", "held")
+
+HASH_SUFFIX = ".sha256"
+
+def write_hash_sidecar(file_path, digest):
+    """Record a file's SHA-256 next to it (sha256sum format), e.g. as it is uploaded"""
+    with open(f"{file_path}{HASH_SUFFIX}", "w") as f:
+        f.write(f"{digest}  {os.path.basename(file_path)}\n")
+
+def content_hash(file_path, chunk_size=1 << 20):
+    """SHA-256 of a file's content, from its sidecar if one was written after the file"""
+    sidecar = f"{file_path}{HASH_SUFFIX}"
+    try:
+        if os.stat(sidecar).st_mtime_ns >= os.stat(file_path).st_mtime_ns:
+            with open(sidecar) as f:
+                return f.read().split()[0]
+    except (OSError, IndexError):
+        pass
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class LandmarkCache:
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, model=MODEL_URL):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.model = model
+        # (path, size, mtime) -> content hash, so segments of one upload hash it once
+        self._hashes = {}
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, file_path, options):
+        """Cache key for a video and the analyze_video sampling options"""
+        stat = os.stat(file_path)
+        file_id = (str(file_path), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self._hashes:
+            self._hashes[file_id] = content_hash(file_path)
+        sample_rate = options.get("sample_rate")
+        sampling = f"fps={float(sample_rate)!r}" if sample_rate else f"stride={options.get('stride', 5)}"
+        settings = "|".join([
+            f"v{CACHE_VERSION}", self._hashes[file_id], self.model,
+            "VIDEO" if options.get("tracking") else "IMAGE", sampling,
+            f"frames={options.get('start_frame', 0)}-{options.get('end_frame')}",
+            f"gate={json.dumps(options.get('motion_gate') or None, sort_keys=True)}",
+            f"roi={json.dumps(options.get('roi') or None, sort_keys=True)}",
+            f"bed={json.dumps(options.get('bed_region'), sort_keys=True)}",
+        ])
+        return hashlib.sha256(settings.encode()).hexdigest()
+
+    def get(self, key):
+        """The cached landmark series (arrays memory-mapped), or None"""
+        entry = self.directory / key
+        try:
+            with open(entry / "header.json") as f:
+                series = json.load(f)
+            for name in ARRAYS:
+                series[name] = np.load(entry / f"{name}.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        # Directory mtime is the LRU clock
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return series
+
+    def put(self, key, series):
+        """Store a landmark series; returns the number of entries evicted to make room"""
+        entry = self.directory / key
+        if entry.exists():
+            return 0
+        tmp = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        tmp.mkdir()
+        try:
+            for name in ARRAYS:
+                np.save(tmp / f"{name}.npy", np.ascontiguousarray(series[name]))
+            header = {name: value for name, value in series.items() if name not in ARRAYS}
+            with open(tmp / "header.json", "w") as f:
+                json.dump(header, f)
+            os.rename(tmp, entry)
+        except OSError:
+            # Another worker stored the same entry first, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+            return 0
+        return self.evict(keep=key)
+
+    def _entries(self):
+        """(mtime, bytes, path) of every complete entry"""
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue  # evicted by another worker meanwhile
+        return entries
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        entries = sorted(self._entries(), key=lambda entry: entry[0])
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            print(f"Landmark cache evicted {evicted} entries ({total / 2 ** 20:.1f} MB left)")
+        return evicted
+
+    def clear(self):
+        for _, _, entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def usage(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
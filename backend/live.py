@@ -0,0 +1,319 @@
+"""
+Live camera ingest.
+
+Each live stream has its own PoseLandmarker in VIDEO running mode, so the pose
+is tracked between frames instead of detected from scratch on every frame,
+and its own ActivityDetector. With a LandmarkerPool the landmarkers are warm
+ones leased per stream (VIDEO pool), or checked out per frame from a shared
+IMAGE pool when there are more beds than landmarkers. Frames arrive from a WebSocket client or from a
+capture thread reading an RTSP URL or a video file (replayed in real time).
+
+Only the newest frame is kept: a frame that is still waiting when a newer one
+arrives is stale and is dropped, undecoded. Inference is paced to
+analysis_fps so the detector histories stay evenly sampled. Every alert
+carries its glass-to-alert latency (capture time to hand-off for delivery),
+and each stream reports latency percentiles.
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from buffers import RingBuffer
+from detector import ActivityDetector, build_alerts, create_pose_landmarker
+from episodes import EpisodeEngine
+from motion import MotionGate
+from roi import PoseROI
+from sampling import DEFAULT_FPS
+
+class LiveStream:
+    def __init__(self, stream_id, pose_detector, analysis_fps=6.0, on_alert=None, latency_window=256,
+                 motion_gate=None, roi=None, tracking=True, labels=None, episodes=None):
+        """
+        pose_detector: a VIDEO-mode PoseLandmarker owned by this stream, or
+        a shared IMAGE-mode one (e.g. a LandmarkerPool) with tracking=False
+        on_alert(alert): called from the inference thread for each alert
+        labels: added to each alert, e.g. the ward and bed the camera watches
+        episodes: EpisodeEngine keyword arguments, to send episode events instead of every detection
+        motion_gate: MotionGate keyword arguments, to skip inference on still frames
+        roi: PoseROI keyword arguments, to crop frames around the person
+        """
+        self.stream_id = stream_id
+        self.labels = {key: value for key, value in (labels or {}).items() if value is not None}
+        self.pose_detector = pose_detector
+        gate = MotionGate(sample_rate=analysis_fps, **motion_gate) if motion_gate else None
+        self.tracking = tracking
+        self.detector = ActivityDetector(pose_detector, sample_rate=analysis_fps, tracking=tracking, motion_gate=gate,
+                                         roi=PoseROI(**roi) if roi else None)
+        self.episodes = EpisodeEngine(**episodes) if episodes else None
+        self.interval = 1.0 / analysis_fps
+        self.on_alert = on_alert
+        self.started_at = time.time()
+        self.source = None
+        self._cond = threading.Condition()
+        self._pending = None  # (frame or encoded bytes, capture time, frame number)
+        self._stopping = False
+        self._next_due = 0.0
+        self._last_timestamp_ms = -1
+        self._latencies = RingBuffer(latency_window)
+        self.received = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.analyzed = 0
+        self.alerts = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name=f"live-{stream_id}", daemon=True)
+        self._thread.start()
+
+    def wants_frame(self):
+        """True once the next analysis is due (capture threads decode only then)"""
+        return time.monotonic() >= self._next_due
+
+    def push(self, frame, captured_at=None):
+        """
+        Offer a BGR frame or an encoded image (bytes); captured_at is the
+        capture time in epoch seconds (default: now). Replaces a waiting frame.
+        """
+        captured_at = time.time() if captured_at is None else captured_at
+        with self._cond:
+            self.received += 1
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (frame, captured_at, self.received)
+            self._cond.notify()
+
+    def skip(self):
+        """Count a frame the capture thread did not decode because none was due"""
+        with self._cond:
+            self.received += 1
+            self.skipped += 1
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        if self.episodes is not None:
+            # Episodes still open end with the stream
+            for event in self.episodes.flush():
+                self._deliver(event)
+        if self.tracking:
+            # This stream's own landmarker (or pool lease)
+            self.pose_detector.close()
+
+    def _take(self):
+        """Wait for the next analysis slot, then return the newest frame (None when stopping)"""
+        with self._cond:
+            delay = self._next_due - time.monotonic()
+            if delay > 0:
+                # Frames arriving meanwhile replace each other
+                self._cond.wait_for(lambda: self._stopping, timeout=delay)
+            self._cond.wait_for(lambda: self._pending is not None or self._stopping)
+            if self._stopping:
+                return None
+            item, self._pending = self._pending, None
+            self._next_due = time.monotonic() + self.interval
+            return item
+
+    def _run(self):
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            frame, captured_at, frame_number = item
+            try:
+                self._analyze(frame, captured_at, frame_number)
+            except Exception as e:
+                self.errors += 1
+                print(f"Live stream {self.stream_id}: analysis failed: {e}")
+
+    def _analyze(self, frame, captured_at, frame_number):
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            frame = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                raise ValueError("could not decode frame")
+
+        # VIDEO mode needs strictly increasing timestamps
+        timestamp_ms = max(int((captured_at - self.started_at) * 1000), self._last_timestamp_ms + 1)
+        self._last_timestamp_ms = timestamp_ms
+        activities, _ = self.detector.analyze_frame(frame, timestamp_ms=timestamp_ms if self.tracking else None)
+        self.analyzed += 1
+
+        alerts = build_alerts(activities, timestamp_ms / 1000, frame_number)
+        if self.episodes is not None:
+            alerts = self.episodes.feed(alerts, timestamp_ms / 1000, frame_number)
+        latency_ms = (time.time() - captured_at) * 1000
+        self._latencies.append(latency_ms)
+        for alert in alerts:
+            alert["latency_ms"] = round(latency_ms, 1)
+            self._deliver(alert)
+
+    def _deliver(self, alert):
+        alert["stream_id"] = self.stream_id
+        alert.update(self.labels)
+        self.alerts += 1
+        if self.on_alert is not None:
+            self.on_alert(alert)
+
+    def stats(self):
+        latencies = self._latencies.view()
+        latency = {}
+        if len(latencies):
+            p50, p95 = np.percentile(latencies, [50, 95])
+            latency = {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "max": round(float(latencies.max()), 1)}
+        return {
+            "stream_id": self.stream_id,
+            "labels": self.labels,
+            "source": self.source,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "received_frames": self.received,
+            "analyzed_frames": self.analyzed,
+            "dropped_frames": self.dropped,
+            "skipped_frames": self.skipped,
+            "alerts": self.alerts,
+            "errors": self.errors,
+            "latency_ms": latency,
+            "motion_gate": self.detector.motion_gate.stats() if self.detector.motion_gate else None,
+            "roi": self.detector.roi.stats() if self.detector.roi else None,
+            "episodes": self.episodes.stats() if self.episodes else None,
+        }
+
+class LiveIngestManager:
+    """Owns the live streams and relays their alerts to the API event loop"""
+
+    def __init__(self, analysis_fps=6.0, max_streams=8, pose_factory=None, motion_gate=None, roi=None,
+                 pool=None, episodes=None):
+        """
+        pool: a LandmarkerPool to take landmarkers from instead of pose_factory:
+        VIDEO pools are leased per stream, IMAGE pools are shared per frame
+        episodes: EpisodeEngine keyword arguments for every stream
+        """
+        self.analysis_fps = analysis_fps
+        self.max_streams = max_streams
+        self.motion_gate = motion_gate
+        self.roi = roi
+        self.episodes = episodes
+        self.pose_factory = pose_factory or (lambda: create_pose_landmarker(running_mode="VIDEO"))
+        self.pool = pool
+        self.streams = {}
+        self._captures = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._on_alert = None
+
+    def start(self, loop, on_alert=None):
+        """on_alert is an async callback run on loop"""
+        self._loop = loop
+        self._on_alert = on_alert
+
+    def _deliver(self, alert):
+        if self._on_alert is not None and self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._on_alert(alert), self._loop)
+
+    def open(self, stream_id, labels=None):
+        """
+        Start a stream fed by push(); labels are added to its alerts. Raises KeyError if stream_id is taken,
+        RuntimeError if the stream limit is reached or no landmarker can be created.
+        """
+        with self._lock:
+            if stream_id in self.streams:
+                raise KeyError(f"Live stream {stream_id} already exists")
+            if len(self.streams) >= self.max_streams:
+                raise RuntimeError(f"Live stream limit reached ({self.max_streams})")
+            tracking = self.pool is None or self.pool.running_mode == "VIDEO"
+            try:
+                if self.pool is None:
+                    pose_detector = self.pose_factory()
+                elif tracking:
+                    pose_detector = self.pool.acquire(timeout=0)
+                else:
+                    pose_detector = self.pool
+            except Exception as e:
+                raise RuntimeError(f"Pose detection not available: {e}")
+            stream = LiveStream(stream_id, pose_detector, self.analysis_fps, self._deliver,
+                                motion_gate=self.motion_gate, roi=self.roi, tracking=tracking, labels=labels,
+                                episodes=self.episodes)
+            self.streams[stream_id] = stream
+        print(f"Live stream {stream_id} opened")
+        return stream
+
+    def open_capture(self, stream_id, source, labels=None):
+        """Start a stream that reads an RTSP/HTTP URL or a video file (replayed in real time)"""
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise IOError(f"Failed to open source {source}")
+        try:
+            stream = self.open(stream_id, labels)
+        except Exception:
+            cap.release()
+            raise
+        stream.source = source
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._read_capture, args=(stream, cap, os.path.isfile(source), stop),
+            name=f"live-capture-{stream_id}", daemon=True,
+        )
+        self._captures[stream_id] = (thread, stop)
+        thread.start()
+        return stream
+
+    def _read_capture(self, stream, cap, is_file, stop):
+        """Grab every frame to stay current, but decode only when an analysis is due"""
+        interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS)
+        next_frame = time.monotonic()
+        try:
+            while not stop.is_set():
+                if is_file:
+                    # Replay files at their own frame rate, like a camera
+                    delay = next_frame - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_frame += interval
+                if not cap.grab():
+                    print(f"Live stream {stream.stream_id}: source ended")
+                    break
+                captured_at = time.time()
+                if not stream.wants_frame():
+                    stream.skip()
+                    continue
+                ok, frame = cap.retrieve()
+                if ok:
+                    stream.push(frame, captured_at)
+        finally:
+            cap.release()
+
+    def get(self, stream_id):
+        return self.streams.get(stream_id)
+
+    def close(self, stream_id):
+        """Stop a stream; returns False if it does not exist"""
+        with self._lock:
+            stream = self.streams.pop(stream_id, None)
+        if stream is None:
+            return False
+        capture = self._captures.pop(stream_id, None)
+        if capture is not None:
+            thread, stop = capture
+            stop.set()
+            thread.join(timeout=5)
+        stream.stop()
+        print(f"Live stream {stream_id} closed: {stream.stats()}")
+        return True
+
+    def shutdown(self):
+        for stream_id in list(self.streams):
+            self.close(stream_id)
+
+    def stats(self):
+        return {
+            "streams": len(self.streams),
+            "max_streams": self.max_streams,
+            "analysis_fps": self.analysis_fps,
+            "motion_gate": self.motion_gate,
+            "roi": self.roi,
+            "episodes": self.episodes,
+        }
@@ -1,22 +1,29 @@
-from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, Form, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import cv2
-import mediapipe as mp
-import numpy as np
+from fastapi.responses import JSONResponse, StreamingResponse
 import json
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+from urllib.parse import urlsplit
 import asyncio
-import aiofiles
 import os
 from pathlib import Path
-from google import genai
-from PIL import Image
-import io
-import base64
 from dotenv import load_dotenv
 
+from alert_hub import AlertHub, parse_filters
+from alert_store import AlertStore, parse_time
+from gemini_client import GeminiClient, ModelError, image_part
+from image_prep import ImagePreparer
+from jobs import VideoJobManager
+from landmark_cache import LandmarkCache
+from live import LiveIngestManager
+from pool import LandmarkerPool
+from result_cache import ResultCache, cache_key, image_hash
+from streaming import MEDIA_TYPES, JobEventStream, encode
+from uploads import OffsetMismatch, UploadError, UploadStore
+from ward_batch import WardSweep, presence_prompt
+from ward_change import ChangeDetector, load_regions
+
 # Load environment variables
 load_dotenv()
 
@@ -31,60 +38,127 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MediaPipe setup - New Tasks API
-try:
-    from mediapipe.tasks import python
-    from mediapipe.tasks.python import vision
-    import mediapipe as mp
-    
-    # Download pose landmarker model if not exists
-    import urllib.request
-    model_path = "pose_landmarker.task"
-    if not os.path.exists(model_path):
-        print("Downloading pose landmarker model...")
-        url = "https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_lite/float16/1/pose_landmarker_lite.task"
-        urllib.request.urlretrieve(url, model_path)
-        print("Model downloaded successfully")
-    
-    # Create pose landmarker
-    base_options = python.BaseOptions(model_asset_path=model_path)
-    options = vision.PoseLandmarkerOptions(
-        base_options=base_options,
-        output_segmentation_masks=False,
-        min_pose_detection_confidence=0.5,
-        min_pose_presence_confidence=0.5,
-        min_tracking_confidence=0.5
-    )
-    pose_detector = vision.PoseLandmarker.create_from_options(options)
-    
-    # Pose landmark indices (same as old MediaPipe)
-    class PoseLandmark:
-        NOSE = 0
-        LEFT_SHOULDER = 11
-        RIGHT_SHOULDER = 12
-        LEFT_HIP = 23
-        RIGHT_HIP = 24
-    
-    mp_pose_landmark = PoseLandmark
-    print("MediaPipe pose detection initialized successfully")
-except Exception as e:
-    print(f"Warning: MediaPipe pose detection not available: {e}")
-    pose_detector = None
-    mp_pose_landmark = None
+# Video analysis runs in worker processes (0 = threads in the API process)
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", os.cpu_count() or 1))
+VIDEO_THREADS = int(os.getenv("VIDEO_THREADS", 2))
+
+# Frame sampling: analyses per second, or every Nth frame when unset
+ANALYSIS_FPS = float(os.getenv("ANALYSIS_FPS", 0)) or None
+FRAME_SKIP_INTERVAL = int(os.getenv("FRAME_SKIP_INTERVAL", 5))
+
+# Track poses between frames with a per-job VIDEO-mode landmarker (false = IMAGE mode per frame)
+POSE_TRACKING = os.getenv("POSE_TRACKING", "true").lower() in ("1", "true", "yes")
+
+# Skip pose inference on still frames: the last pose stands until the frame
+# difference exceeds MOTION_THRESHOLD, with a heartbeat inference every MOTION_HEARTBEAT_SECONDS
+# and, so breathing is still measured, one every MOTION_BREATHING_SECONDS (0 = pause breathing)
+MOTION_GATE = os.getenv("MOTION_GATE", "true").lower() in ("1", "true", "yes")
+MOTION_GATE_OPTIONS = {
+    "threshold": float(os.getenv("MOTION_THRESHOLD", 0.003)),
+    "heartbeat_seconds": float(os.getenv("MOTION_HEARTBEAT_SECONDS", 2)),
+    "hold_seconds": float(os.getenv("MOTION_HOLD_SECONDS", 3)),
+    "breathing_seconds": float(os.getenv("MOTION_BREATHING_SECONDS", 1.0)),
+} if MOTION_GATE else None
+
+# Run pose inference on a crop around the person, downscaled to POSE_INPUT_SIZE
+# pixels on its longest side, with POSE_ROI_MARGIN of the pose size around it
+POSE_ROI = os.getenv("POSE_ROI", "true").lower() in ("1", "true", "yes")
+POSE_ROI_OPTIONS = {
+    "margin": float(os.getenv("POSE_ROI_MARGIN", 0.3)),
+    "input_size": int(os.getenv("POSE_INPUT_SIZE", 256)),
+} if POSE_ROI else None
+
+# Coalesce per-frame detections into alert episodes: one start, an update every
+# ALERT_EPISODE_UPDATE_SECONDS while it lasts, and an end summary (false = alert every frame)
+ALERT_EPISODES = os.getenv("ALERT_EPISODES", "true").lower() in ("1", "true", "yes")
+EPISODE_OPTIONS = {
+    "update_seconds": float(os.getenv("ALERT_EPISODE_UPDATE_SECONDS", 30)),
+} if ALERT_EPISODES else None
+
+# MediaPipe landmarker pools, created and warmed up on startup. In-process
+# video jobs (VIDEO_WORKERS=0) share POSE_POOL_SIZE landmarkers frame by frame,
+# plus one tracking landmarker per job thread; worker processes pin their own
+POSE_POOL_SIZE = int(os.getenv("POSE_POOL_SIZE", VIDEO_THREADS))
+landmarker_pools = {}
+if VIDEO_WORKERS == 0:
+    landmarker_pools["jobs"] = LandmarkerPool(POSE_POOL_SIZE, "IMAGE", name="jobs")
+    if POSE_TRACKING:
+        landmarker_pools["job_tracking"] = LandmarkerPool(VIDEO_THREADS, "VIDEO", name="job_tracking")
+
+# Recordings longer than two segments are analysed in parallel segments (0 = off)
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", 600))
+
+# Extracted landmarks are cached per video so re-analysis skips inference (empty dir = off)
+LANDMARK_CACHE_DIR = os.getenv("LANDMARK_CACHE_DIR", "landmark_cache")
+LANDMARK_CACHE_MB = int(os.getenv("LANDMARK_CACHE_MB", 2048))
+landmark_cache = LandmarkCache(LANDMARK_CACHE_DIR, LANDMARK_CACHE_MB * 2 ** 20) if LANDMARK_CACHE_DIR else None
+
+# Finished jobs and their results are kept VIDEO_JOB_TTL_SECONDS (0 = no limit),
+# VIDEO_JOB_MAX_FINISHED of them at most
+VIDEO_JOB_TTL_SECONDS = float(os.getenv("VIDEO_JOB_TTL_SECONDS", 3600))
+VIDEO_JOB_MAX_FINISHED = int(os.getenv("VIDEO_JOB_MAX_FINISHED", 200))
+
+job_manager = VideoJobManager(VIDEO_WORKERS, VIDEO_THREADS, {
+    "sample_rate": ANALYSIS_FPS,
+    "stride": FRAME_SKIP_INTERVAL,
+    "tracking": POSE_TRACKING,
+    "motion_gate": MOTION_GATE_OPTIONS,
+    "roi": POSE_ROI_OPTIONS,
+    "episodes": EPISODE_OPTIONS,
+}, SEGMENT_SECONDS, landmark_cache, job_ttl=VIDEO_JOB_TTL_SECONDS or None, max_finished_jobs=VIDEO_JOB_MAX_FINISHED)
+
+# Live camera streams: analyses per second and concurrent streams. With tracking
+# each stream leases one of LIVE_POSE_POOL_SIZE landmarkers; without, all
+# streams share them frame by frame (fewer landmarkers than beds)
+LIVE_ANALYSIS_FPS = float(os.getenv("LIVE_ANALYSIS_FPS", 6))
+LIVE_MAX_STREAMS = int(os.getenv("LIVE_MAX_STREAMS", 8))
+LIVE_TRACKING = os.getenv("LIVE_TRACKING", str(POSE_TRACKING)).lower() in ("1", "true", "yes")
+LIVE_POSE_POOL_SIZE = int(os.getenv("LIVE_POSE_POOL_SIZE", LIVE_MAX_STREAMS))
+landmarker_pools["live"] = LandmarkerPool(LIVE_POSE_POOL_SIZE, "VIDEO" if LIVE_TRACKING else "IMAGE", name="live")
+# URL schemes a live stream may read from (anything else is refused, not handed to OpenCV)
+LIVE_SOURCE_SCHEMES = ("rtsp", "rtsps", "http", "https")
+live_manager = LiveIngestManager(LIVE_ANALYSIS_FPS, LIVE_MAX_STREAMS,
+                                 motion_gate=MOTION_GATE_OPTIONS, roi=POSE_ROI_OPTIONS, episodes=EPISODE_OPTIONS)
+
+# Alert WebSocket clients: each has ALERT_QUEUE_SIZE pending alerts at most, and
+# ALERT_QUEUE_POLICY decides what a client that falls behind loses
+alert_hub = AlertHub(
+    int(os.getenv("ALERT_QUEUE_SIZE", 256)),
+    os.getenv("ALERT_QUEUE_POLICY", "drop_oldest"),
+    float(os.getenv("ALERT_SEND_TIMEOUT", 10)),
+)
 
-# Store active WebSocket connections
-active_connections: List[WebSocket] = []
+# Every broadcast alert is kept in an SQLite database for reports (empty = off),
+# for ALERT_RETENTION_DAYS (0 = forever)
+ALERT_DB = os.getenv("ALERT_DB", "alerts.db")
+ALERT_RETENTION_DAYS = float(os.getenv("ALERT_RETENTION_DAYS", 0)) or None
+alert_store = AlertStore(ALERT_DB, retention_days=ALERT_RETENTION_DAYS) if ALERT_DB else None
 
 # Create uploads directory
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# Configure Gemini API
+# Uploads are streamed to disk in UPLOAD_CHUNK_KB chunks, up to UPLOAD_MAX_MB each
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", 4096))
+UPLOAD_CHUNK_KB = int(os.getenv("UPLOAD_CHUNK_KB", 1024))
+upload_store = UploadStore(UPLOAD_DIR, UPLOAD_MAX_MB * 2 ** 20, UPLOAD_CHUNK_KB * 1024)
+
+# Configure Gemini API: at most GEMINI_MAX_CONCURRENCY calls in flight, each
+# with a GEMINI_TIMEOUT deadline and GEMINI_RETRIES retries of transient failures
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 print(f"GEMINI_API_KEY loaded: {'Yes' if GEMINI_API_KEY else 'No'}")
 if GEMINI_API_KEY:
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
+        client = GeminiClient(
+            GEMINI_API_KEY,
+            model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+            base_url=os.getenv("GEMINI_BASE_URL") or None,
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", 4)),
+            timeout=float(os.getenv("GEMINI_TIMEOUT", 60)),
+            retries=int(os.getenv("GEMINI_RETRIES", 2)),
+            breaker_failures=int(os.getenv("GEMINI_BREAKER_FAILURES", 5)),
+            breaker_reset=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", 30)),
+        )
         print("Gemini client initialized successfully")
     except Exception as e:
         print(f"Error initializing Gemini client: {e}")
@@ -93,399 +167,207 @@ else:
     print("Warning: GEMINI_API_KEY not found in environment")
     client = None
 
-class ActivityDetector:
-    def __init__(self):
-        self.prev_positions = []
-        self.prev_landmarks_history = []  # For seizure detection
-        self.bed_region = None  # Will be set based on first detection
-        self.breathing_history = []  # For breathing rate
-        self.fall_threshold = 0.3  # Vertical position threshold
-        self.rapid_movement_threshold = 0.08  # Movement speed threshold (lowered from 0.15)
-        self.frame_buffer_size = 10
-        self.seizure_buffer_size = 30  # Frames to analyze for seizure
-        self.breathing_buffer_size = 60  # Frames for breathing (2 seconds at 30fps)
-    
-    def reset(self):
-        """Reset detector state for new video"""
-        self.prev_positions = []
-        self.prev_landmarks_history = []
-        self.bed_region = None
-        self.breathing_history = []
-        print("Detector state reset for new video")
-        
-    def detect_fall(self, landmarks):
-        """Detect fall based on pose landmarks"""
-        if not landmarks:
-            return False, 0.0
-        
-        # Get key points
-        nose = landmarks[mp_pose_landmark.NOSE]
-        left_hip = landmarks[mp_pose_landmark.LEFT_HIP]
-        right_hip = landmarks[mp_pose_landmark.RIGHT_HIP]
-        
-        # Calculate hip midpoint
-        hip_y = (left_hip.y + right_hip.y) / 2
-        
-        # Fall detected if nose is close to hip level (person is horizontal)
-        vertical_distance = abs(nose.y - hip_y)
-        
-        # Also check if person is low in frame
-        is_fall = hip_y > 0.7 and vertical_distance < self.fall_threshold
-        
-        return is_fall, hip_y
-    
-    def detect_rapid_movement(self, landmarks):
-        """Detect rapid movement based on position changes"""
-        if not landmarks:
-            return False, 0.0
-        
-        # Get center of mass (average of key points)
-        key_points = [
-            landmarks[mp_pose_landmark.NOSE],
-            landmarks[mp_pose_landmark.LEFT_SHOULDER],
-            landmarks[mp_pose_landmark.RIGHT_SHOULDER],
-            landmarks[mp_pose_landmark.LEFT_HIP],
-            landmarks[mp_pose_landmark.RIGHT_HIP],
-        ]
-        
-        center_x = np.mean([p.x for p in key_points])
-        center_y = np.mean([p.y for p in key_points])
-        
-        current_position = np.array([center_x, center_y])
-        
-        # Store position history
-        self.prev_positions.append(current_position)
-        if len(self.prev_positions) > self.frame_buffer_size:
-            self.prev_positions.pop(0)
-        
-        # Calculate movement speed
-        if len(self.prev_positions) >= 2:
-            movement = np.linalg.norm(
-                self.prev_positions[-1] - self.prev_positions[-2]
-            )
-            
-            is_rapid = movement > self.rapid_movement_threshold
-            return is_rapid, float(movement)
-        
-        return False, 0.0
-    
-    def detect_seizure(self, landmarks):
-        """Detect seizure-like convulsive movements"""
-        if not landmarks:
-            return False, 0.0
-        
-        # Track multiple body parts for erratic movement
-        key_points = [
-            landmarks[mp_pose_landmark.LEFT_SHOULDER],
-            landmarks[mp_pose_landmark.RIGHT_SHOULDER],
-            landmarks[mp_pose_landmark.LEFT_HIP],
-            landmarks[mp_pose_landmark.RIGHT_HIP],
-        ]
-        
-        # Calculate variance in positions
-        positions = np.array([[p.x, p.y] for p in key_points])
-        
-        # Store landmark history
-        self.prev_landmarks_history.append(positions)
-        if len(self.prev_landmarks_history) > self.seizure_buffer_size:
-            self.prev_landmarks_history.pop(0)
-        
-        # Need enough history to detect seizure
-        if len(self.prev_landmarks_history) < 20:
-            return False, 0.0
-        
-        # Calculate movement variance across frames
-        movements = []
-        for i in range(1, len(self.prev_landmarks_history)):
-            diff = np.linalg.norm(
-                self.prev_landmarks_history[i] - self.prev_landmarks_history[i-1]
-            )
-            movements.append(diff)
-        
-        # High variance + high frequency = seizure
-        movement_variance = np.var(movements)
-        movement_mean = np.mean(movements)
-        
-        # Seizure: high variance with consistent high movement
-        is_seizure = movement_variance > 0.01 and movement_mean > 0.05
-        
-        return is_seizure, float(movement_variance)
-    
-    def detect_bed_exit(self, landmarks, frame_shape):
-        """Detect when patient exits bed area"""
-        if not landmarks:
-            return False, 0.0
-        
-        # Get hip position (center of body)
-        left_hip = landmarks[mp_pose_landmark.LEFT_HIP]
-        right_hip = landmarks[mp_pose_landmark.RIGHT_HIP]
-        
-        hip_x = (left_hip.x + right_hip.x) / 2
-        hip_y = (left_hip.y + right_hip.y) / 2
-        
-        # Initialize bed region on first detection (assume patient starts in bed)
-        if self.bed_region is None:
-            self.bed_region = {
-                'x_min': hip_x - 0.2,
-                'x_max': hip_x + 0.2,
-                'y_min': hip_y - 0.2,
-                'y_max': hip_y + 0.2
-            }
-            return False, 0.0
-        
-        # Check if patient is outside bed region
-        is_outside = (
-            hip_x < self.bed_region['x_min'] or 
-            hip_x > self.bed_region['x_max'] or
-            hip_y < self.bed_region['y_min'] or 
-            hip_y > self.bed_region['y_max']
-        )
-        
-        # Calculate distance from bed center
-        bed_center_x = (self.bed_region['x_min'] + self.bed_region['x_max']) / 2
-        bed_center_y = (self.bed_region['y_min'] + self.bed_region['y_max']) / 2
-        distance = np.sqrt((hip_x - bed_center_x)**2 + (hip_y - bed_center_y)**2)
-        
-        return is_outside, float(distance)
-    
-    def detect_abnormal_posture(self, landmarks):
-        """Detect unusual body positions"""
-        if not landmarks:
-            return False, 0.0, "None"
-        
-        nose = landmarks[mp_pose_landmark.NOSE]
-        left_shoulder = landmarks[mp_pose_landmark.LEFT_SHOULDER]
-        right_shoulder = landmarks[mp_pose_landmark.RIGHT_SHOULDER]
-        left_hip = landmarks[mp_pose_landmark.LEFT_HIP]
-        right_hip = landmarks[mp_pose_landmark.RIGHT_HIP]
-        
-        # Calculate body angles
-        shoulder_y = (left_shoulder.y + right_shoulder.y) / 2
-        hip_y = (left_hip.y + right_hip.y) / 2
-        
-        # Check for various abnormal postures
-        posture_type = "Normal"
-        is_abnormal = False
-        confidence = 0.0
-        
-        # 1. Upside down (head below hips)
-        if nose.y > hip_y + 0.1:
-            is_abnormal = True
-            posture_type = "Upside Down"
-            confidence = abs(nose.y - hip_y)
-        
-        # 2. Extreme lean (shoulders very tilted)
-        shoulder_tilt = abs(left_shoulder.y - right_shoulder.y)
-        if shoulder_tilt > 0.15:
-            is_abnormal = True
-            posture_type = "Extreme Lean"
-            confidence = shoulder_tilt
-        
-        # 3. Twisted body (shoulders and hips misaligned)
-        shoulder_center_x = (left_shoulder.x + right_shoulder.x) / 2
-        hip_center_x = (left_hip.x + right_hip.x) / 2
-        body_twist = abs(shoulder_center_x - hip_center_x)
-        if body_twist > 0.2:
-            is_abnormal = True
-            posture_type = "Twisted Body"
-            confidence = body_twist
-        
-        # 4. Curled up (very compressed vertically)
-        body_height = abs(nose.y - hip_y)
-        if body_height < 0.15:
-            is_abnormal = True
-            posture_type = "Curled Up"
-            confidence = 1.0 - body_height
-        
-        return is_abnormal, float(confidence), posture_type
-    
-    def detect_breathing_rate(self, landmarks):
-        """Estimate breathing rate from chest movement"""
-        if not landmarks:
-            return 0.0, "Unknown"
-        
-        # Track shoulder movement (rises with breathing)
-        left_shoulder = landmarks[mp_pose_landmark.LEFT_SHOULDER]
-        right_shoulder = landmarks[mp_pose_landmark.RIGHT_SHOULDER]
-        
-        shoulder_y = (left_shoulder.y + right_shoulder.y) / 2
-        
-        # Store breathing history
-        self.breathing_history.append(shoulder_y)
-        if len(self.breathing_history) > self.breathing_buffer_size:
-            self.breathing_history.pop(0)
-        
-        # Need enough data to estimate breathing
-        if len(self.breathing_history) < 30:
-            return 0.0, "Calculating..."
-        
-        # Count peaks (breaths) in the signal
-        breathing_array = np.array(self.breathing_history)
-        
-        # Simple peak detection
-        peaks = 0
-        for i in range(1, len(breathing_array) - 1):
-            if breathing_array[i] > breathing_array[i-1] and breathing_array[i] > breathing_array[i+1]:
-                # Check if peak is significant
-                if abs(breathing_array[i] - np.mean(breathing_array)) > 0.005:
-                    peaks += 1
-        
-        # Convert to breaths per minute (assuming 30 fps, 60 frames = 2 seconds)
-        breaths_per_minute = (peaks / len(self.breathing_history)) * 30 * 60
-        
-        # Classify breathing rate
-        if breaths_per_minute < 12:
-            status = "Slow (Bradypnea)"
-        elif breaths_per_minute > 20:
-            status = "Fast (Tachypnea)"
-        else:
-            status = "Normal"
-        
-        return float(breaths_per_minute), status
-        
-        return False, 0.0
-    
-    def analyze_frame(self, frame):
-        """Analyze a single frame for unusual activities"""
-        if pose_detector is None:
-            # MediaPipe not available
-            return {
-                "fall_detected": False,
-                "rapid_movement": False,
-                "seizure_detected": False,
-                "bed_exit_detected": False,
-                "abnormal_posture_detected": False,
-                "fall_confidence": 0.0,
-                "movement_speed": 0.0,
-                "breathing_rate": 0.0,
-                "breathing_status": "Unknown",
-                "posture_type": "Unknown",
-                "pose_detected": False
-            }, frame
-            
-        # Convert to RGB for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Create MediaPipe Image
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
-        
-        # Detect pose
-        detection_result = pose_detector.detect(mp_image)
-        
-        activities = {
-            "fall_detected": False,
-            "rapid_movement": False,
-            "seizure_detected": False,
-            "bed_exit_detected": False,
-            "abnormal_posture_detected": False,
-            "fall_confidence": 0.0,
-            "movement_speed": 0.0,
-            "seizure_confidence": 0.0,
-            "bed_exit_distance": 0.0,
-            "posture_confidence": 0.0,
-            "posture_type": "Normal",
-            "breathing_rate": 0.0,
-            "breathing_status": "Unknown",
-            "pose_detected": False
-        }
-        
-        if detection_result.pose_landmarks:
-            activities["pose_detected"] = True
-            landmarks = detection_result.pose_landmarks[0]  # Get first person
-            
-            # 1. Detect fall
-            is_fall, fall_conf = self.detect_fall(landmarks)
-            activities["fall_detected"] = is_fall
-            activities["fall_confidence"] = float(fall_conf)
-            
-            # 2. Detect rapid movement
-            is_rapid, speed = self.detect_rapid_movement(landmarks)
-            activities["rapid_movement"] = is_rapid
-            activities["movement_speed"] = speed
-            
-            # 3. Detect seizure
-            is_seizure, seizure_conf = self.detect_seizure(landmarks)
-            activities["seizure_detected"] = is_seizure
-            activities["seizure_confidence"] = seizure_conf
-            
-            # 4. Detect bed exit
-            is_bed_exit, exit_distance = self.detect_bed_exit(landmarks, frame.shape)
-            activities["bed_exit_detected"] = is_bed_exit
-            activities["bed_exit_distance"] = exit_distance
-            
-            # 5. Detect abnormal posture
-            is_abnormal, posture_conf, posture_type = self.detect_abnormal_posture(landmarks)
-            activities["abnormal_posture_detected"] = is_abnormal
-            activities["posture_confidence"] = posture_conf
-            activities["posture_type"] = posture_type
-            
-            # 6. Detect breathing rate
-            breathing_rate, breathing_status = self.detect_breathing_rate(landmarks)
-            activities["breathing_rate"] = breathing_rate
-            activities["breathing_status"] = breathing_status
-            
-            # Draw pose landmarks on frame (simple circles)
-            for landmark in landmarks:
-                x = int(landmark.x * frame.shape[1])
-                y = int(landmark.y * frame.shape[0])
-                cv2.circle(frame, (x, y), 5, (0, 255, 0), -1)
-            
-            # Draw alerts on frame
-            y_offset = 30
-            if is_fall:
-                cv2.putText(frame, "FALL DETECTED!", (10, y_offset), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                y_offset += 40
-            if is_seizure:
-                cv2.putText(frame, "SEIZURE DETECTED!", (10, y_offset), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 255), 2)
-                y_offset += 40
-            if is_bed_exit:
-                cv2.putText(frame, "BED EXIT DETECTED!", (10, y_offset), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 165, 0), 2)
-                y_offset += 40
-            if is_abnormal:
-                cv2.putText(frame, f"ABNORMAL POSTURE: {posture_type}", (10, y_offset), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-                y_offset += 40
-            
-            # Display breathing rate
-            cv2.putText(frame, f"Breathing: {breathing_rate:.1f} bpm ({breathing_status})", 
-                       (10, frame.shape[0] - 20), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-        
-        return activities, frame
+# Ward images are downsized to WARD_IMAGE_MAX_EDGE pixels and re-encoded
+# (WARD_IMAGE_FORMAT, up to WARD_IMAGE_MAX_KB) on WARD_IMAGE_WORKERS threads
+# before they are sent to Gemini
+image_preparer = ImagePreparer(
+    max_edge=int(os.getenv("WARD_IMAGE_MAX_EDGE", 1536)),
+    max_bytes=int(os.getenv("WARD_IMAGE_MAX_KB", 512)) * 1024,
+    fmt=os.getenv("WARD_IMAGE_FORMAT", "jpeg").lower(),
+    workers=int(os.getenv("WARD_IMAGE_WORKERS", 2)),
+)
+
+# Before/after pairs are compared locally first (WARD_PREFILTER): unchanged
+# pairs are answered without Gemini, changed ones send only the changed regions.
+# Regions are a WARD_PREFILTER_GRID grid, or the beds in WARD_REGIONS_FILE
+PREFILTER_GRID = tuple(int(n) for n in os.getenv("WARD_PREFILTER_GRID", "4x6").lower().split("x"))
+change_detector = ChangeDetector(
+    grid=PREFILTER_GRID,
+    ssim_threshold=float(os.getenv("WARD_PREFILTER_SSIM", 0.5)),
+    min_changed=float(os.getenv("WARD_PREFILTER_MIN_CHANGED", 0.02)),
+    regions=load_regions(os.getenv("WARD_REGIONS_FILE")),
+    max_crops=int(os.getenv("WARD_PREFILTER_MAX_CROPS", 4)),
+) if os.getenv("WARD_PREFILTER", "true").lower() == "true" else None
+
+# Ward image results are cached for WARD_CACHE_TTL_SECONDS (up to
+# WARD_CACHE_ENTRIES), keyed by image content, prompt and expected_beds;
+# WARD_CACHE_PERCEPTUAL=true keys on a perceptual hash of the picture instead
+ward_cache = ResultCache(
+    max_entries=int(os.getenv("WARD_CACHE_ENTRIES", 512)),
+    ttl=float(os.getenv("WARD_CACHE_TTL_SECONDS", 600)),
+    perceptual=os.getenv("WARD_CACHE_PERCEPTUAL", "false").lower() == "true",
+)
+
+# Batch ward presence sweeps: up to WARD_BATCH_MAX_WARDS images per request,
+# packed WARD_BATCH_MAX_IMAGES (within WARD_BATCH_TOKEN_BUDGET tokens) per
+# Gemini call, WARD_BATCH_CONCURRENCY calls in flight per sweep
+WARD_BATCH_MAX_WARDS = int(os.getenv("WARD_BATCH_MAX_WARDS", 100))
+ward_sweep = WardSweep(
+    client, image_preparer, ward_cache,
+    token_budget=int(os.getenv("WARD_BATCH_TOKEN_BUDGET", 6000)),
+    max_images=int(os.getenv("WARD_BATCH_MAX_IMAGES", 4)),
+    concurrency=int(os.getenv("WARD_BATCH_CONCURRENCY", 4)),
+)
+
+def start_landmarker_pools():
+    """Create and warm up the landmarker pools; a pool that fails is left out"""
+    for name, pool in list(landmarker_pools.items()):
+        try:
+            pool.start()
+        except Exception as e:
+            print(f"Warning: MediaPipe pose detection not available ({name} pool): {e}")
+            del landmarker_pools[name]
+
+@app.on_event("startup")
+async def start_job_manager():
+    if alert_store is not None:
+        await asyncio.to_thread(alert_store.start)
+    await asyncio.to_thread(start_landmarker_pools)
+    job_manager.start(asyncio.get_running_loop(), broadcast_alert,
+                      landmarker_pools.get("jobs"), landmarker_pools.get("job_tracking"))
+    live_manager.pool = landmarker_pools.get("live")
+    live_manager.start(asyncio.get_running_loop(), broadcast_alert)
 
-detector = ActivityDetector()
+@app.on_event("shutdown")
+async def stop_job_manager():
+    live_manager.shutdown()
+    job_manager.shutdown()
+    for pool in landmarker_pools.values():
+        pool.close()
+    await alert_hub.close()
+    image_preparer.close()
+    if alert_store is not None:
+        await asyncio.to_thread(alert_store.close)
 
 @app.get("/")
 async def root():
     return {"message": "Patient Monitoring System API", "status": "running"}
 
 @app.post("/api/upload-video")
-async def upload_video(file: UploadFile = File(...)):
-    """Upload video file for processing"""
+async def upload_video(request: Request):
+    """
+    Upload a video file (multipart/form-data, field "file") for processing;
+    returns its SHA-256 for deduplication. The body is read straight from the
+    request, so UPLOAD_MAX_MB is enforced while it arrives, chunked or not.
+    """
     try:
-        # Save uploaded file
-        file_path = UPLOAD_DIR / file.filename
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        try:
+            content_length = int(request.headers.get("content-length", 0))
+        except ValueError:
+            return JSONResponse({
+                "success": False,
+                "error": "Invalid Content-Length header"
+            }, status_code=400)
+        # Refuse oversized bodies before copying anything
+        if content_length > upload_store.max_bytes + 2 ** 20:
+            return JSONResponse({
+                "success": False,
+                "error": f"Upload exceeds the {UPLOAD_MAX_MB} MB limit"
+            }, status_code=413)
+        
+        # Save uploaded file, streamed to disk chunk by chunk
+        saved = await upload_store.save(request.headers.get("content-type"), request.stream())
         
         return JSONResponse({
             "success": True,
-            "filename": file.filename,
+            **saved,
             "message": "Video uploaded successfully"
         })
+    except UploadError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=e.status_code)
     except Exception as e:
         return JSONResponse({
             "success": False,
             "error": str(e)
         }, status_code=500)
 
+@app.post("/api/uploads")
+async def create_upload(filename: str, size: Optional[int] = None):
+    """
+    Start a resumable upload. Send the file with PUT /api/uploads/{upload_id}?offset=N
+    (any number of pieces, raw bytes), then POST /api/uploads/{upload_id}/complete.
+    """
+    try:
+        upload = await asyncio.to_thread(upload_store.create, filename, size)
+    except UploadError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status_code)
+    
+    return JSONResponse({
+        "success": True,
+        "upload": upload
+    }, status_code=201)
+
+@app.put("/api/uploads/{upload_id}")
+async def append_upload(upload_id: str, request: Request, offset: int = 0):
+    """Append the request body at offset (the bytes received so far, see GET)"""
+    try:
+        received = await upload_store.append(upload_id, offset, request.stream())
+    except KeyError:
+        return JSONResponse({"success": False, "error": "Upload not found"}, status_code=404)
+    except OffsetMismatch as e:
+        return JSONResponse({"success": False, "error": str(e), "offset": e.offset}, status_code=409)
+    except UploadError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status_code)
+    
+    return JSONResponse({
+        "success": True,
+        "upload_id": upload_id,
+        "offset": received
+    })
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Bytes received so far: where to resume after a dropped connection"""
+    try:
+        upload = upload_store.status(upload_id)
+    except KeyError:
+        return JSONResponse({"success": False, "error": "Upload not found"}, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "upload": upload
+    })
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, sha256: Optional[str] = None):
+    """Finish a resumable upload, optionally checking the client's SHA-256"""
+    try:
+        saved = await upload_store.complete(upload_id, sha256)
+    except KeyError:
+        return JSONResponse({"success": False, "error": "Upload not found"}, status_code=404)
+    except OffsetMismatch as e:
+        return JSONResponse({"success": False, "error": str(e), "offset": e.offset}, status_code=409)
+    except UploadError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status_code)
+    
+    return JSONResponse({
+        "success": True,
+        **saved,
+        "message": "Video uploaded successfully"
+    })
+
+@app.delete("/api/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """Abandon a resumable upload"""
+    if not await asyncio.to_thread(upload_store.abort, upload_id):
+        return JSONResponse({"success": False, "error": "Upload not found"}, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "upload_id": upload_id
+    })
+
 @app.post("/api/process-video/{filename}")
-async def process_video(filename: str):
-    """Process uploaded video and detect activities"""
+async def process_video(filename: str, analysis_fps: Optional[float] = None, offline: bool = False,
+                        tracking: Optional[bool] = None, stream: Optional[str] = None,
+                        ward: Optional[str] = None, bed: Optional[str] = None):
+    """
+    Process uploaded video and detect activities.
+    stream=ndjson or stream=sse sends progress and alerts as they happen instead of one response at the end.
+    """
     try:
         file_path = UPLOAD_DIR / filename
         
@@ -495,147 +377,34 @@ async def process_video(filename: str):
                 "error": "Video file not found"
             }, status_code=404)
         
-        # Open video
-        cap = cv2.VideoCapture(str(file_path))
-        
-        if not cap.isOpened():
+        if stream is not None:
+            if stream not in MEDIA_TYPES:
+                return JSONResponse({
+                    "success": False,
+                    "error": f"stream must be one of {', '.join(MEDIA_TYPES)}"
+                }, status_code=400)
+            events = JobEventStream(asyncio.get_running_loop())
+            job = job_manager.submit(filename, file_path, on_event=events, labels={"ward": ward, "bed": bed},
+                                     sample_rate=analysis_fps, offline=offline or None, tracking=tracking)
+            return job_event_response(job["job_id"], events, stream)
+        
+        # Run as a background job and wait without blocking the event loop
+        job = job_manager.submit(filename, file_path, labels={"ward": ward, "bed": bed},
+                                 sample_rate=analysis_fps, offline=offline or None, tracking=tracking)
+        await asyncio.wait([asyncio.wrap_future(job["future"])])
+        
+        if job["status"] != "completed":
             return JSONResponse({
                 "success": False,
-                "error": "Failed to open video"
-            }, status_code=500)
-        
-        # Process video
-        alerts = []
-        frame_count = 0
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        
-        # Reset detector state for new video
-        detector.reset()
-        print(f"Processing video: {filename}, Total frames: {total_frames}, FPS: {fps}")
-        
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            
-            # Process every 5th frame for performance
-            if frame_count % 5 == 0:
-                activities, _ = detector.analyze_frame(frame)
-                
-                timestamp = frame_count / fps
-                
-                # Debug logging
-                if activities["pose_detected"]:
-                    print(f"Frame {frame_count}: Pose detected, Movement speed: {activities['movement_speed']:.4f}")
-                
-                # Generate alerts for all detection types
-                if activities["fall_detected"]:
-                    alert = {
-                        "type": "FALL",
-                        "severity": "CRITICAL",
-                        "timestamp": timestamp,
-                        "frame": frame_count,
-                        "confidence": activities["fall_confidence"],
-                        "message": "🚨 Fall detected - Immediate attention required!"
-                    }
-                    alerts.append(alert)
-                    await broadcast_alert(alert)
-                    print(f"ALERT: Fall detected at frame {frame_count}")
-                
-                if activities["seizure_detected"]:
-                    alert = {
-                        "type": "SEIZURE",
-                        "severity": "CRITICAL",
-                        "timestamp": timestamp,
-                        "frame": frame_count,
-                        "confidence": activities["seizure_confidence"],
-                        "message": "🚨 Seizure detected - Emergency response needed!"
-                    }
-                    alerts.append(alert)
-                    await broadcast_alert(alert)
-                    print(f"ALERT: Seizure detected at frame {frame_count}")
-                
-                if activities["bed_exit_detected"]:
-                    alert = {
-                        "type": "BED_EXIT",
-                        "severity": "HIGH",
-                        "timestamp": timestamp,
-                        "frame": frame_count,
-                        "distance": activities["bed_exit_distance"],
-                        "message": "⚠️ Patient left bed - Check immediately!"
-                    }
-                    alerts.append(alert)
-                    await broadcast_alert(alert)
-                    print(f"ALERT: Bed exit detected at frame {frame_count}")
-                
-                if activities["abnormal_posture_detected"]:
-                    alert = {
-                        "type": "ABNORMAL_POSTURE",
-                        "severity": "MEDIUM",
-                        "timestamp": timestamp,
-                        "frame": frame_count,
-                        "posture_type": activities["posture_type"],
-                        "confidence": activities["posture_confidence"],
-                        "message": f"⚠️ Abnormal posture detected: {activities['posture_type']}"
-                    }
-                    alerts.append(alert)
-                    await broadcast_alert(alert)
-                    print(f"ALERT: Abnormal posture detected at frame {frame_count}: {activities['posture_type']}")
-                
-                if activities["rapid_movement"]:
-                    alert = {
-                        "type": "RAPID_MOVEMENT",
-                        "severity": "MEDIUM",
-                        "timestamp": timestamp,
-                        "frame": frame_count,
-                        "speed": activities["movement_speed"],
-                        "message": "⚡ Rapid movement detected - Check patient"
-                    }
-                    alerts.append(alert)
-                    await broadcast_alert(alert)
-                    print(f"ALERT: Rapid movement detected at frame {frame_count}, speed: {activities['movement_speed']:.4f}")
-                
-                # Monitor breathing rate (alert if abnormal)
-                if activities["breathing_rate"] > 0:
-                    if activities["breathing_rate"] < 10 or activities["breathing_rate"] > 25:
-                        alert = {
-                            "type": "ABNORMAL_BREATHING",
-                            "severity": "HIGH",
-                            "timestamp": timestamp,
-                            "frame": frame_count,
-                            "breathing_rate": activities["breathing_rate"],
-                            "status": activities["breathing_status"],
-                            "message": f"⚠️ Abnormal breathing: {activities['breathing_rate']:.1f} bpm ({activities['breathing_status']})"
-                        }
-                        alerts.append(alert)
-                        await broadcast_alert(alert)
-        
-        cap.release()
-        
-        print(f"Video processing complete: {len(alerts)} total alerts")
-        print(f"  - Falls: {len([a for a in alerts if a['type'] == 'FALL'])}")
-        print(f"  - Rapid movements: {len([a for a in alerts if a['type'] == 'RAPID_MOVEMENT'])}")
-        print(f"  - Seizures: {len([a for a in alerts if a['type'] == 'SEIZURE'])}")
-        print(f"  - Bed exits: {len([a for a in alerts if a['type'] == 'BED_EXIT'])}")
-        print(f"  - Abnormal postures: {len([a for a in alerts if a['type'] == 'ABNORMAL_POSTURE'])}")
-        print(f"  - Breathing alerts: {len([a for a in alerts if a['type'] == 'ABNORMAL_BREATHING'])}")
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "error": job["error"] or "Video processing was cancelled"
+            }, status_code=500 if job["status"] == "failed" else 409)
         
         return JSONResponse({
             "success": True,
-            "total_frames": total_frames,
-            "processed_frames": frame_count,
-            "alerts": alerts,
-            "summary": {
-                "fall_count": len([a for a in alerts if a["type"] == "FALL"]),
-                "seizure_count": len([a for a in alerts if a["type"] == "SEIZURE"]),
-                "bed_exit_count": len([a for a in alerts if a["type"] == "BED_EXIT"]),
-                "abnormal_posture_count": len([a for a in alerts if a["type"] == "ABNORMAL_POSTURE"]),
-                "rapid_movement_count": len([a for a in alerts if a["type"] == "RAPID_MOVEMENT"]),
-                "abnormal_breathing_count": len([a for a in alerts if a["type"] == "ABNORMAL_BREATHING"])
-            }
+            "job_id": job["job_id"],
+            **job["result"]
         })
         
     except Exception as e:
@@ -644,45 +413,400 @@ async def process_video(filename: str):
             "error": str(e)
         }, status_code=500)
 
+@app.post("/api/jobs/process-video/{filename}")
+async def submit_video_job(filename: str, analysis_fps: Optional[float] = None, offline: bool = False,
+                           tracking: Optional[bool] = None, ward: Optional[str] = None,
+                           bed: Optional[str] = None):
+    """Queue an uploaded video for analysis and return its job id immediately"""
+    file_path = UPLOAD_DIR / filename
+    
+    if not file_path.exists():
+        return JSONResponse({
+            "success": False,
+            "error": "Video file not found"
+        }, status_code=404)
+    
+    try:
+        job = job_manager.submit(filename, file_path, labels={"ward": ward, "bed": bed},
+                                 sample_rate=analysis_fps, offline=offline or None, tracking=tracking)
+    except RuntimeError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=503)
+    
+    return JSONResponse({
+        "success": True,
+        "job_id": job["job_id"],
+        "status": job["status"]
+    }, status_code=202)
+
+@app.get("/api/jobs/{job_id}")
+async def get_video_job(job_id: str):
+    """Get the status and progress of a video analysis job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({
+            "success": False,
+            "error": "Job not found"
+        }, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "job": job_manager.describe(job)
+    })
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_video_job_result(job_id: str):
+    """Get the alerts and summary of a finished video analysis job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({
+            "success": False,
+            "error": "Job not found"
+        }, status_code=404)
+    
+    if job["status"] == "failed":
+        return JSONResponse({
+            "success": False,
+            "status": job["status"],
+            "error": job["error"]
+        }, status_code=500)
+    
+    if job["status"] != "completed":
+        return JSONResponse({
+            "success": False,
+            "status": job["status"],
+            "error": "Job has not completed"
+        }, status_code=409)
+    
+    return JSONResponse({
+        "success": True,
+        "job_id": job_id,
+        **job["result"]
+    })
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_video_job(job_id: str, format: str = "sse"):
+    """Follow a video analysis job's progress and alerts as server-sent events or NDJSON"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({
+            "success": False,
+            "error": "Job not found"
+        }, status_code=404)
+    
+    if format not in MEDIA_TYPES:
+        return JSONResponse({
+            "success": False,
+            "error": f"format must be one of {', '.join(MEDIA_TYPES)}"
+        }, status_code=400)
+    
+    events = JobEventStream(asyncio.get_running_loop())
+    job_manager.subscribe(job_id, events)
+    events.attach(job)
+    return job_event_response(job_id, events, format)
+
+def job_event_response(job_id, events, mode):
+    """Stream a job's records; the job keeps running if the client goes away"""
+    async def body():
+        try:
+            async for record in events.records():
+                yield encode(record, mode)
+        finally:
+            job_manager.unsubscribe(job_id, events)
+    
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[mode], headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_video_job(job_id: str):
+    """Cancel a queued or running video analysis job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({
+            "success": False,
+            "error": "Job not found"
+        }, status_code=404)
+    
+    if not job_manager.cancel(job_id):
+        return JSONResponse({
+            "success": False,
+            "status": job["status"],
+            "error": "Job already finished"
+        }, status_code=409)
+    
+    return JSONResponse({
+        "success": True,
+        "job_id": job_id,
+        "status": job["status"]
+    })
+
 @app.websocket("/ws/alerts")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time alerts"""
+async def websocket_endpoint(websocket: WebSocket, ward: Optional[str] = None, bed: Optional[str] = None,
+                             severity: Optional[str] = None):
+    """
+    WebSocket endpoint for real-time alerts, optionally only for some wards
+    and beds (comma-separated) at or above a severity. A text message
+    {"ward": ..., "bed": ..., "severity": ...} changes the filters.
+    """
     await websocket.accept()
-    active_connections.append(websocket)
+    try:
+        filters = parse_filters(ward, bed, severity)
+    except ValueError as e:
+        await websocket.send_json({"success": False, "error": str(e)})
+        await websocket.close(code=1008)
+        return
+    subscriber = alert_hub.subscribe(websocket, filters)
     
     try:
         while True:
-            # Keep connection alive
-            await websocket.receive_text()
+            message = await websocket.receive_text()
+            try:
+                control = json.loads(message)
+                if isinstance(control, dict):
+                    subscriber.filters = parse_filters(control.get("ward"), control.get("bed"),
+                                                       control.get("severity"))
+            except ValueError:
+                continue
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        pass
+    finally:
+        await alert_hub.unsubscribe(subscriber)
+
+@app.websocket("/ws/ingest/{stream_id}")
+async def live_ingest(websocket: WebSocket, stream_id: str, ward: Optional[str] = None,
+                      bed: Optional[str] = None):
+    """
+    Live camera frames for real-time analysis: each binary message is one
+    encoded image (JPEG/PNG). A text message {"captured_at": <epoch seconds>}
+    sets the capture time of the next frame; {"stats": true} returns stream stats.
+    """
+    await websocket.accept()
+    try:
+        # Creating the landmarker loads the model, so keep it off the event loop
+        stream = await asyncio.to_thread(live_manager.open, stream_id, {"ward": ward, "bed": bed})
+    except (KeyError, RuntimeError) as e:
+        await websocket.send_json({"success": False, "error": e.args[0]})
+        await websocket.close(code=1008)
+        return
+    
+    captured_at = None
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                stream.push(message["bytes"], captured_at)
+                captured_at = None
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                    captured_at = control.get("captured_at", captured_at)
+                except (ValueError, AttributeError):
+                    continue
+                if control.get("stats"):
+                    await websocket.send_json({"success": True, "stream": stream.stats()})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await asyncio.to_thread(live_manager.close, stream_id)
+
+@app.post("/api/live/streams/{stream_id}")
+async def open_live_stream(stream_id: str, source: str, ward: Optional[str] = None,
+                           bed: Optional[str] = None):
+    """Analyse an RTSP/HTTP camera URL, or an uploaded video replayed in real time, as a live stream"""
+    if "://" in source:
+        if urlsplit(source).scheme.lower() not in LIVE_SOURCE_SCHEMES:
+            return JSONResponse({
+                "success": False,
+                "error": f"Camera URLs must use one of {', '.join(LIVE_SOURCE_SCHEMES)}"
+            }, status_code=400)
+    else:
+        # Only uploaded videos: no path may lead out of the upload directory
+        file_path = (UPLOAD_DIR / source).resolve()
+        if not file_path.is_relative_to(UPLOAD_DIR.resolve()):
+            return JSONResponse({
+                "success": False,
+                "error": f"Invalid source: {source!r}"
+            }, status_code=400)
+        if not file_path.is_file():
+            return JSONResponse({
+                "success": False,
+                "error": "Video file not found"
+            }, status_code=404)
+        source = str(file_path)
+    
+    try:
+        stream = await asyncio.to_thread(live_manager.open_capture, stream_id, source,
+                                          {"ward": ward, "bed": bed})
+    except KeyError as e:
+        return JSONResponse({"success": False, "error": e.args[0]}, status_code=409)
+    except RuntimeError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=503)
+    except IOError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    
+    return JSONResponse({
+        "success": True,
+        "stream": stream.stats()
+    }, status_code=201)
+
+@app.get("/api/live/streams")
+async def list_live_streams():
+    """Status, dropped frames and latency of every live stream"""
+    return JSONResponse({
+        "success": True,
+        "streams": [stream.stats() for stream in list(live_manager.streams.values())]
+    })
+
+@app.get("/api/live/streams/{stream_id}")
+async def get_live_stream(stream_id: str):
+    stream = live_manager.get(stream_id)
+    if stream is None:
+        return JSONResponse({
+            "success": False,
+            "error": "Stream not found"
+        }, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "stream": stream.stats()
+    })
+
+@app.delete("/api/live/streams/{stream_id}")
+async def close_live_stream(stream_id: str):
+    """Stop a live stream"""
+    if not await asyncio.to_thread(live_manager.close, stream_id):
+        return JSONResponse({
+            "success": False,
+            "error": "Stream not found"
+        }, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "stream_id": stream_id
+    })
 
 async def broadcast_alert(alert: dict):
-    """Broadcast alert to all connected clients"""
+    """Broadcast alert to all connected clients (queued per client, never waits on one)"""
     alert["timestamp_iso"] = datetime.now().isoformat()
+    alert_hub.publish(alert)
+    if alert_store is not None:
+        alert_store.add(alert)
+
+@app.get("/api/alerts")
+async def list_alerts(start: Optional[str] = None, end: Optional[str] = None, type: Optional[str] = None,
+                      severity: Optional[str] = None, event: Optional[str] = None, video: Optional[str] = None,
+                      job_id: Optional[str] = None, stream_id: Optional[str] = None, ward: Optional[str] = None,
+                      bed: Optional[str] = None, limit: int = 100, cursor: Optional[int] = None):
+    """
+    Stored alerts, newest first. start/end are epoch seconds or ISO 8601;
+    filters take comma-separated values. Pass next_cursor as cursor for the next page.
+    """
+    if alert_store is None:
+        return JSONResponse({"success": False, "error": "Alert store is disabled (ALERT_DB)"}, status_code=503)
     
-    for connection in active_connections:
-        try:
-            await connection.send_json(alert)
-        except:
-            # Remove dead connections
-            if connection in active_connections:
-                active_connections.remove(connection)
+    try:
+        page = await asyncio.to_thread(
+            alert_store.query, parse_time(start), parse_time(end), limit, cursor, type=type, severity=severity,
+            event=event, video=video, job_id=job_id, stream_id=stream_id, ward=ward, bed=bed
+        )
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    
+    return JSONResponse({
+        "success": True,
+        **page
+    })
+
+@app.get("/api/alerts/stats")
+async def alert_stats(bucket: str = "hour", group_by: str = "type", start: Optional[str] = None,
+                      end: Optional[str] = None, type: Optional[str] = None, severity: Optional[str] = None,
+                      event: Optional[str] = None, video: Optional[str] = None, stream_id: Optional[str] = None,
+                      ward: Optional[str] = None, bed: Optional[str] = None):
+    """
+    Stored alert counts per time bucket (minute, hour, day) and group (type,
+    severity, video, ward, bed, stream_id), over the last 30 days by default,
+    e.g. ?type=FALL&group_by=bed&bucket=hour for falls per bed per hour
+    """
+    if alert_store is None:
+        return JSONResponse({"success": False, "error": "Alert store is disabled (ALERT_DB)"}, status_code=503)
+    
+    try:
+        start_ts = parse_time(start)
+        if start_ts is None:
+            start_ts = datetime.now().timestamp() - 30 * 86400
+        counts = await asyncio.to_thread(
+            alert_store.aggregate, bucket, group_by, start_ts, parse_time(end), type=type, severity=severity,
+            event=event, video=video, stream_id=stream_id, ward=ward, bed=bed
+        )
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    
+    return JSONResponse({
+        "success": True,
+        "bucket": bucket,
+        "group_by": group_by,
+        "start": start_ts,
+        "counts": counts
+    })
 
 @app.get("/api/health")
 async def health_check():
     return {
         "status": "healthy",
-        "active_connections": len(active_connections),
+        "active_connections": len(alert_hub),
+        "alert_hub": alert_hub.stats(),
+        "alert_store": alert_store.stats() if alert_store is not None else None,
+        "gemini": client.stats() if client else None,
+        "ward_cache": ward_cache.stats(),
+        "ward_images": image_preparer.stats(),
+        "ward_prefilter": change_detector.stats() if change_detector else None,
+        "ward_sweeps": ward_sweep.stats(),
+        "video_jobs": job_manager.stats(),
+        "live_streams": live_manager.stats(),
+        "landmarker_pools": {name: pool.stats() for name, pool in landmarker_pools.items()},
+        "uploads": upload_store.stats(),
         "timestamp": datetime.now().isoformat()
     }
 
+def crop_prompt(crops):
+    """Prompt for compare-ward-images when only the changed regions are sent"""
+    regions = "\n".join(f"{number + 1}. {crop['location']}" for number, crop in enumerate(crops))
+    return f"""These are crops of the regions that changed between two photos of the same hospital ward.
+Everything outside these regions is unchanged. Each region comes as a "before" crop
+(reference, all patients present) followed by an "after" crop (current ward state):
+{regions}
+
+Identify any patients present in a "before" crop but missing from its "after" crop, and
+provide the comparison in the following JSON format:
+{{
+    "summary": "Brief overview of what changed between the two images",
+    "total_missing": number of patients missing,
+    "missing_patients": [
+        {{
+            "bed_number": "Bed identifier (e.g., 'Bed 1', 'Bed 3 - Left side')",
+            "description": "Description of the missing patient's location (name the region) and what you observe"
+        }}
+    ]
+}}
+
+If all patients are still present, set total_missing to 0 and missing_patients to an empty array."""
+
 @app.post("/api/compare-ward-images")
 async def compare_ward_images(
     image1: UploadFile = File(...),
-    image2: UploadFile = File(...)
+    image2: UploadFile = File(...),
+    ward: Optional[str] = None
 ):
-    """Compare two ward images to detect missing patients using Gemini AI"""
+    """
+    Compare two ward images to detect missing patients using Gemini AI.
+    ward selects its calibrated bed regions for the local pre-filter.
+    """
     try:
         if not client:
             return JSONResponse({
@@ -694,9 +818,6 @@ async def compare_ward_images(
         # Read both images
         image1_data = await image1.read()
         image2_data = await image2.read()
-        pil_image1 = Image.open(io.BytesIO(image1_data))
-        pil_image2 = Image.open(io.BytesIO(image2_data))
-        print(f"Images loaded: {pil_image1.size}, {pil_image2.size}")
         
         # Create prompt for Gemini
         prompt = """Compare these two hospital ward images and identify any missing patients.
@@ -724,45 +845,98 @@ Focus on:
 
 If all patients are present in both images, set total_missing to 0 and missing_patients to an empty array."""
 
-        print("Calling Gemini API...")
-        # Call Gemini API with new SDK
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=[prompt, pil_image1, pil_image2]
+        async def ask():
+            change = await change_detector.check(image1_data, image2_data, ward) if change_detector else None
+            if change is not None and not change["changed"]:
+                print("No change between the images, answered locally")
+                return {
+                    "summary": "No change detected between the two images; all patients are still present.",
+                    "total_missing": 0,
+                    "missing_patients": [],
+                    "prefilter": {"changed": False, "aligned": change["aligned"]},
+                }
+            
+            if change is not None and change["crops"]:
+                # Only the changed regions, each as a before/after pair of crops
+                crops = change["crops"]
+                prepared = await asyncio.gather(*[
+                    image_preparer.prepare(data, box) for crop in crops
+                    for data, box in ((image1_data, crop["box"]), (image2_data, crop["after_box"]))
+                ])
+                contents = [crop_prompt(crops)]
+                for number, crop in enumerate(crops):
+                    (before, before_mime, _), (after, after_mime, _) = prepared[2 * number:2 * number + 2]
+                    contents += [f"Region {number + 1} ({crop['location']}), before:", image_part(before, before_mime),
+                                 f"Region {number + 1} ({crop['location']}), after:", image_part(after, after_mime)]
+            else:
+                (prepared1, mime1, info1), (prepared2, mime2, info2) = await asyncio.gather(
+                    image_preparer.prepare(image1_data), image_preparer.prepare(image2_data)
+                )
+                prepared = [(prepared1, mime1, info1), (prepared2, mime2, info2)]
+                print(f"Images prepared: {info1['original_size']} -> {info1['size']}, "
+                      f"{info2['original_size']} -> {info2['size']}")
+                contents = [prompt, image_part(prepared1, mime1), image_part(prepared2, mime2)]
+            
+            print(f"Calling Gemini API ({sum(info['bytes_out'] for _, _, info in prepared)} image bytes)...")
+            # Awaited, so other requests and alert delivery carry on meanwhile
+            response_text = (await client.generate(contents)).strip()
+            print("Gemini API response received")
+        
+            # Parse response
+            print(f"Response text: {response_text[:200]}...")
+        
+            # Extract JSON from response (handle markdown code blocks)
+            if "```json" in response_text:
+                json_start = response_text.find("```json") + 7
+                json_end = response_text.find("```", json_start)
+                response_text = response_text[json_start:json_end].strip()
+            elif "```" in response_text:
+                json_start = response_text.find("```") + 3
+                json_end = response_text.find("```", json_start)
+                response_text = response_text[json_start:json_end].strip()
+        
+            try:
+                comparison_result = json.loads(response_text)
+            except json.JSONDecodeError as e:
+                print(f"JSON decode error: {e}")
+                # If JSON parsing fails, create a structured response from text
+                comparison_result = {
+                    "summary": response_text[:200],
+                    "total_missing": 0,
+                    "missing_patients": [],
+                    "raw_response": response_text
+                }
+            if change is not None:
+                comparison_result["prefilter"] = {
+                    "changed": True,
+                    "aligned": change["aligned"],
+                    "regions": [crop["location"] for crop in change["crops"]] if change["crops"] else None,
+                }
+        
+            return comparison_result
+        
+        # Identical pairs (and prompt) share one Gemini call; unparsed answers aren't cached
+        hashes = await asyncio.gather(
+            asyncio.to_thread(image_hash, image1_data, ward_cache.perceptual),
+            asyncio.to_thread(image_hash, image2_data, ward_cache.perceptual),
+        )
+        key = cache_key("compare", client.model, prompt, ward, *hashes)
+        comparison_result, cache_status = await ward_cache.get_or_compute(
+            key, ask, cacheable=lambda result: "raw_response" not in result
         )
-        print("Gemini API response received")
-        
-        # Parse response
-        response_text = response.text.strip()
-        print(f"Response text: {response_text[:200]}...")
-        
-        # Extract JSON from response (handle markdown code blocks)
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        
-        try:
-            comparison_result = json.loads(response_text)
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            # If JSON parsing fails, create a structured response from text
-            comparison_result = {
-                "summary": response_text[:200],
-                "total_missing": 0,
-                "missing_patients": [],
-                "raw_response": response_text
-            }
         
         return JSONResponse({
             "success": True,
-            "comparison_result": comparison_result
+            "comparison_result": comparison_result,
+            "cached": cache_status
         })
         
+    except ModelError as e:
+        print(f"Gemini call failed in compare_ward_images: {e}")
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=e.status_code)
     except Exception as e:
         print(f"Error in compare_ward_images: {str(e)}")
         import traceback
@@ -787,78 +961,120 @@ async def analyze_ward_presence(
         
         # Read image
         image_data = await image.read()
-        pil_image = Image.open(io.BytesIO(image_data))
         
         # Create prompt for Gemini
-        prompt = f"""Analyze this hospital ward image and identify patient presence at each bed location.
-
-Expected number of beds: {expected_beds}
-
-Please provide a detailed analysis in the following JSON format:
-{{
-    "summary": "Brief overview of the ward status",
-    "total_beds": number of beds visible in the image,
-    "occupied_beds": number of beds with patients present,
-    "empty_beds": number of empty beds,
-    "empty_spots": [
-        {{
-            "location": "Bed position (e.g., 'Bed 1 - Left side', 'Bed 3 - Center')",
-            "description": "Description of the empty bed location"
-        }}
-    ]
-}}
+        prompt = presence_prompt(expected_beds)
 
-Focus on:
-1. Identifying all bed locations in the ward
-2. Detecting human presence at each bed
-3. Noting which specific beds/spots are empty
-4. Providing clear location descriptions for empty beds
-
-Be specific about bed positions (left, right, center, near window, etc.) to help staff locate empty beds quickly."""
-
-        # Call Gemini API with new SDK
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=[prompt, pil_image]
+        async def ask():
+            prepared, mime_type, _ = await image_preparer.prepare(image_data)
+            response_text = (await client.generate([prompt, image_part(prepared, mime_type)])).strip()
+        
+            # Parse response
+        
+            # Extract JSON from response (handle markdown code blocks)
+            if "```json" in response_text:
+                json_start = response_text.find("```json") + 7
+                json_end = response_text.find("```", json_start)
+                response_text = response_text[json_start:json_end].strip()
+            elif "```" in response_text:
+                json_start = response_text.find("```") + 3
+                json_end = response_text.find("```", json_start)
+                response_text = response_text[json_start:json_end].strip()
+        
+            try:
+                analysis = json.loads(response_text)
+            except json.JSONDecodeError:
+                # If JSON parsing fails, create a structured response from text
+                analysis = {
+                    "summary": response_text[:200],
+                    "total_beds": expected_beds,
+                    "occupied_beds": 0,
+                    "empty_beds": 0,
+                    "empty_spots": [],
+                    "raw_response": response_text
+                }
+        
+            return analysis
+        
+        key = cache_key("presence", client.model, prompt, expected_beds,
+                        await asyncio.to_thread(image_hash, image_data, ward_cache.perceptual))
+        analysis, cache_status = await ward_cache.get_or_compute(
+            key, ask, cacheable=lambda result: "raw_response" not in result
         )
         
-        # Parse response
-        response_text = response.text.strip()
-        
-        # Extract JSON from response (handle markdown code blocks)
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        
-        try:
-            analysis = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, create a structured response from text
-            analysis = {
-                "summary": response_text[:200],
-                "total_beds": expected_beds,
-                "occupied_beds": 0,
-                "empty_beds": 0,
-                "empty_spots": [],
-                "raw_response": response_text
-            }
-        
         return JSONResponse({
             "success": True,
-            "analysis": analysis
+            "analysis": analysis,
+            "cached": cache_status
         })
         
+    except ModelError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=e.status_code)
     except Exception as e:
         return JSONResponse({
             "success": False,
             "error": str(e)
         }, status_code=500)
 
+@app.post("/api/analyze-ward-presence/batch")
+async def analyze_ward_presence_batch(
+    images: List[UploadFile] = File(...),
+    wards: Optional[str] = Form(None),
+    expected_beds: int = 10,
+    stream: str = "ndjson"
+):
+    """
+    Analyze many ward images in one request (a hospital-wide sweep).
+    wards: optional JSON array, one {"ward": name, "expected_beds": n} per image.
+    Streams a record per ward as it finishes, as NDJSON or server-sent events
+    (stream=sse), then a "result" record with the totals.
+    """
+    if not client:
+        return JSONResponse({
+            "success": False,
+            "error": "GEMINI_API_KEY not configured. Please set it in your .env file."
+        }, status_code=500)
+    if stream not in MEDIA_TYPES:
+        return JSONResponse({
+            "success": False,
+            "error": f"stream must be one of {', '.join(MEDIA_TYPES)}"
+        }, status_code=400)
+    if len(images) > WARD_BATCH_MAX_WARDS:
+        return JSONResponse({
+            "success": False,
+            "error": f"At most {WARD_BATCH_MAX_WARDS} images per batch"
+        }, status_code=400)
+    try:
+        labels = json.loads(wards) if wards else [{} for _ in images]
+        if not isinstance(labels, list) or len(labels) != len(images):
+            raise ValueError("wards must be a JSON array with one entry per image")
+        batch = []
+        for index, (image, label) in enumerate(zip(images, labels)):
+            batch.append({
+                "index": index,
+                "ward": label.get("ward") or image.filename,
+                "filename": image.filename,
+                "expected_beds": int(label.get("expected_beds", expected_beds)),
+                "data": await image.read(),
+            })
+    except (ValueError, AttributeError, TypeError) as e:
+        return JSONResponse({
+            "success": False,
+            "error": f"Invalid wards: {e}"
+        }, status_code=400)
+    
+    async def body():
+        async for record in ward_sweep.sweep(batch):
+            yield encode(record, stream)
+    
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[stream], headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
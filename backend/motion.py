@@ -0,0 +1,106 @@
+"""
+Motion gate for pose inference.
+
+Most ward footage is a patient lying still, where pose inference keeps finding
+the same pose. The gate compares each sampled frame with the previous one
+(frame differencing as in main_simple.py, on a small blurred grayscale copy)
+and decides per frame:
+- motion: something moved, run pose inference, and keep running it for
+  hold_seconds after the last motion so the onset of a fall is seen in full;
+- heartbeat: the scene is still, but run inference every heartbeat_seconds;
+- breathing: the scene is still, but run inference every breathing_seconds,
+  so the shoulder signal of a still or sleeping patient keeps being sampled
+  evenly for the breathing rate. The held frames in between make that a
+  sample-and-hold signal at 1 / breathing_seconds: rates below half that
+  (30 per minute at the default 1 s) read true, faster ones alias lower;
+- still: skip inference, the last pose still stands.
+"""
+import cv2
+import numpy as np
+
+class MotionGate:
+    MOTION = "motion"
+    HEARTBEAT = "heartbeat"
+    BREATHING = "breathing"
+    STILL = "still"
+
+    def __init__(self, threshold=0.003, heartbeat_seconds=2.0, hold_seconds=3.0,
+                 width=160, pixel_threshold=25, sample_rate=6.0, breathing_seconds=1.0):
+        """
+        threshold: fraction of pixels that must change between frames to count as motion
+        pixel_threshold: grey-level change for a pixel to count as changed
+        width: frames are downscaled to this width before differencing
+        breathing_seconds: inference interval on still frames, for breathing (0 = none:
+        breathing is held while the patient is still)
+        """
+        self.threshold = threshold
+        self.heartbeat_seconds = heartbeat_seconds
+        self.hold_seconds = hold_seconds
+        self.breathing_seconds = breathing_seconds
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.reset(sample_rate)
+
+    def reset(self, sample_rate):
+        """Start over for a new video, counting heartbeat and hold in samples at sample_rate"""
+        self.heartbeat = max(1, round(self.heartbeat_seconds * sample_rate))
+        self.hold = max(1, round(self.hold_seconds * sample_rate))
+        self.breathing = max(1, round(self.breathing_seconds * sample_rate)) if self.breathing_seconds else None
+        self._prev = None
+        self._hold_left = 0
+        self._since_pose = 0
+        self.last_motion = 0.0
+        self.frames = 0
+        self.inferred = 0
+        self.heartbeats = 0
+        self.breathing_frames = 0
+
+    @property
+    def samples_breathing(self):
+        """Still frames are inferred often enough to measure breathing"""
+        return self.breathing is not None
+
+    def motion(self, frame):
+        """Fraction of pixels that changed since the previous frame (1.0 for the first)"""
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, round(height * self.width / width))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        prev, self._prev = self._prev, gray
+        if prev is None or prev.shape != gray.shape:
+            return 1.0
+        delta = cv2.absdiff(prev, gray)
+        return np.count_nonzero(delta > self.pixel_threshold) / delta.size
+
+    def check(self, frame):
+        """Decide whether this frame needs pose inference: MOTION, HEARTBEAT, BREATHING or STILL"""
+        self.frames += 1
+        self.last_motion = self.motion(frame)
+        if self.last_motion > self.threshold:
+            self._hold_left = self.hold
+
+        if self._hold_left > 0:
+            self._hold_left -= 1
+            decision = self.MOTION
+        elif self._since_pose + 1 >= self.heartbeat:
+            decision = self.HEARTBEAT
+            self.heartbeats += 1
+        elif self.breathing is not None and self._since_pose + 1 >= self.breathing:
+            decision = self.BREATHING
+            self.breathing_frames += 1
+        else:
+            self._since_pose += 1
+            return self.STILL
+
+        self._since_pose = 0
+        self.inferred += 1
+        return decision
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "inferred_frames": self.inferred,
+            "heartbeat_frames": self.heartbeats,
+            "breathing_frames": self.breathing_frames,
+            "skipped_frames": self.frames - self.inferred,
+        }
@@ -0,0 +1,381 @@
+"""
+Offline analysis of whole recordings from their landmark series.
+
+For retrospective review there is no need to run the detectors frame by
+frame: the video is reduced once to a (T, 33, 4) landmark series (NaN rows
+where no pose was found), and every ActivityDetector signal is then computed
+over all T samples with vectorized NumPy. The alerts match what the streaming
+analyze_video produces for the same video and sampling. Landmark series can be
+saved as .npz, so re-scoring a day of recordings takes seconds.
+
+    python offline.py recordings/*.mp4 --fps 4 --save-landmarks
+    python offline.py recordings/*.landmarks.npz --json results.json
+"""
+import argparse
+import json
+from itertools import groupby
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from detector import ActivityDetector, build_alerts, create_pose_landmarker, summarize_alerts
+from episodes import EpisodeEngine
+from kernels import (
+    NUM_LANDMARKS, POSTURE_TYPES, bed_bounds_around, bed_exit_kernel, body_center, displacement,
+    fall_kernel, hip_center, posture_kernel, rapid_movement_kernel, seizure_decision, seizure_points,
+    shoulder_level,
+)
+from sampling import FrameSampler
+from spectral import band_spectrum
+
+_NO_POSE = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+
+class LandmarkRecorder:
+    """Collects the pose of every sampled frame (None if no pose) into a landmark series"""
+
+    def __init__(self):
+        self.poses, self.frames, self.timestamps, self.held = [], [], [], []
+
+    def add(self, frame_number, timestamp, pose, held=False):
+        """held: breathing was held on this frame (see ActivityDetector.next_pose)"""
+        self.poses.append(_NO_POSE if pose is None else pose.copy())
+        self.frames.append(frame_number)
+        self.timestamps.append(timestamp)
+        self.held.append(held)
+
+    def series(self, sample_rate, total_frames, processed_frames, sampling):
+        return {
+            "poses": np.array(self.poses, dtype=np.float32).reshape(-1, NUM_LANDMARKS, 4),
+            "frames": np.array(self.frames, dtype=np.int64),
+            "timestamps": np.array(self.timestamps, dtype=np.float64),
+            "held": np.array(self.held, dtype=bool),
+            "sample_rate": sample_rate,
+            "total_frames": total_frames,
+            "processed_frames": processed_frames,
+            "sampling": sampling,
+        }
+
+def extract_landmarks(file_path, detector, sample_rate=None, stride=5, start_frame=0, end_frame=None,
+                      on_progress=None, should_stop=None, progress_interval=30, recorder=None):
+    """
+    Run pose inference over the sampled frames of a video.
+    Returns a landmark series dict: poses (T, 33, 4) float32 with NaN rows for
+    frames without a pose, frames, timestamps and held (T,), plus sampling info.
+    on_progress(frame_number, total_frames) and should_stop() are called
+    every progress_interval frames. Raises IOError if the video cannot be opened.
+    """
+    cap = cv2.VideoCapture(str(file_path))
+    if not cap.isOpened():
+        raise IOError("Failed to open video")
+
+    recorder = recorder if recorder is not None else LandmarkRecorder()
+    try:
+        sampler = FrameSampler(cap, sample_rate=sample_rate, stride=stride,
+                               start_frame=start_frame, end_frame=end_frame)
+        detector.set_sample_rate(sampler.sample_rate)
+        detector.reset()
+        for frame_number, timestamp, frame, media_msec in sampler:
+            pose = None
+            if detector.pose_detector is not None:
+                pose = detector.next_pose(frame, media_msec if detector.tracking else None)
+            recorder.add(frame_number, timestamp, pose, detector.breathing_held)
+            if frame_number % progress_interval < sampler.step:
+                if on_progress is not None:
+                    on_progress(frame_number, sampler.frame_count)
+                if should_stop is not None and should_stop():
+                    print(f"Landmark extraction stopped at frame {frame_number}")
+                    break
+    finally:
+        cap.release()
+
+    return recorder.series(sampler.sample_rate, sampler.frame_count, sampler.position, sampler.stats())
+
+def save_landmarks(path, series):
+    """Write a landmark series to an .npz file"""
+    np.savez_compressed(path, **dict(series, sampling=json.dumps(series["sampling"])))
+
+def load_landmarks(path):
+    """Read a landmark series written by save_landmarks"""
+    with np.load(path) as data:
+        series = {key: data[key] for key in data.files}
+    for key in ("sample_rate", "total_frames", "processed_frames"):
+        series[key] = series[key].item()
+    series["sampling"] = json.loads(series["sampling"].item())
+    return series
+
+def _forward_fill(values, valid):
+    """
+    Hold the last valid sample through gaps (like SlidingSpectrum.repeat_last).
+    Samples before the first valid one are dropped; returns (filled, offset).
+    """
+    index = np.where(valid, np.arange(len(valid)), -1)
+    np.maximum.accumulate(index, out=index)
+    offset = int(np.argmax(valid))
+    return values[index[offset:]].astype(np.float64), offset
+
+def _windowed_band(filled, positions, window, sample_rate, band, chunk=4096):
+    """band_spectrum of the window ending at each position of a (L, channels) series"""
+    ratio, rms, dominant = (np.zeros(len(positions)) for _ in range(3))
+    if len(filled) < window:
+        return ratio, rms, dominant
+    # (L - window + 1, channels, window) views; chunks bound the FFT memory
+    windows = sliding_window_view(filled, window, axis=0)
+    for i in range(0, len(positions), chunk):
+        part = slice(i, i + chunk)
+        ratio[part], rms[part], dominant[part] = band_spectrum(
+            np.swapaxes(windows[positions[part] - (window - 1)], -1, -2), sample_rate, *band
+        )
+    return ratio, rms, dominant
+
+def _rolling_stats(values, capacity, available):
+    """Mean and population variance of the last min(available[i], capacity) values ending at each index"""
+    sums = np.concatenate([[0.0], np.cumsum(values)])
+    sums_sq = np.concatenate([[0.0], np.cumsum(np.square(values))])
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - capacity, end - available)
+    n = np.maximum(end - start, 1)
+    mean = (sums[end] - sums[start]) / n
+    var = np.maximum(0.0, (sums_sq[end] - sums_sq[start]) / n - np.square(mean))
+    return mean, var
+
+def score_series(poses, sample_rate, detector, bed_region=None, held=None):
+    """
+    Every detector signal for a (T, 33, 4) landmark series in one pass.
+    Returns the columns of ActivityDetector.analyze_pose as (T,) arrays;
+    frames without a pose keep analyze_pose's defaults. held (T,) marks
+    frames whose breathing was held by the motion gate.
+    """
+    total = len(poses)
+    held = np.zeros(total, dtype=bool) if held is None else np.asarray(held, dtype=bool)
+    valid = ~np.isnan(poses[:, 0, 0])
+    signals = {
+        "pose_detected": valid,
+        "fall_detected": np.zeros(total, dtype=bool),
+        "fall_confidence": np.zeros(total),
+        "rapid_movement": np.zeros(total, dtype=bool),
+        "movement_speed": np.zeros(total),
+        "seizure_detected": np.zeros(total, dtype=bool),
+        "seizure_confidence": np.zeros(total),
+        "bed_exit_detected": np.zeros(total, dtype=bool),
+        "bed_exit_distance": np.zeros(total),
+        "abnormal_posture_detected": np.zeros(total, dtype=bool),
+        "posture_confidence": np.zeros(total),
+        "posture_code": np.zeros(total, dtype=np.int8),
+        "breathing_rate": np.zeros(total),
+        "breathing_status": np.full(total, "Unknown", dtype=object),
+    }
+    if not valid.any():
+        return signals
+
+    # Histories only advance on frames with a pose
+    present = poses[valid]
+    count = len(present)
+
+    is_fall, hip_y = fall_kernel(present, detector.fall_threshold)
+    signals["fall_detected"][valid] = is_fall
+    signals["fall_confidence"][valid] = hip_y
+
+    centers = body_center(present).astype(np.float64)
+    is_rapid, speed = rapid_movement_kernel(centers[1:], centers[:-1], detector.rapid_movement_threshold)
+    signals["rapid_movement"][valid] = np.concatenate([[False], is_rapid])
+    signals["movement_speed"][valid] = np.concatenate([[0.0], speed])
+
+    # Seizure: sliding spectrum of shoulder/hip positions, or movement statistics
+    # (over seizure_buffer_size - 1 movements) when the band is above Nyquist
+    is_seizure = np.zeros(count, dtype=bool)
+    seizure_conf = np.zeros(count)
+    points = seizure_points(present).astype(np.float64)
+    window = detector.seizure_spectrum.window
+    if detector.seizure_spectrum.observable:
+        filled, offset = _forward_fill(seizure_points(poses).reshape(total, 8), valid)
+        positions = np.flatnonzero(valid) - offset
+        ready = positions >= window - 1
+        ratio, rms, _ = _windowed_band(filled, positions[ready], window, sample_rate, detector.seizure_band)
+        is_seizure[ready] = (ratio > 0.5) & (rms > 0.01)
+        seizure_conf[ready] = ratio
+    else:
+        movements = np.concatenate([[0.0], displacement(points[1:], points[:-1])])
+        mean, var = _rolling_stats(movements, detector.seizure_buffer_size - 1, np.arange(count))
+        ready = np.arange(count) >= 19  # 20 positions of history, as in detect_seizure
+        is_seizure[ready] = seizure_decision(var[ready], mean[ready])
+        seizure_conf[ready] = var[ready]
+    signals["seizure_detected"][valid] = is_seizure
+    signals["seizure_confidence"][valid] = seizure_conf
+
+    # Bed exit: the bed region is calibrated on the first pose unless preset
+    hips = hip_center(present)
+    first = 0
+    if bed_region is None:
+        bounds = bed_bounds_around(hips[0]).astype(np.float64)
+        first = 1
+    else:
+        bounds = np.array([bed_region['x_min'], bed_region['x_max'], bed_region['y_min'], bed_region['y_max']])
+    is_outside, distance = bed_exit_kernel(hips[first:], bounds)
+    signals["bed_exit_detected"][np.flatnonzero(valid)[first:]] = is_outside
+    signals["bed_exit_distance"][np.flatnonzero(valid)[first:]] = distance
+
+    is_abnormal, posture_conf, code = posture_kernel(present)
+    signals["abnormal_posture_detected"][valid] = is_abnormal
+    signals["posture_confidence"][valid] = posture_conf
+    signals["posture_code"][valid] = code
+
+    # Breathing: dominant frequency of shoulder height over the breathing window,
+    # measured on frames that were not held; each held frame restarts the window
+    signals["breathing_status"][valid & held] = "Paused (still)"
+    measured = valid & ~held
+    if measured.any():
+        window = detector.breathing_spectrum.window
+        filled, offset = _forward_fill(shoulder_level(poses)[:, None], measured)
+        positions = np.flatnonzero(measured) - offset
+        # Samples since the first measured frame after the last held one
+        index = np.arange(total)
+        last_held = np.maximum.accumulate(np.where(held, index, -1))
+        counted = np.cumsum(measured)
+        since_held = counted - np.where(last_held >= 0, counted[np.maximum(last_held, 0)], 0)
+        run_start = np.maximum.accumulate(np.where(measured & (since_held == 1), index, -1))
+        ready = (index - run_start)[measured] >= window - 1
+        ratio, _, dominant = _windowed_band(filled, positions[ready], window, sample_rate, detector.breathing_band)
+        rate = np.where(ratio >= 0.3, dominant * 60, 0.0)
+        status = np.full(len(positions), "Calculating...", dtype=object)
+        status[ready] = np.where(
+            ratio < 0.3, "Irregular",
+            np.where(rate < 12, "Slow (Bradypnea)", np.where(rate > 20, "Fast (Tachypnea)", "Normal")),
+        )
+        breathing_rate = np.zeros(len(positions))
+        breathing_rate[ready] = rate
+        signals["breathing_rate"][measured] = breathing_rate
+        signals["breathing_status"][measured] = status
+
+    return signals
+
+def series_alerts(signals, frames, timestamps, alerts_from_frame=0):
+    """Build the alert list for scored signals, in frame order"""
+    flags = (
+        signals["fall_detected"] | signals["seizure_detected"] | signals["bed_exit_detected"] |
+        signals["abnormal_posture_detected"] | signals["rapid_movement"] |
+        (signals["breathing_rate"] > 0) & ((signals["breathing_rate"] < 10) | (signals["breathing_rate"] > 25))
+    )
+    alerts = []
+    for i in np.flatnonzero(flags & (frames > alerts_from_frame)):
+        activities = {
+            "fall_detected": bool(signals["fall_detected"][i]),
+            "rapid_movement": bool(signals["rapid_movement"][i]),
+            "seizure_detected": bool(signals["seizure_detected"][i]),
+            "bed_exit_detected": bool(signals["bed_exit_detected"][i]),
+            "abnormal_posture_detected": bool(signals["abnormal_posture_detected"][i]),
+            "fall_confidence": float(signals["fall_confidence"][i]),
+            "movement_speed": float(signals["movement_speed"][i]),
+            "seizure_confidence": float(signals["seizure_confidence"][i]),
+            "bed_exit_distance": float(signals["bed_exit_distance"][i]),
+            "posture_confidence": float(signals["posture_confidence"][i]),
+            "posture_type": POSTURE_TYPES[int(signals["posture_code"][i])],
+            "breathing_rate": float(signals["breathing_rate"][i]),
+            "breathing_status": signals["breathing_status"][i],
+            "pose_detected": True
+        }
+        alerts.extend(build_alerts(activities, float(timestamps[i]), int(frames[i])))
+    return alerts
+
+def analyze_series(series, detector, alerts_from_frame=0, bed_region=None):
+    """Score a landmark series and return its alerts"""
+    detector.set_sample_rate(series["sample_rate"])
+    signals = score_series(series["poses"], series["sample_rate"], detector, bed_region, series.get("held"))
+    return series_alerts(signals, series["frames"], series["timestamps"], alerts_from_frame)
+
+def analyze_video_offline(file_path, detector, on_alert=None, on_progress=None, should_stop=None,
+                          sample_rate=None, stride=5, start_frame=0, end_frame=None,
+                          alerts_from_frame=0, bed_region=None, recorder=None, landmarks=None, episodes=None):
+    """
+    Drop-in for detector.analyze_video that extracts the landmark series
+    first and then scores it in one vectorized pass. Alerts are delivered to
+    on_alert only after scoring, and "pipeline" holds stage timings.
+    A landmarks series (e.g. from the landmark cache) replaces extraction,
+    so the video is not decoded at all.
+    """
+    started = time.perf_counter()
+    if landmarks is not None:
+        series = landmarks
+        sampling = dict(series["sampling"], decoded_frames=0, skipped_frames=0, seeks=0)
+    else:
+        series = extract_landmarks(
+            file_path, detector, sample_rate=sample_rate, stride=stride,
+            start_frame=start_frame, end_frame=end_frame, should_stop=should_stop, recorder=recorder,
+            on_progress=None if on_progress is None else (
+                lambda done, total: on_progress(done, total, {"mode": "offline"})
+            ),
+        )
+        sampling = series["sampling"]
+    extracted = time.perf_counter()
+
+    alerts = analyze_series(series, detector, alerts_from_frame, bed_region)
+    engine = None
+    if episodes:
+        engine = EpisodeEngine(**episodes)
+        events = []
+        # Frames without detections can be skipped: episodes end on detection times alone
+        for (frame, timestamp), frame_alerts in groupby(alerts, key=lambda a: (a["frame"], a["timestamp"])):
+            events.extend(engine.feed(list(frame_alerts), timestamp, frame))
+        events.extend(engine.flush())
+        alerts = engine.summaries()
+    else:
+        events = alerts
+    scored = time.perf_counter()
+    if on_alert is not None:
+        for event in events:
+            on_alert(event)
+
+    print(f"Offline analysis of {file_path}: {len(series['frames'])} samples, {len(alerts)} alerts "
+          f"(extract {extracted - started:.1f}s, score {scored - extracted:.2f}s)")
+    result = {
+        "total_frames": series["total_frames"],
+        "processed_frames": series["processed_frames"],
+        "sampling": sampling,
+        "pipeline": {
+            "mode": "offline",
+            "landmarks": "cached" if landmarks is not None else "extracted",
+            "stage_seconds": {"extract": round(extracted - started, 3), "score": round(scored - extracted, 3)},
+        },
+        "alerts": alerts,
+        "summary": summarize_alerts(alerts)
+    }
+    if engine is not None:
+        result["episodes"] = engine.stats()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score recordings offline from their landmark series")
+    parser.add_argument("inputs", nargs="+", help="video files, or .npz landmark series from --save-landmarks")
+    parser.add_argument("--fps", type=float, default=None, help="analyses per second (overrides --stride)")
+    parser.add_argument("--stride", type=int, default=5, help="analyse every Nth frame")
+    parser.add_argument("--save-landmarks", action="store_true",
+                        help="write <video>.landmarks.npz next to each video")
+    parser.add_argument("--json", help="write all results to this file")
+    args = parser.parse_args()
+
+    detector = None
+    results = {}
+    for path in args.inputs:
+        started = time.perf_counter()
+        if path.endswith(".npz"):
+            detector = detector or ActivityDetector()
+            series = load_landmarks(path)
+        else:
+            if detector is None or detector.pose_detector is None:
+                detector = ActivityDetector(create_pose_landmarker())
+            series = extract_landmarks(path, detector, sample_rate=args.fps, stride=args.stride)
+            if args.save_landmarks:
+                save_landmarks(str(Path(path).with_suffix(".landmarks.npz")), series)
+        alerts = analyze_series(series, detector)
+        results[path] = {"alerts": alerts, "summary": summarize_alerts(alerts)}
+        print(f"{path}: {len(series['frames'])} samples in {time.perf_counter() - started:.2f}s, "
+              f"{results[path]['summary']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Staged video analysis pipeline.
+
+    decoder thread --frames--> inference (caller's thread) --alerts--> emitter thread
+
+The frame queue is bounded, so decoding runs at most a few frames ahead of
+inference and blocks when inference falls behind. OpenCV decoding and MediaPipe
+inference both release the GIL, so the two stages overlap. The alert queue is
+bounded too, but inference never waits on it: when the emitter (alert delivery)
+falls behind, the oldest undelivered alerts are dropped from live delivery.
+They are still in the returned alert list.
+"""
+import queue
+import threading
+import time
+
+_DONE = object()
+
+class StageQueue(queue.Queue):
+    """Bounded queue that remembers its peak depth"""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.max_depth = 0
+
+    def _put(self, item):
+        super()._put(item)
+        self.max_depth = max(self.max_depth, len(self.queue))
+
+    def stats(self):
+        return {"depth": self.qsize(), "max_depth": self.max_depth, "capacity": self.maxsize}
+
+class VideoPipeline:
+    def __init__(self, sampler, detector, build_alerts, on_alert=None,
+                 frame_queue_size=8, alert_queue_size=256):
+        """
+        sampler: iterable of (frame_number, timestamp, frame, media_msec), e.g. FrameSampler
+        detector: ActivityDetector used by the inference stage
+        build_alerts: function(activities, timestamp, frame_number) -> [alert]
+        on_alert: called on the emitter thread for each alert
+        """
+        self.sampler = sampler
+        self.detector = detector
+        self.build_alerts = build_alerts
+        self.on_alert = on_alert
+        self.frames = StageQueue(frame_queue_size)
+        self.alert_queue = StageQueue(alert_queue_size)
+        self.alerts = []
+        self.dropped_alerts = 0
+        self.stage_time = {"decode": 0.0, "inference": 0.0, "emit": 0.0}
+        self._stop = threading.Event()
+        self._decode_error = None
+
+    def run(self, on_progress=None, should_stop=None, progress_interval=30):
+        """
+        Run all stages to completion and return the alert list.
+        on_progress(frame_number) and should_stop() are called from the
+        inference stage about every progress_interval source frames.
+        """
+        decoder = threading.Thread(target=self._decode, name="video-decode", daemon=True)
+        emitter = threading.Thread(target=self._emit, name="alert-emit", daemon=True)
+        decoder.start()
+        emitter.start()
+
+        last_progress = 0
+        try:
+            while True:
+                item = self.frames.get()
+                if item is _DONE:
+                    break
+                frame_count, timestamp, frame, media_msec = item
+
+                if frame_count - last_progress >= progress_interval:
+                    last_progress = frame_count
+                    if on_progress is not None:
+                        on_progress(frame_count)
+                    if should_stop is not None and should_stop():
+                        print(f"Processing stopped at frame {frame_count}")
+                        break
+
+                started = time.perf_counter()
+                activities, _ = self.detector.analyze_frame(
+                    frame, timestamp_ms=media_msec if self.detector.tracking else None
+                )
+                self.stage_time["inference"] += time.perf_counter() - started
+
+                # Debug logging
+                if activities["pose_detected"]:
+                    print(f"Frame {frame_count}: Pose detected, Movement speed: {activities['movement_speed']:.4f}")
+
+                for alert in self.build_alerts(activities, timestamp, frame_count):
+                    self.alerts.append(alert)
+                    self._enqueue_alert(alert)
+        finally:
+            self._stop.set()
+            self._drain(self.frames)
+            decoder.join()
+            self.alert_queue.put(_DONE)
+            emitter.join()
+
+        if self._decode_error is not None:
+            raise self._decode_error
+        return self.alerts
+
+    def _decode(self):
+        try:
+            started = time.perf_counter()
+            for item in self.sampler:
+                self.stage_time["decode"] += time.perf_counter() - started
+                if not self._put_frame(item):
+                    return
+                started = time.perf_counter()
+        except Exception as e:
+            self._decode_error = e
+        finally:
+            self._put_frame(_DONE)
+
+    def _put_frame(self, item):
+        """Block while the frame queue is full; False once the pipeline stops"""
+        while not self._stop.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _enqueue_alert(self, alert):
+        if self.on_alert is None:
+            return
+        while True:
+            try:
+                self.alert_queue.put_nowait(alert)
+                return
+            except queue.Full:
+                # Never block inference on delivery: drop the oldest alert
+                try:
+                    self.alert_queue.get_nowait()
+                    self.dropped_alerts += 1
+                except queue.Empty:
+                    pass
+
+    def _emit(self):
+        while True:
+            alert = self.alert_queue.get()
+            if alert is _DONE:
+                return
+            started = time.perf_counter()
+            try:
+                self.on_alert(alert)
+            except Exception as e:
+                print(f"Alert delivery failed: {e}")
+            self.stage_time["emit"] += time.perf_counter() - started
+
+    @staticmethod
+    def _drain(q):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+
+    def stats(self):
+        return {
+            "queues": {
+                "frames": self.frames.stats(),
+                "alerts": self.alert_queue.stats(),
+            },
+            "stage_seconds": {name: round(seconds, 3) for name, seconds in self.stage_time.items()},
+            "dropped_alerts": self.dropped_alerts,
+        }
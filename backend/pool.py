@@ -0,0 +1,188 @@
+"""
+Pool of PoseLandmarker instances.
+
+A PoseLandmarker is not safe to call from several threads at once, and one
+instance shared behind a lock serialises every stream. LandmarkerPool creates
+a fixed number of landmarkers up front, runs one warm-up inference through
+each (the first call pays for graph and delegate initialisation), and lends
+them out:
+- IMAGE pools are checked out per frame: the pool's detect() is a drop-in
+  for a landmarker's, so an ActivityDetector can use the pool directly;
+- VIDEO pools are leased per stream with acquire(), because tracking state
+  and timestamps belong to one stream. Closing the lease returns it, and a
+  landmarker that tracked a stream is replaced by a fresh, warmed-up one
+  before it is lent again, so no stream starts from another's last pose.
+
+Every checkout records how long it waited and how long it was held, so
+stats() shows whether the pool is what streams are queueing on.
+"""
+import threading
+import time
+from collections import deque
+
+import mediapipe as mp
+import numpy as np
+
+from buffers import RingBuffer
+from detector import create_pose_landmarker
+
+class PooledLandmarker:
+    """A landmarker lent out by a LandmarkerPool; close() gives it back"""
+
+    def __init__(self, pool, landmarker):
+        self._pool = pool
+        self.landmarker = landmarker
+        self.acquired_at = None
+        # VIDEO mode: timestamps must keep increasing across every stream that
+        # borrows this landmarker, so each lease's timestamps are shifted past
+        # the last one used
+        self._offset = 0
+        self._last_timestamp = -1
+        self.tracked = False  # detect_for_video ran since the landmarker was created
+
+    def detect(self, image):
+        return self.landmarker.detect(image)
+
+    def detect_for_video(self, image, timestamp_ms):
+        timestamp_ms = int(timestamp_ms) + self._offset
+        if timestamp_ms <= self._last_timestamp:
+            self._offset += self._last_timestamp + 1 - timestamp_ms
+            timestamp_ms = self._last_timestamp + 1
+        self._last_timestamp = timestamp_ms
+        self.tracked = True
+        return self.landmarker.detect_for_video(image, timestamp_ms)
+
+    def close(self):
+        self._pool.release(self)
+
+class LandmarkerPool:
+    def __init__(self, size=2, running_mode="IMAGE", name="pose", factory=None, wait_window=1024):
+        """
+        size: landmarkers created by start()
+        factory(running_mode): creates one landmarker (default create_pose_landmarker)
+        """
+        self.size = size
+        self.running_mode = running_mode
+        self.name = name
+        self.factory = factory or (lambda mode: create_pose_landmarker(running_mode=mode))
+        self._free = []  # popped from the end: the most recently used landmarker is the warmest
+        self._waiters = deque()  # one-item lists a release hands its landmarker to, oldest first
+        self._leases = []
+        self._lock = threading.Condition()
+        self._waits = RingBuffer(wait_window)
+        self.started_at = None
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.renewals = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        """Create and warm up every landmarker; raises if none can be created"""
+        started = time.perf_counter()
+        try:
+            for _ in range(self.size):
+                lease = PooledLandmarker(self, self.factory(self.running_mode))
+                self._leases.append(lease)
+                self._warm_up(lease)
+                self._free.append(lease)
+        except Exception:
+            self.close()
+            raise
+        self.started_at = time.monotonic()
+        print(f"Landmarker pool '{self.name}': {self.size} {self.running_mode} landmarkers "
+              f"ready in {time.perf_counter() - started:.1f}s")
+        return self
+
+    def _warm_up(self, lease):
+        blank = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.zeros((64, 64, 3), dtype=np.uint8))
+        if self.running_mode == "VIDEO":
+            lease.detect_for_video(blank, 0)
+            lease.tracked = False
+        else:
+            lease.detect(blank)
+
+    def _renew(self, lease):
+        """Give a lease a fresh landmarker, without the tracking state of its last stream"""
+        try:
+            landmarker = self.factory(self.running_mode)
+        except Exception as e:
+            print(f"Warning: landmarker pool '{self.name}' could not renew a landmarker, reusing it: {e}")
+            return
+        old, lease.landmarker = lease.landmarker, landmarker
+        old.close()
+        lease._offset = 0
+        lease._last_timestamp = -1
+        self._warm_up(lease)
+        self.renewals += 1
+
+    def acquire(self, timeout=None):
+        """
+        Check out a landmarker, waiting up to timeout seconds (None = forever).
+        Waiters are served first come, first served. Raises TimeoutError if
+        none became free.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._free and not self._waiters:
+                lease = self._free.pop()
+            else:
+                slot = [None]
+                self._waiters.append(slot)
+                if not self._lock.wait_for(lambda: slot[0] is not None, timeout):
+                    self._waiters.remove(slot)
+                    self.timeouts += 1
+                    raise TimeoutError(f"No free landmarker in pool '{self.name}' ({self.size} in use)")
+                lease = slot[0]
+            self.acquisitions += 1
+            self._waits.append((time.perf_counter() - started) * 1000)
+            lease.acquired_at = time.monotonic()
+        return lease
+
+    def release(self, lease):
+        if lease.tracked:
+            self._renew(lease)
+        with self._lock:
+            self.busy_seconds += time.monotonic() - lease.acquired_at
+            lease.acquired_at = None
+            if self._waiters:
+                # Hand over directly, so a thread releasing and re-acquiring can't jump the queue
+                self._waiters.popleft()[0] = lease
+                self._lock.notify_all()
+            else:
+                self._free.append(lease)
+
+    def detect(self, image):
+        """Run one IMAGE-mode inference on whichever landmarker is free first"""
+        lease = self.acquire()
+        try:
+            return lease.detect(image)
+        finally:
+            lease.close()
+
+    def close(self):
+        for lease in self._leases:
+            lease.landmarker.close()
+        self._leases = []
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            in_use = [lease for lease in self._leases if lease.acquired_at is not None]
+            busy = self.busy_seconds + sum(now - lease.acquired_at for lease in in_use)
+            waits = self._waits.view()
+            wait = {}
+            if len(waits):
+                p50, p95 = np.percentile(waits, [50, 95])
+                wait = {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "max": round(float(waits.max()), 2)}
+            elapsed = now - self.started_at if self.started_at is not None else 0.0
+            return {
+                "size": len(self._leases),
+                "running_mode": self.running_mode,
+                "in_use": len(in_use),
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "renewals": self.renewals,
+                # Fraction of landmarker-time spent checked out since start
+                "utilization": round(busy / (elapsed * len(self._leases)), 3) if elapsed and self._leases else 0.0,
+                "wait_ms": wait,
+            }
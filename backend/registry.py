@@ -0,0 +1,106 @@
+"""
+Registry of per-stream ActivityDetector instances.
+
+Each stream (video job, camera or bed) gets its own detector so concurrent
+analyses never share position, seizure or breathing history. Idle streams are
+evicted after a timeout and the registry holds at most max_streams detectors;
+each detector's histories are already capped by its buffer sizes. A detector
+pinned by a running job (get with pin=True, until release or evict) is never
+evicted, however long the job goes without asking for it again.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from detector import ActivityDetector
+
+class DetectorRegistry:
+    def __init__(self, pose_detector=None, idle_timeout=300.0, max_streams=256, pose_lock=None):
+        self.pose_detector = pose_detector
+        self.pose_lock = pose_lock
+        self.idle_timeout = idle_timeout
+        self.max_streams = max_streams
+        self._detectors = OrderedDict()  # stream_id -> [detector, last_used, pins]
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.created = 0
+        self.evicted = 0
+
+    def get(self, stream_id, create=True, pin=False):
+        """Return the detector for stream_id, creating it if needed; pin holds it until release"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep > self.idle_timeout / 4:
+                self._evict_idle_locked(now)
+
+            entry = self._detectors.get(stream_id)
+            if entry is not None:
+                entry[1] = now
+                entry[2] += pin
+                self._detectors.move_to_end(stream_id)
+                return entry[0]
+            if not create:
+                return None
+
+            # Make room by dropping the least recently used stream not in use
+            unpinned = iter([old_id for old_id, (_, _, pins) in self._detectors.items() if not pins])
+            while len(self._detectors) >= self.max_streams:
+                old_id = next(unpinned, None)
+                if old_id is None:
+                    # Every stream is pinned: go over max_streams rather than drop one in use
+                    break
+                del self._detectors[old_id]
+                self.evicted += 1
+                print(f"Detector registry full, evicted stream {old_id}")
+
+            detector = ActivityDetector(self.pose_detector, pose_lock=self.pose_lock)
+            self._detectors[stream_id] = [detector, now, int(pin)]
+            self.created += 1
+            return detector
+
+    def release(self, stream_id):
+        """Unpin a stream's detector; its idle time counts from now"""
+        with self._lock:
+            entry = self._detectors.get(stream_id)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                entry[2] = max(0, entry[2] - 1)
+
+    def evict(self, stream_id):
+        """Drop a stream's detector; returns True if it existed"""
+        with self._lock:
+            if self._detectors.pop(stream_id, None) is None:
+                return False
+            self.evicted += 1
+            return True
+
+    def evict_idle(self):
+        """Drop every stream unused for longer than idle_timeout"""
+        with self._lock:
+            return self._evict_idle_locked(time.monotonic())
+
+    def _evict_idle_locked(self, now):
+        self._last_sweep = now
+        idle = [
+            stream_id for stream_id, (_, last_used, pins) in self._detectors.items()
+            if not pins and now - last_used > self.idle_timeout
+        ]
+        for stream_id in idle:
+            del self._detectors[stream_id]
+        self.evicted += len(idle)
+        return idle
+
+    def __contains__(self, stream_id):
+        return stream_id in self._detectors
+
+    def __len__(self):
+        return len(self._detectors)
+
+    def stats(self):
+        return {
+            "streams": len(self._detectors),
+            "pinned": sum(1 for _, _, pins in self._detectors.values() if pins),
+            "max_streams": self.max_streams,
+            "created": self.created,
+            "evicted": self.evicted,
+        }
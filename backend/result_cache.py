@@ -0,0 +1,140 @@
+"""
+Result cache for ward image analysis.
+
+Nurse stations send the same snapshot again and again, and each analysis is a
+Gemini call. Results are cached under a key built from the image content, the
+prompt text (so a changed prompt never reuses old answers) and the request
+parameters, with a TTL and an LRU bound. Concurrent requests for the same key
+share one upstream call (single flight): the first computes, the others
+await its result.
+
+Keys use the SHA-256 of the image bytes. With perceptual=True they use a
+difference hash of the picture instead, so a re-encoded or resized copy of the
+same snapshot hits too; that can also match two nearly identical snapshots,
+so it is off by default.
+"""
+import asyncio
+import hashlib
+import io
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+def image_hash(data, perceptual=False):
+    """Hex digest of an image: SHA-256 of the bytes, or a 64-bit difference hash of the picture"""
+    if not perceptual:
+        return hashlib.sha256(data).hexdigest()
+    # dHash: is each pixel of a 9x8 grayscale thumbnail brighter than its right neighbour
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", (64, 64))  # JPEGs decode at 1/8 scale: plenty for a 9x8 thumbnail
+    pixels = image.convert("L").resize((9, 8), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"d{bits:016x}"
+
+def cache_key(*parts):
+    """One key from the endpoint, prompt, parameters and image hashes"""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+
+class ResultCache:
+    def __init__(self, max_entries=512, ttl=600.0, perceptual=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self._entries = OrderedDict()  # key -> (stored at, result, seconds it took to compute)
+        self._in_flight = {}  # key -> task of the call computing it
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, *fallback_keys):
+        """The cached result under key, else under the first fallback key that has one, or None (one miss)"""
+        entry = self._lookup(key)
+        for fallback in fallback_keys:
+            if entry is not None:
+                break
+            entry = self._lookup(fallback)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_seconds += entry[2]
+        return entry[1]
+
+    def put(self, key, result, compute_seconds=0.0):
+        """Store a result computed outside get_or_compute, e.g. for several keys in one call"""
+        self._entries[key] = (time.monotonic(), result, compute_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(self, key, compute, cacheable=lambda result: True):
+        """
+        Return (result, status): a cached result ("hit"), the result of an
+        identical call already in flight ("shared"), or await compute() ("miss").
+        Only results passing cacheable(result) are stored; errors are not.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            self.saved_seconds += entry[2]
+            return entry[1], "hit"
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            status = "miss"
+            # A task of its own: a requester that goes away doesn't cancel the call for the others
+            task = self._in_flight[key] = asyncio.ensure_future(self._compute(key, compute, cacheable))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.shared += 1
+            status = "shared"
+        waited = time.monotonic()
+        result, elapsed = await asyncio.shield(task)
+        if status == "shared":
+            self.saved_seconds += max(0.0, elapsed - (time.monotonic() - waited))
+        return result, status
+
+    async def _compute(self, key, compute, cacheable):
+        started = time.monotonic()
+        try:
+            result = await compute()
+        finally:
+            del self._in_flight[key]
+        elapsed = time.monotonic() - started
+        if cacheable(result):
+            self.put(key, result, elapsed)
+        return result, elapsed
+
+    def stats(self):
+        lookups = self.hits + self.shared + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "perceptual": self.perceptual,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "shared": self.shared,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.shared) / lookups, 3) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 2),
+        }
@@ -0,0 +1,124 @@
+"""
+Person-centred crop for pose inference.
+
+A ceiling camera frame is mostly bed, floor and wall. PoseROI crops each frame
+around the last pose (or the calibrated bed region before there is one), with
+a margin, and downscales the crop to the model's input size before the colour
+conversion, so neither cvtColor nor MediaPipe touch pixels the model would
+throw away. Landmarks found in the crop are mapped back to full-frame
+normalized coordinates, so the detectors never see the crop.
+
+The crop box only moves when the pose nears its edge or shrinks well inside
+it, which keeps the image stable for VIDEO-mode tracking. When the crop
+loses the pose, frames are searched whole until the pose is found again.
+"""
+import cv2
+import numpy as np
+
+class PoseROI:
+    def __init__(self, margin=0.3, input_size=256, full_size=640):
+        """
+        margin: added around the pose bounding box on each side, as a fraction of its larger side
+        input_size: longest side of a crop handed to the model (the landmark model's input is 256)
+        full_size: longest side of an uncropped frame (the person may be small in it)
+        """
+        self.margin = margin
+        self.input_size = input_size
+        self.full_size = full_size
+        self.reset()
+
+    def reset(self):
+        self._box = None  # normalized (x0, y0, x1, y1), or None for the whole frame
+        self._lost = False  # a crop lost the pose: search whole frames until it is found
+        self.frames = 0
+        self.cropped = 0
+        self.misses = 0
+        self.pixels_in = 0
+        self.pixels_out = 0
+
+    def _around(self, x0, y0, x1, y1):
+        """(x0, y0, x1, y1) grown by the margin and clipped to the frame; None if it covers most of it"""
+        pad = self.margin * max(x1 - x0, y1 - y0)
+        box = (max(0.0, x0 - pad), max(0.0, y0 - pad), min(1.0, x1 + pad), min(1.0, y1 + pad))
+        if (box[2] - box[0]) * (box[3] - box[1]) > 0.8:
+            return None
+        return box
+
+    def crop(self, frame, bed_region=None):
+        """
+        Return (image, box): the BGR crop to run inference on, downscaled,
+        and the normalized box it was cut from (None for the whole frame).
+        """
+        if self._box is None and bed_region is not None and not self._lost:
+            # Before the first pose: the calibrated bed area (hip bounds), grown
+            # by the margin and by its own size to take in the whole body
+            self._box = self._around(
+                bed_region['x_min'] - (bed_region['x_max'] - bed_region['x_min']) / 2,
+                bed_region['y_min'] - (bed_region['y_max'] - bed_region['y_min']) / 2,
+                bed_region['x_max'] + (bed_region['x_max'] - bed_region['x_min']) / 2,
+                bed_region['y_max'] + (bed_region['y_max'] - bed_region['y_min']) / 2,
+            )
+        box = self._box
+        height, width = frame.shape[:2]
+        if box is not None:
+            left, top = int(box[0] * width), int(box[1] * height)
+            right, bottom = max(left + 1, int(np.ceil(box[2] * width))), max(top + 1, int(np.ceil(box[3] * height)))
+            # Normalized box of the pixels actually cut
+            box = (left / width, top / height, right / width, bottom / height)
+            image = frame[top:bottom, left:right]
+            self.cropped += 1
+        else:
+            image = frame
+        limit = self.input_size if box is not None else self.full_size
+
+        self.frames += 1
+        self.pixels_in += height * width
+        crop_height, crop_width = image.shape[:2]
+        scale = limit / max(crop_height, crop_width)
+        if scale < 1:
+            size = (max(1, round(crop_width * scale)), max(1, round(crop_height * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        self.pixels_out += image.shape[0] * image.shape[1]
+        return image, box
+
+    def restore(self, pose, box):
+        """
+        Map a (33, 4) pose found in the crop back to full-frame normalized
+        coordinates in place (pose is None if none was found), and move the
+        box for the next frame.
+        """
+        if pose is None:
+            if box is not None:
+                self.misses += 1
+                self._lost = True
+            self._box = None
+            return None
+        self._lost = False
+        if box is not None:
+            crop_width, crop_height = box[2] - box[0], box[3] - box[1]
+            pose[:, 0] = box[0] + pose[:, 0] * crop_width
+            pose[:, 1] = box[1] + pose[:, 1] * crop_height
+            pose[:, 2] *= crop_width  # z is on the scale of x
+
+        # Keep the box while the pose stays well inside it
+        x0, y0 = np.clip(pose[:, :2].min(axis=0), 0.0, 1.0)
+        x1, y1 = np.clip(pose[:, :2].max(axis=0), 0.0, 1.0)
+        current = self._box
+        if current is not None:
+            pad = self.margin * max(x1 - x0, y1 - y0) / 2
+            inside = (x0 - pad >= current[0] and y0 - pad >= current[1] and
+                      x1 + pad <= current[2] and y1 + pad <= current[3])
+            shrunk = (x1 - x0) * (y1 - y0) < 0.25 * (current[2] - current[0]) * (current[3] - current[1])
+            if inside and not shrunk:
+                return pose
+        self._box = self._around(x0, y0, x1, y1)
+        return pose
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "cropped_frames": self.cropped,
+            "crop_misses": self.misses,
+            "frame_pixels": self.pixels_in,
+            "model_pixels": self.pixels_out,
+        }
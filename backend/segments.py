@@ -0,0 +1,97 @@
+"""
+Splitting long recordings into frame-range segments for parallel analysis.
+
+Each segment starts decoding warmup_samples samples before its own range so the
+detector histories (positions, seizure and breathing buffers) are full again
+when its first real frame arrives; alerts from the warm-up part are dropped.
+The bed region is found once from the start of the video and handed to every
+segment, because a sequential run calibrates it on the first detected pose.
+Together these make segment results match a sequential run, as long as pose
+dropouts inside a warm-up window don't exceed its slack.
+"""
+import cv2
+
+from detector import summarize_alerts
+from episodes import join_episodes
+from sampling import FrameSampler
+
+def warmup_samples(detector, slack=1.5):
+    """Samples needed to refill the largest detector history, with slack for dropouts"""
+    largest = max(detector.frame_buffer_size, detector.seizure_buffer_size,
+                  detector.breathing_spectrum.window, detector.seizure_spectrum.window)
+    return int(largest * slack)
+
+def plan_segments(total_frames, step, segment_frames, max_segments, warmup):
+    """
+    Split frames 1..total_frames into segments of at least segment_frames.
+    Returns dicts with start_frame/end_frame (the segment's own range, as
+    (start, end]) and warmup_frame, where decoding starts.
+    """
+    if total_frames <= 0 or segment_frames <= 0:
+        return [{"start_frame": 0, "end_frame": None, "warmup_frame": 0}]
+
+    count = max(1, min(max_segments, total_frames // segment_frames))
+    bounds = [round(i * total_frames / count) for i in range(count + 1)]
+    warmup_span = int(warmup * step + 0.5)
+
+    segments = []
+    for i in range(count):
+        start, end = bounds[i], bounds[i + 1]
+        segments.append({
+            "start_frame": start,
+            "end_frame": end if i < count - 1 else None,  # last one reads to EOF
+            "warmup_frame": max(0, start - warmup_span),
+        })
+    return segments
+
+def find_bed_region(file_path, detector, sample_rate=None, stride=5, end_frame=None):
+    """Calibrate the bed region the way a sequential run would: on the first detected pose"""
+    cap = cv2.VideoCapture(str(file_path))
+    if not cap.isOpened():
+        raise IOError("Failed to open video")
+
+    try:
+        sampler = FrameSampler(cap, sample_rate=sample_rate, stride=stride, end_frame=end_frame)
+        detector.set_sample_rate(sampler.sample_rate)
+        detector.reset()
+        for _, _, frame, media_msec in sampler:
+            detector.analyze_frame(frame, timestamp_ms=media_msec if detector.tracking else None)
+            if detector.bed_region is not None:
+                return dict(detector.bed_region)
+    finally:
+        cap.release()
+    return None
+
+def merge_segment_results(results, total_frames, episodes=None):
+    """
+    Combine per-segment analyze_video results into one, alerts in timestamp
+    order. With episodes (the EpisodeEngine options the segments ran with),
+    episodes split by a segment boundary are joined.
+    """
+    alerts = sorted(
+        (alert for result in results for alert in result["alerts"]),
+        key=lambda alert: (alert["timestamp"], alert["frame"]),
+    )
+    if episodes:
+        alerts = join_episodes(alerts, episodes.get("rules"))
+
+    sampling = dict(results[0]["sampling"])
+    for key in ("decoded_frames", "skipped_frames", "seeks"):
+        sampling[key] = sum(result["sampling"][key] for result in results)
+
+    merged = {
+        "total_frames": total_frames,
+        "processed_frames": results[-1]["processed_frames"],
+        "segments": len(results),
+        "sampling": sampling,
+        "pipeline": [result["pipeline"] for result in results],
+        "alerts": alerts,
+        "summary": summarize_alerts(alerts)
+    }
+    for name in ("motion_gate", "roi", "episodes"):
+        counters = [result[name] for result in results if name in result]
+        if counters:
+            merged[name] = {key: sum(stats[key] for stats in counters) for key in counters[0]}
+    if episodes and "episodes" in merged:
+        merged["episodes"]["episodes"] = len(alerts)
+    return merged
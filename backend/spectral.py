@@ -0,0 +1,154 @@
+"""
+Sliding-window spectral features for breathing and seizure detection.
+
+SlidingSpectrum keeps a sliding DFT of one or more signals over the last
+`window` samples, updated in O(bins) per sample and limited to the bins inside
+a frequency band. It knows the real sample rate, so band limits are in Hz and
+stay correct at any frame stride. Bands above the Nyquist frequency are
+clipped; a band that is entirely above it is reported as not observable.
+band_spectrum computes the same features for a whole batch of windows at once.
+"""
+import numpy as np
+
+from buffers import RingBuffer
+
+def band_bins(window, sample_rate, low_hz, high_hz):
+    """Indices and frequencies of the one-sided DFT bins inside [low_hz, high_hz]"""
+    freqs = np.arange(window // 2 + 1) * sample_rate / window
+    # Skip DC and Nyquist: only the bins in between stand for two frequencies
+    usable = (freqs > 0) & (freqs < sample_rate / 2)
+    bins = np.flatnonzero(usable & (freqs >= low_hz) & (freqs <= high_hz))
+    return bins, freqs[bins]
+
+class SlidingSpectrum:
+    def __init__(self, window, sample_rate, low_hz, high_hz, channels=1):
+        self.window = window
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bins, self.freqs = band_bins(window, sample_rate, low_hz, high_hz)
+        self._twiddle = np.exp(2j * np.pi * self.bins / window)
+        self._samples = RingBuffer(window, (channels,))
+        self._spectrum = np.zeros((channels, len(self.bins)), dtype=np.complex128)
+        self._sum = np.zeros(channels)
+        self._sum_sq = np.zeros(channels)
+        self._delta = np.zeros(channels)
+        self._since_resync = 0
+
+    @property
+    def observable(self):
+        """False when the whole band lies above the Nyquist frequency"""
+        return len(self.bins) > 0
+
+    @property
+    def ready(self):
+        """A full window has been seen (partial windows are zero-padded)"""
+        return self._samples.is_full()
+
+    def append(self, values):
+        """Add one sample per channel"""
+        values = np.asarray(values, dtype=np.float64).reshape(self.channels)
+        if self._samples.is_full():
+            oldest = self._samples.oldest()
+            np.subtract(values, oldest, out=self._delta)
+            self._sum -= oldest
+            self._sum_sq -= np.square(oldest)
+        else:
+            self._delta[:] = values
+        self._sum += values
+        self._sum_sq += np.square(values)
+
+        # X_k <- (X_k - x_oldest + x_new) * e^(2 pi i k / N)
+        self._spectrum += self._delta[:, None]
+        self._spectrum *= self._twiddle
+        self._samples.append(values)
+
+        self._since_resync += 1
+        if self._since_resync >= self.window and self._samples.is_full():
+            self._resync()
+
+    def repeat_last(self):
+        """Hold the last sample through a gap (e.g. a frame without a pose)"""
+        if len(self._samples):
+            self.append(self._samples.last().copy())
+
+    def _resync(self):
+        """Recompute exactly once per window so rounding error can't accumulate"""
+        self._since_resync = 0
+        window = self._samples.view()
+        self._spectrum[:] = np.fft.rfft(window, axis=0)[self.bins].T
+        self._sum[:] = window.sum(axis=0)
+        self._sum_sq[:] = np.square(window).sum(axis=0)
+
+    def clear(self):
+        self._samples.clear()
+        self._since_resync = 0
+        self._spectrum[:] = 0
+        self._sum[:] = 0
+        self._sum_sq[:] = 0
+
+    def band_power(self):
+        """(bins,) energy per band bin, summed over channels"""
+        return np.square(np.abs(self._spectrum)).sum(axis=0)
+
+    def ac_energy(self):
+        """Total energy of the window around its mean, summed over channels"""
+        n = self.window
+        return float(np.sum(n * self._sum_sq - np.square(self._sum)))
+
+    def band_ratio(self):
+        """Fraction of the signal's variation that lies inside the band"""
+        total = self.ac_energy()
+        if total <= 0 or not self.observable:
+            return 0.0
+        # One-sided bins stand for both positive and negative frequencies
+        return min(1.0, 2 * float(self.band_power().sum()) / total)
+
+    def band_rms(self):
+        """RMS amplitude of the band-limited part of the signal (per channel average)"""
+        energy = 2 * float(self.band_power().sum()) / self.channels
+        return np.sqrt(energy) / self.window
+
+    def dominant_frequency(self):
+        """Peak frequency in the band in Hz, refined by parabolic interpolation"""
+        if not self.observable:
+            return 0.0
+        return float(_dominant_frequency(self.band_power(), self.freqs, self.sample_rate / self.window))
+
+def _dominant_frequency(power, freqs, resolution):
+    """Peak frequency along the last axis of (..., bins) band power"""
+    last = power.shape[-1] - 1
+    peak = np.argmax(power, axis=-1)[..., None]
+    left = np.take_along_axis(power, np.clip(peak - 1, 0, last), axis=-1)[..., 0]
+    center = np.take_along_axis(power, peak, axis=-1)[..., 0]
+    right = np.take_along_axis(power, np.clip(peak + 1, 0, last), axis=-1)[..., 0]
+    peak = peak[..., 0]
+
+    denominator = left - 2 * center + right
+    interior = (peak > 0) & (peak < last) & (denominator != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(interior, 0.5 * (left - right) / denominator, 0.0)
+    return freqs[peak] + offset * resolution
+
+def band_spectrum(windows, sample_rate, low_hz, high_hz):
+    """
+    Band features for a batch of (..., N, channels) windows in one FFT call.
+    Returns (band_ratio, band_rms, dominant_frequency) over the leading dims.
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    n, channels = windows.shape[-2], windows.shape[-1]
+    bins, freqs = band_bins(n, sample_rate, low_hz, high_hz)
+    shape = windows.shape[:-2]
+    if not len(bins):
+        zeros = np.zeros(shape)
+        return zeros, zeros, zeros
+
+    spectrum = np.fft.rfft(windows, axis=-2)[..., bins, :]
+    power = np.square(np.abs(spectrum)).sum(axis=-1)  # (..., bins)
+    band_energy = 2 * power.sum(axis=-1)
+    ac_energy = (n * np.square(windows).sum(axis=-2) - np.square(windows.sum(axis=-2))).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(ac_energy > 0, np.minimum(1.0, band_energy / ac_energy), 0.0)
+    rms = np.sqrt(band_energy / channels) / n
+
+    dominant = _dominant_frequency(power, freqs, sample_rate / n)
+    return ratio, rms, dominant
@@ -0,0 +1,150 @@
+"""
+Live progress and alerts of a video job, as a stream of JSON records.
+
+JobEventStream subscribes to one job (see VideoJobManager.subscribe) and
+yields, as they happen:
+- {"type": "started", ...} once the job is picked up by a worker;
+- {"type": "progress", "processed_frames", "total_frames", "fps", "eta_seconds", ...};
+- {"type": "alert", ...} for each alert, as soon as the worker raises it;
+- {"type": "result", ...} (or "error" / "cancelled") when the job ends.
+
+Memory per stream stays constant whatever the video length: progress is
+coalesced to the latest record, pending alerts are capped (a slow client is
+told how many were dropped), and the result record carries the summary only;
+the full alert list stays at /api/jobs/{job_id}/result.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+class JobEventStream:
+    def __init__(self, loop, max_pending_alerts=256, heartbeat_seconds=15.0, drain_seconds=5.0):
+        """
+        max_pending_alerts: alerts held for a client that is reading too slowly
+        heartbeat_seconds: idle time after which a heartbeat is sent, so proxies keep the connection
+        drain_seconds: how long to wait, after the job ends, for alerts still in transit from the worker
+        """
+        self._loop = loop
+        self.max_pending_alerts = max_pending_alerts
+        self.heartbeat_seconds = heartbeat_seconds
+        self.drain_seconds = drain_seconds
+        self._wake = asyncio.Event()
+        self._started = None
+        self._progress = None
+        self._alerts = deque()
+        self._finished = None
+        self.alerts_seen = 0
+        self.alerts_dropped = 0
+
+    def attach(self, job):
+        """
+        Catch up with a job subscribed to after it was submitted: its
+        progress so far, or its outcome if it already ended. Call right
+        after subscribing, on the event loop.
+        """
+        self.alerts_seen = job["alert_count"]
+        if job["status"] in ("completed", "failed", "cancelled"):
+            self._finished = job
+        elif job["started_at"] is not None:
+            self._progress = job
+        self._wake.set()
+
+    def __call__(self, kind, job, payload):
+        """Subscriber callback; runs on the job manager's event thread"""
+        self._loop.call_soon_threadsafe(self._push, kind, job, payload)
+
+    def _push(self, kind, job, payload):
+        if kind == "started":
+            self._started = job
+        elif kind == "progress":
+            self._progress = job
+        elif kind == "alert":
+            self.alerts_seen += 1
+            if len(self._alerts) >= self.max_pending_alerts:
+                self.alerts_dropped += 1
+            else:
+                self._alerts.append(payload)
+        elif kind == "finished":
+            self._finished = job
+        self._wake.set()
+
+    @staticmethod
+    def progress_record(job):
+        processed, total = job["processed_frames"], job["total_frames"]
+        record = {"type": "progress", "job_id": job["job_id"], "processed_frames": processed,
+                  "total_frames": total, "fps": None, "eta_seconds": None,
+                  "percent": round(100.0 * processed / total, 1) if total else None}
+        started = job["started_at"]
+        elapsed = (datetime.now() - datetime.fromisoformat(started)).total_seconds() if started else 0.0
+        if processed and elapsed > 0:
+            fps = processed / elapsed
+            record["fps"] = round(fps, 1)
+            if total:
+                record["eta_seconds"] = round(max(0, total - processed) / fps, 1)
+        return record
+
+    @staticmethod
+    def final_record(job):
+        if job["status"] == "completed":
+            result = job["result"]
+            record = {"type": "result", "success": True, "job_id": job["job_id"]}
+            record.update({key: value for key, value in result.items() if key != "alerts"})
+            record["alert_count"] = len(result.get("alerts", []))
+            return record
+        if job["status"] == "cancelled":
+            return {"type": "cancelled", "success": False, "job_id": job["job_id"]}
+        return {"type": "error", "success": False, "job_id": job["job_id"], "error": job["error"]}
+
+    async def records(self):
+        """Yield records until the job ends; None is a heartbeat"""
+        drain_deadline = None
+        while True:
+            if self._started is not None:
+                job, self._started = self._started, None
+                yield {"type": "started", "job_id": job["job_id"], "filename": job["filename"],
+                       "total_frames": job["total_frames"], "started_at": job["started_at"]}
+            while self._alerts:
+                yield dict(self._alerts.popleft(), type="alert")
+            if self._progress is not None:
+                job, self._progress = self._progress, None
+                yield self.progress_record(job)
+
+            if self._finished is not None:
+                job = self._finished
+                expected = 0
+                if job["status"] == "completed":
+                    # With episodes, their start/update/end events were sent rather than the alerts
+                    result = job["result"]
+                    expected = result["episodes"]["events"] if "episodes" in result else len(result["alerts"])
+                if drain_deadline is None:
+                    drain_deadline = time.monotonic() + self.drain_seconds
+                # A worker's last alerts can arrive after its result
+                if self.alerts_seen >= expected or time.monotonic() >= drain_deadline:
+                    if self.alerts_dropped:
+                        yield {"type": "dropped", "job_id": job["job_id"], "alerts": self.alerts_dropped}
+                    yield self.final_record(job)
+                    return
+                timeout = max(0.0, drain_deadline - time.monotonic())
+            else:
+                timeout = self.heartbeat_seconds
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                if self._finished is None:
+                    yield None
+
+def encode(record, mode):
+    """One record as a line of NDJSON or a server-sent event; None encodes a heartbeat"""
+    if mode == "sse":
+        if record is None:
+            return ": heartbeat\n\n"
+        return f"event: {record['type']}\ndata: {json.dumps(record, default=str)}\n\n"
+    if record is None:
+        record = {"type": "heartbeat"}
+    return json.dumps(record, default=str) + "\n"
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from alert_hub import AlertHub, AlertSubscriber, parse_filters
+
+class FakeSocket:
+    def __init__(self, stuck=False):
+        self.sent = []
+        self.closed = False
+        self.stuck = stuck
+
+    async def send_json(self, alert):
+        if self.stuck:
+            await asyncio.sleep(3600)
+        self.sent.append(alert)
+
+    async def close(self):
+        self.closed = True
+
+def alert(number, kind="FALL", stream="bed-1", **fields):
+    return dict({"type": kind, "stream_id": stream, "severity": "HIGH", "n": number}, **fields)
+
+def queued(policy, alerts, queue_size=3):
+    """Offer alerts to a client whose sender isn't running; returns its pending alerts"""
+    subscriber = AlertSubscriber(FakeSocket(), queue_size=queue_size, policy=policy)
+    for item in alerts:
+        subscriber.offer(item)
+    return subscriber, [item["n"] for item in subscriber._pending]
+
+def test_drop_oldest_and_drop_newest():
+    alerts = [alert(n) for n in range(5)]
+    subscriber, pending = queued("drop_oldest", alerts)
+    assert pending == [2, 3, 4] and subscriber.dropped == 2
+    subscriber, pending = queued("drop_newest", alerts)
+    assert pending == [0, 1, 2] and subscriber.dropped == 2
+
+def test_coalesce_replaces_a_pending_alert_of_the_same_source():
+    alerts = [alert(0), alert(1, "SEIZURE"), alert(2, stream="bed-2"), alert(3)]
+    _, pending = queued("coalesce", alerts)
+    assert pending == [1, 2, 3]
+    # Nothing of the same source pending: the oldest goes
+    _, pending = queued("coalesce", alerts[:3] + [alert(4, "BED_EXIT")])
+    assert pending == [1, 2, 4]
+
+def test_disconnect_closes_a_client_that_falls_behind():
+    subscriber, pending = queued("disconnect", [alert(n) for n in range(4)])
+    assert subscriber.closed and pending == [0, 1, 2]
+
+def test_filters():
+    subscriber = AlertSubscriber(FakeSocket(), parse_filters(ward="3, 4", severity="high"))
+    assert subscriber.wants(alert(0, ward="3"))
+    assert not subscriber.wants(alert(0, ward="5"))
+    assert not subscriber.wants(alert(0, ward="3", severity="MEDIUM"))
+    with pytest.raises(ValueError):
+        parse_filters(severity="urgent")
+
+def test_a_stuck_client_does_not_hold_up_the_others():
+    async def run():
+        hub = AlertHub(queue_size=2, send_timeout=0.05)
+        stuck, healthy = FakeSocket(stuck=True), FakeSocket()
+        hub.subscribe(stuck)
+        hub.subscribe(healthy)
+        for number in range(3):
+            hub.publish(alert(number))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.2)
+        hub.publish(alert(3))  # the stuck client timed out and is forgotten
+        await asyncio.sleep(0.01)
+        stats = hub.stats()
+        await hub.close()
+        return stuck, healthy, stats
+
+    stuck, healthy, stats = asyncio.run(run())
+    assert [item["n"] for item in healthy.sent] == [0, 1, 2, 3]
+    assert stuck.closed and stats["clients"] == 1 and stats["published"] == 4
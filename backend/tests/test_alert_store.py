@@ -0,0 +1,71 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import alert_store
+from alert_store import AlertStore, parse_time
+
+HOUR = 3600.0
+DAY_START = 1_700_000_000 // 86400 * 86400.0
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    clock = {"now": DAY_START}
+    monkeypatch.setattr(alert_store, "time", SimpleNamespace(time=lambda: clock["now"], monotonic=time.monotonic))
+    store = AlertStore(tmp_path / "alerts.db", batch_size=7, flush_seconds=0.01).start()
+
+    def add(at, **alert):
+        clock["now"] = DAY_START + at
+        store.add(alert)
+
+    store.add_at = add
+    yield store
+    store.close()
+
+def test_cursor_pages_newest_first_without_gaps(store):
+    for number in range(25):
+        store.add_at(number, type="FALL" if number % 2 else "BED_EXIT", severity="HIGH", bed=str(number % 3), n=number)
+    store.close()
+
+    seen, cursor = [], None
+    while True:
+        page = store.query(limit=10, before_id=cursor)
+        seen += [alert["n"] for alert in page["alerts"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(range(24, -1, -1))
+
+    falls = store.query(type="FALL", bed="1,2", limit=100)["alerts"]
+    assert [alert["n"] for alert in falls] == [n for n in range(24, -1, -1) if n % 2 and n % 3 in (1, 2)]
+    assert [alert["n"] for alert in store.query(start=DAY_START + 20, limit=100)["alerts"]] == [24, 23, 22, 21, 20]
+    assert store.stats()["written"] == 25 and store.stats()["batches"] >= 4
+
+def test_aggregate_counts_per_bucket_and_episodes_once(store):
+    store.add_at(10, type="FALL", bed="1")
+    store.add_at(20, type="FALL", bed="1")
+    store.add_at(HOUR + 5, type="FALL", bed="2")
+    for event in ("start", "update", "end"):
+        store.add_at(HOUR + 30, type="SEIZURE", bed="2", event=event, episode_id="seizure-1")
+    store.close()
+
+    assert store.aggregate("hour", "type") == [
+        {"bucket": DAY_START, "group": "FALL", "count": 2},
+        {"bucket": DAY_START + HOUR, "group": "FALL", "count": 1},
+        {"bucket": DAY_START + HOUR, "group": "SEIZURE", "count": 1},
+    ]
+    assert store.aggregate("day", "bed") == [
+        {"bucket": DAY_START, "group": "1", "count": 2},
+        {"bucket": DAY_START, "group": "2", "count": 2},
+    ]
+    assert store.aggregate("day", "type", event="end") == [{"bucket": DAY_START, "group": "SEIZURE", "count": 1}]
+    with pytest.raises(ValueError):
+        store.aggregate("week")
+
+def test_parse_time():
+    assert parse_time("1700000000") == 1700000000.0
+    assert parse_time(None) is None
+    assert parse_time("2024-01-01T00:00:00+00:00") == 1704067200.0
+    with pytest.raises(ValueError):
+        parse_time("yesterday")
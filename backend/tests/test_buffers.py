@@ -0,0 +1,31 @@
+import numpy as np
+
+from buffers import RingBuffer, RollingWindow
+
+def test_ring_buffer_view_is_oldest_first_across_a_wrap():
+    buffer = RingBuffer(4, (2,))
+    for value in range(7):
+        buffer.append((value, -value))
+    assert buffer.is_full()
+    assert buffer.view()[:, 0].tolist() == [3, 4, 5, 6]
+    assert buffer.oldest()[0] == 3
+    assert buffer.last()[0] == 6 and buffer.last(2)[0] == 5
+
+def test_rolling_window_matches_numpy_across_wraps():
+    rng = np.random.default_rng(0)
+    values = rng.normal(5.0, 2.0, 100)
+    window = RollingWindow(8)
+    for end, value in enumerate(values, 1):
+        window.append(value)
+        recent = values[max(0, end - 8):end]
+        assert np.isclose(window.mean(), recent.mean())
+        assert np.isclose(window.var(), recent.var())
+
+def test_rolling_window_clear():
+    window = RollingWindow(3)
+    for value in (1.0, 2.0, 3.0, 4.0):
+        window.append(value)
+    window.clear()
+    assert len(window) == 0 and window.mean() == 0.0 and window.var() == 0.0
+    window.append(7.0)
+    assert window.mean() == 7.0 and window.var() == 0.0
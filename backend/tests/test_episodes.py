@@ -0,0 +1,60 @@
+from episodes import EpisodeEngine, join_episodes
+
+RATE = 4.0  # frames per second
+
+def detection(kind, **fields):
+    return dict({"type": kind, "severity": "HIGH", "confidence": 0.5}, **fields)
+
+def run(engine, frames):
+    """Feed frames of detections (lists), one every 1 / RATE seconds; returns every event"""
+    events = []
+    for frame, alerts in enumerate(frames):
+        events += engine.feed(alerts, frame / RATE, frame)
+    return events + engine.flush()
+
+def test_critical_episode_starts_at_once_and_reports_its_peak():
+    frames = [[detection("FALL", confidence=c)] for c in (0.6, 0.9, 0.7)] + [[]] * 30
+    events = run(EpisodeEngine(), frames)
+    assert [event["event"] for event in events] == ["start", "end"]
+    end = events[-1]
+    assert end["start_frame"] == 0 and end["end_frame"] == 2
+    assert end["detections"] == 3 and end["peak_confidence"] == 0.9
+    # The end comes once release_seconds (5 s) have passed without a detection
+    assert end["ended_at"] == 0.5
+
+def test_onset_needs_the_condition_to_hold():
+    brief = [[detection("ABNORMAL_POSTURE")]] * 4 + [[]] * 30  # 1 s, onset needs 3 s
+    engine = EpisodeEngine()
+    assert run(engine, brief) == []
+    assert engine.stats()["suppressed_onsets"] == 1
+
+    held = [[detection("ABNORMAL_POSTURE")]] * 16
+    events = run(EpisodeEngine(), held)
+    assert [event["event"] for event in events] == ["start", "end"]
+    assert events[0]["frame"] == 0 and events[0]["detections"] == 13  # started at 3 s
+
+def test_a_flickering_detection_stays_one_episode():
+    frames = ([[detection("SEIZURE")]] + [[]] * 7) * 5  # seen every 2 s, release is 3 s
+    events = run(EpisodeEngine(update_seconds=0), frames)
+    assert [event["event"] for event in events] == ["start", "end"]
+    assert events[-1]["detections"] == 5
+
+    frames = ([[detection("SEIZURE")]] + [[]] * 15) * 2  # 4 s apart: two episodes
+    assert [event["event"] for event in run(EpisodeEngine(), frames)] == ["start", "end", "start", "end"]
+
+def test_updates_while_an_episode_lasts():
+    frames = [[detection("FALL")]] * int(10 * RATE)
+    events = run(EpisodeEngine(update_seconds=4), frames)
+    assert [event["event"] for event in events] == ["start", "update", "update", "end"]
+
+def test_segment_split_episodes_are_joined():
+    first = run(EpisodeEngine(), [[detection("FALL", confidence=0.4)]] * 8)
+    engine = EpisodeEngine()
+    second = []
+    for frame in range(10, 18):  # 0.75 s after the first ended
+        second += engine.feed([detection("FALL", confidence=0.8)], frame / RATE, frame)
+    second += engine.flush()
+    joined = join_episodes([first[-1], second[-1]])
+    assert len(joined) == 1
+    assert joined[0]["detections"] == 16 and joined[0]["confidence"] == 0.8
+    assert joined[0]["start_frame"] == 0 and joined[0]["end_frame"] == 17
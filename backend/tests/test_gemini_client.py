@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from gemini_client import GeminiClient, ModelUnavailable
+
+def half_open_client():
+    client = GeminiClient("test-key", breaker_failures=1, breaker_reset=30.0)
+    client._failures = 1
+    client._opened_at = time.monotonic() - 31.0
+    assert client.breaker_state == "half_open"
+    return client
+
+def test_cancelled_trial_releases_half_open_breaker():
+    client = half_open_client()
+
+    async def hang(contents, model, deadline):
+        await asyncio.sleep(3600)
+
+    async def answer(contents, model, deadline):
+        return "ok"
+
+    async def run():
+        client._call = hang
+        trial = asyncio.ensure_future(client.generate(["prompt"]))
+        await asyncio.sleep(0)
+        assert client._trial
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert not client._trial
+        assert client.breaker_state == "half_open"
+
+        # The next call is admitted as the trial and closes the breaker
+        client._call = answer
+        assert await client.generate(["prompt"]) == "ok"
+        assert client.breaker_state == "closed"
+
+    asyncio.run(run())
+
+def test_half_open_admits_one_trial_at_a_time():
+    client = half_open_client()
+
+    async def hang(contents, model, deadline):
+        await asyncio.sleep(3600)
+
+    async def run():
+        client._call = hang
+        trial = asyncio.ensure_future(client.generate(["prompt"]))
+        await asyncio.sleep(0)
+        with pytest.raises(ModelUnavailable):
+            await client.generate(["prompt"])
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(run())
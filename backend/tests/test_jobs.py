@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import jobs as jobs_module
+from jobs import VideoJobManager
+
+def manager(**options):
+    jobs = VideoJobManager(max_workers=0, **options)
+    jobs._cancelled = {}
+    return jobs
+
+def add_job(jobs, job_id):
+    jobs.jobs[job_id] = {"job_id": job_id, "status": "running", "finished_at": None, "labels": {}}
+    jobs.subscribe(job_id, lambda kind, job, payload: None)
+
+def finish(jobs, job_id):
+    future = Future()
+    future.set_exception(RuntimeError("boom"))
+    jobs._finish(job_id, future)
+
+def test_oldest_finished_jobs_are_evicted_beyond_the_limit():
+    jobs = manager(max_finished_jobs=2)
+    for job_id in ("a", "b", "c", "running"):
+        add_job(jobs, job_id)
+    for job_id in ("a", "b", "c"):
+        finish(jobs, job_id)
+
+    assert set(jobs.jobs) == {"b", "c", "running"}
+    assert "a" not in jobs._subscribers
+    assert jobs.jobs["b"]["status"] == "failed"
+    assert jobs.stats()["evicted_jobs"] == 1
+
+def test_finished_jobs_expire_after_the_ttl():
+    jobs = manager(job_ttl=0.05)
+    add_job(jobs, "done")
+    add_job(jobs, "running")
+    finish(jobs, "done")
+    assert jobs.get("done") is not None
+
+    time.sleep(0.1)
+    assert jobs.stats()["jobs"] == {"running": 1}
+    assert jobs.get("done") is None
+    assert jobs.get("running") is not None
+
+def test_segment_planning_probes_the_video_off_the_calling_thread(monkeypatch):
+    probed = []
+
+    def probe(file_path, options):
+        probed.append(threading.current_thread())
+        return 100, 25.0, 5.0
+
+    monkeypatch.setattr(jobs_module, "_probe_video", probe)
+    monkeypatch.setattr(jobs_module, "_run_job", lambda job_id, file_path, options: {"alerts": [], "path": file_path})
+    jobs = VideoJobManager(max_workers=2, segment_seconds=600)
+    jobs._cancelled = {}
+    jobs._executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        job = jobs.submit("ward.mp4", "/videos/ward.mp4")
+        job["future"].result(timeout=5)
+        for _ in range(50):  # the done callback may still be settling the job
+            if job["status"] == "completed":
+                break
+            time.sleep(0.01)
+    finally:
+        jobs._executor.shutdown(wait=True)
+
+    assert probed and probed[0] is not threading.current_thread()
+    assert job["status"] == "completed"
+    assert job["result"]["path"] == "/videos/ward.mp4"
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from kernels import (
+    NUM_LANDMARKS, PoseLandmark, body_center, fall_kernel, landmarks_to_array, posture_kernel, shoulder_level,
+)
+
+def test_landmarks_to_array():
+    landmarks = [SimpleNamespace(x=i / 100, y=0.5, z=-0.1, visibility=None if i == 0 else 0.9)
+                 for i in range(NUM_LANDMARKS)]
+    pose = landmarks_to_array(landmarks)
+    assert pose.shape == (NUM_LANDMARKS, 4) and pose.dtype == np.float32
+    assert np.isclose(pose[PoseLandmark.LEFT_HIP, 0], 0.23)
+    assert pose[0, 3] == 0.0 and np.isclose(pose[1, 3], 0.9)
+
+def test_kernels_give_the_same_answers_one_pose_or_a_batch():
+    poses = np.random.default_rng(0).random((5, 3, NUM_LANDMARKS, 4), dtype=np.float32)
+    poses[0, 0, [PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP], 1] = 0.9
+    poses[0, 0, PoseLandmark.NOSE, 1] = 0.85
+    batch_fall, batch_hip_y = fall_kernel(poses)
+    assert batch_fall.shape == (5, 3) and batch_fall[0, 0]
+    for index in np.ndindex(5, 3):
+        is_fall, hip_y = fall_kernel(poses[index])
+        assert is_fall == batch_fall[index] and np.isclose(hip_y, batch_hip_y[index])
+        assert np.allclose(body_center(poses[index]), body_center(poses)[index])
+        assert np.isclose(shoulder_level(poses[index]), shoulder_level(poses)[index])
+        assert [np.asarray(value)[()] for value in posture_kernel(poses[index])] == \
+               [value[index] for value in posture_kernel(poses)]
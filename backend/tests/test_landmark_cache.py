@@ -0,0 +1,70 @@
+import os
+import time
+
+import numpy as np
+
+from landmark_cache import LandmarkCache, content_hash, write_hash_sidecar
+
+def series(frames=10):
+    return {
+        "poses": np.zeros((frames, 33, 4), dtype=np.float32),
+        "frames": np.arange(frames, dtype=np.int64),
+        "timestamps": np.arange(frames, dtype=np.float64) / 4,
+        "held": np.zeros(frames, dtype=bool),
+        "sample_rate": 4.0,
+        "total_frames": frames * 5,
+        "processed_frames": frames * 5,
+        "sampling": {},
+    }
+
+def video(tmp_path, content=b"video"):
+    path = tmp_path / "ward.mp4"
+    path.write_bytes(content)
+    return path
+
+def test_hit_and_miss(tmp_path):
+    cache = LandmarkCache(tmp_path / "cache")
+    key = cache.key(video(tmp_path), {"sample_rate": 4})
+    assert cache.get(key) is None
+    cache.put(key, series())
+    hit = cache.get(key)
+    assert hit is not None and hit["sample_rate"] == 4.0
+    assert np.array_equal(hit["frames"], np.arange(10))
+
+def test_key_follows_content_and_settings(tmp_path):
+    cache = LandmarkCache(tmp_path / "cache")
+    path = video(tmp_path)
+    key = cache.key(path, {"sample_rate": 4})
+    assert cache.key(path, {"sample_rate": 4}) == key
+    assert cache.key(path, {"sample_rate": 8}) != key
+    assert cache.key(path, {"sample_rate": 4, "tracking": True}) != key
+    assert cache.key(path, {"sample_rate": 4, "roi": {"margin": 0.3}}) != key
+    bed = {"x_min": 0.3, "x_max": 0.7, "y_min": 0.3, "y_max": 0.7}
+    assert cache.key(path, {"sample_rate": 4, "bed_region": bed}) != key
+    assert cache.key(path, {"sample_rate": 4, "bed_region": dict(bed, x_min=0.2)}) != \
+           cache.key(path, {"sample_rate": 4, "bed_region": bed})
+
+    # New content, new key (a sidecar older than the file is ignored)
+    time.sleep(0.01)
+    path.write_bytes(b"other video")
+    assert LandmarkCache(tmp_path / "cache").key(path, {"sample_rate": 4}) != key
+
+def test_sidecar_hash_is_used(tmp_path):
+    path = video(tmp_path)
+    write_hash_sidecar(path, "f" * 64)
+    assert content_hash(path) == "f" * 64
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LandmarkCache(tmp_path / "cache")
+    cache.put("old", series())
+    cache.put("used", series())
+    entry_bytes = cache.usage()["bytes"] // 2
+    past = time.time() - 100
+    os.utime(cache.directory / "old", (past, past))
+    os.utime(cache.directory / "used", (past + 1, past + 1))
+    cache.get("used")  # touches it
+
+    cache.max_bytes = 2 * entry_bytes
+    assert cache.put("new", series()) == 1
+    assert cache.get("old") is None
+    assert cache.get("used") is not None and cache.get("new") is not None
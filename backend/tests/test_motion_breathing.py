@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+
+from detector import ActivityDetector
+from kernels import PoseLandmark
+from motion import MotionGate
+
+SAMPLE_RATE = 6.0
+BREATHS_PER_MINUTE = 15.0
+
+def still_patient(gate):
+    """A detector watching a patient who lies still and breathes; counts inferences"""
+    detector = ActivityDetector(pose_detector=object(), sample_rate=SAMPLE_RATE, motion_gate=gate)
+    detector.reset()
+    clock = {"t": 0.0, "inferred": 0}
+
+    def detect_pose(frame, timestamp_ms=None):
+        clock["inferred"] += 1
+        pose = np.zeros((33, 4), dtype=np.float32)
+        pose[:, 0], pose[:, 1], pose[:, 3] = 0.5, 0.5, 1.0
+        shoulders = 0.45 + 0.003 * math.sin(2 * math.pi * BREATHS_PER_MINUTE / 60 * clock["t"])
+        pose[[PoseLandmark.LEFT_SHOULDER, PoseLandmark.RIGHT_SHOULDER], 1] = shoulders
+        pose[[PoseLandmark.LEFT_SHOULDER, PoseLandmark.RIGHT_SHOULDER], 0] = (0.4, 0.6)
+        pose[[PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP], 1] = 0.5
+        return pose
+
+    detector.detect_pose = detect_pose
+    return detector, clock
+
+def run(detector, clock, seconds=40):
+    # The pixels never change: the breathing movement is below the gate's threshold
+    frame = np.full((120, 160, 3), 90, dtype=np.uint8)
+    activities = None
+    for index in range(int(seconds * SAMPLE_RATE)):
+        clock["t"] = index / SAMPLE_RATE
+        activities, _ = detector.analyze_frame(frame)
+    return activities
+
+def test_still_patient_breathing_is_measured_through_the_gate():
+    detector, clock = still_patient(MotionGate(sample_rate=SAMPLE_RATE))
+    activities = run(detector, clock, seconds=60)
+    assert activities["breathing_status"] == "Normal"
+    assert abs(activities["breathing_rate"] - BREATHS_PER_MINUTE) < 2
+    # Still frames are only inferred at the breathing cadence: after the
+    # first hold, one frame in six at the default 1 s
+    assert clock["inferred"] < 0.25 * 60 * SAMPLE_RATE
+    before = clock["inferred"]
+    run(detector, clock, seconds=30)
+    assert clock["inferred"] - before <= 30 * SAMPLE_RATE / 5
+
+def test_gate_without_breathing_cadence_holds_breathing():
+    detector, clock = still_patient(MotionGate(sample_rate=SAMPLE_RATE, breathing_seconds=0))
+    activities = run(detector, clock)
+    assert activities["breathing_rate"] == 0.0
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from detector import ActivityDetector, build_alerts
+from kernels import NUM_LANDMARKS, PoseLandmark
+from offline import LandmarkRecorder, analyze_series
+
+def patient_series(sample_rate, seconds=60, seed=0):
+    """A patient breathing in bed, then shaking, leaving the bed and falling, with some frames lost"""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    t = np.arange(total) / sample_rate
+    poses = np.zeros((total, NUM_LANDMARKS, 4), dtype=np.float32)
+    poses[..., 0], poses[..., 1], poses[..., 3] = 0.5, 0.4, 1.0
+    shoulders = [PoseLandmark.LEFT_SHOULDER, PoseLandmark.RIGHT_SHOULDER]
+    hips = [PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP]
+    poses[:, shoulders, 0] = (0.42, 0.58)
+    poses[:, hips, 0] = (0.45, 0.55)
+    poses[:, shoulders, 1] = (0.40 + 0.004 * np.sin(2 * np.pi * 0.25 * t))[:, None]
+    poses[:, hips, 1] = 0.55
+    poses[..., :2] += rng.normal(0, 0.0005, poses[..., :2].shape)
+
+    shaking = (t > 25) & (t < 32)
+    poses[shaking, :, :2] += rng.normal(0, 0.03, (shaking.sum(), NUM_LANDMARKS, 2))
+    leaving = t > 40
+    poses[leaving, :, 0] += np.minimum(0.5, (t[leaving] - 40) * 0.05)[:, None]
+    falling = t > 50
+    poses[falling, :, 1] += 0.3
+
+    missing = rng.random(total) < 0.05
+    return [None if gone else pose for pose, gone in zip(poses, missing)]
+
+@pytest.mark.parametrize("sample_rate", [4.0, 16.0])
+def test_offline_scoring_matches_streaming_analysis(sample_rate):
+    poses = patient_series(sample_rate)
+    streaming = ActivityDetector(sample_rate=sample_rate)
+    streaming.reset()
+    recorder = LandmarkRecorder()
+    expected = []
+    for frame, pose in enumerate(poses):
+        timestamp = frame / sample_rate
+        expected += build_alerts(streaming.analyze_pose(pose), timestamp, frame)
+        recorder.add(frame, timestamp, pose)
+
+    series = recorder.series(sample_rate, len(poses), len(poses), {})
+    alerts = analyze_series(series, ActivityDetector(sample_rate=sample_rate))
+
+    types = {alert["type"] for alert in expected}
+    assert types >= {"FALL", "BED_EXIT", "RAPID_MOVEMENT", "ABNORMAL_BREATHING"}
+    if sample_rate >= 16:
+        assert "SEIZURE" in types
+    assert [(a["type"], a["frame"]) for a in alerts] == [(a["type"], a["frame"]) for a in expected]
@@ -0,0 +1,41 @@
+import numpy as np
+import mediapipe as mp
+
+from pool import LandmarkerPool
+
+class FakeLandmarker:
+    def __init__(self):
+        self.timestamps = []
+        self.closed = False
+
+    def detect_for_video(self, image, timestamp_ms):
+        self.timestamps.append(timestamp_ms)
+
+    def close(self):
+        self.closed = True
+
+def test_a_landmarker_leased_to_a_new_stream_starts_without_tracking_state():
+    created = []
+    pool = LandmarkerPool(1, "VIDEO", factory=lambda mode: created.append(FakeLandmarker()) or created[-1]).start()
+    frame = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.zeros((8, 8, 3), dtype=np.uint8))
+
+    first = pool.acquire()
+    first_landmarker = first.landmarker
+    for timestamp in (0, 100, 200):
+        first.detect_for_video(frame, timestamp)
+    first.close()
+
+    second = pool.acquire()
+    assert second.landmarker is not first_landmarker
+    assert first_landmarker.closed
+    second.detect_for_video(frame, 0)
+    assert second.landmarker.timestamps == [0, 1]  # warm-up, then this stream's first frame
+    second.close()
+    assert pool.stats()["renewals"] == 2
+
+def test_an_unused_lease_keeps_its_landmarker():
+    pool = LandmarkerPool(1, "VIDEO", factory=lambda mode: FakeLandmarker()).start()
+    lease = pool.acquire()
+    landmarker = lease.landmarker
+    lease.close()
+    assert pool.acquire().landmarker is landmarker
@@ -0,0 +1,31 @@
+import time
+
+from registry import DetectorRegistry
+
+def test_pinned_detectors_survive_idle_eviction():
+    registry = DetectorRegistry(idle_timeout=0.05)
+    held = registry.get("job", pin=True)
+    registry.get("idle")
+    time.sleep(0.1)
+
+    assert registry.evict_idle() == ["idle"]
+    assert registry.get("job", create=False) is held
+
+    registry.release("job")
+    assert registry.evict_idle() == []  # idle time counts from the release
+    time.sleep(0.1)
+    assert registry.evict_idle() == ["job"]
+
+def test_a_full_registry_evicts_unpinned_detectors_first():
+    registry = DetectorRegistry(max_streams=2)
+    held = registry.get("job", pin=True)
+    registry.get("old")
+    registry.get("new")
+
+    assert "old" not in registry
+    assert registry.get("job", create=False) is held
+
+    registry.get("job2", pin=True)
+    registry.get("job3", pin=True)  # all pinned: grows past the limit
+    assert "job" in registry and "job2" in registry and "job3" in registry
+    assert registry.stats()["pinned"] == 3
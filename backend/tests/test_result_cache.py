@@ -0,0 +1,74 @@
+import asyncio
+import io
+import time
+
+from PIL import Image
+
+from result_cache import ResultCache, cache_key, image_hash
+
+def test_entries_expire_after_the_ttl():
+    cache = ResultCache(ttl=0.05)
+    cache.put("key", {"answer": 1})
+    assert cache.get("key") == {"answer": 1}
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entry_goes_first():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_concurrent_identical_calls_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": 42}
+
+    async def run():
+        cache = ResultCache()
+        results = await asyncio.gather(*[cache.get_or_compute("key", compute) for _ in range(5)])
+        again = await cache.get_or_compute("key", compute)
+        return cache, results, again
+
+    cache, results, again = asyncio.run(run())
+    assert len(calls) == 1
+    assert [status for _, status in results] == ["miss"] + ["shared"] * 4
+    assert all(result == {"answer": 42} for result, _ in results)
+    assert again == ({"answer": 42}, "hit")
+    assert cache.stats()["hit_ratio"] == round(5 / 6, 3)
+
+def test_uncacheable_results_and_errors_are_not_stored():
+    async def run():
+        cache = ResultCache()
+        await cache.get_or_compute("raw", lambda: asyncio.sleep(0, {"raw_response": "?"}),
+                                   cacheable=lambda result: "raw_response" not in result)
+
+        async def fail():
+            raise RuntimeError("upstream")
+        try:
+            await cache.get_or_compute("error", fail)
+        except RuntimeError:
+            pass
+        return cache
+
+    cache = asyncio.run(run())
+    assert cache.get("raw") is None and cache.get("error") is None
+    assert cache.stats()["in_flight"] == 0
+
+def test_keys_and_hashes():
+    assert cache_key("presence", "model", "prompt A", 4, "hash") != cache_key("presence", "model", "prompt B", 4, "hash")
+    image = Image.new("RGB", (64, 48), (120, 80, 40))
+    image.paste((200, 200, 200), (0, 0, 32, 48))
+    png, jpeg = io.BytesIO(), io.BytesIO()
+    image.save(png, "PNG")
+    image.save(jpeg, "JPEG", quality=95)
+    assert image_hash(png.getvalue()) != image_hash(jpeg.getvalue())
+    assert image_hash(png.getvalue(), perceptual=True) == image_hash(jpeg.getvalue(), perceptual=True)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from spectral import SlidingSpectrum, band_bins, band_spectrum
+
+def test_sliding_spectrum_matches_numpy_fft_on_a_sinusoid():
+    rate, window = 6.0, 120
+    t = np.arange(300) / rate
+    signal = 0.5 + 0.01 * np.sin(2 * np.pi * 0.25 * t) + 0.002 * np.sin(2 * np.pi * 1.7 * t)
+    spectrum = SlidingSpectrum(window, rate, 0.1, 1.0)
+    for end, value in enumerate(signal, 1):
+        spectrum.append(value)
+        if end >= window and end % 37 == 0:
+            bins, _ = band_bins(window, rate, 0.1, 1.0)
+            expected = np.square(np.abs(np.fft.rfft(signal[end - window:end])[bins]))
+            assert np.allclose(spectrum.band_power(), expected, rtol=1e-6, atol=1e-12)
+
+    assert spectrum.ready
+    assert abs(spectrum.dominant_frequency() - 0.25) < 0.01
+    # The 1.7 Hz component is outside the band
+    assert 0.9 < spectrum.band_ratio() <= 1.0
+
+def test_batch_spectrum_agrees_with_the_sliding_one():
+    rate, window = 6.0, 64
+    signal = np.sin(2 * np.pi * 0.4 * np.arange(window) / rate)
+    spectrum = SlidingSpectrum(window, rate, 0.1, 1.0)
+    for value in signal:
+        spectrum.append(value)
+    ratio, rms, dominant = band_spectrum(signal[:, None], rate, 0.1, 1.0)
+    assert np.isclose(ratio, spectrum.band_ratio())
+    assert np.isclose(rms, spectrum.band_rms())
+    assert np.isclose(dominant, spectrum.dominant_frequency())
+
+def test_band_above_nyquist_is_not_observable():
+    spectrum = SlidingSpectrum(16, 4.0, 3.0, 8.0)
+    assert not spectrum.observable
+    for value in range(20):
+        spectrum.append(value % 2)
+    assert spectrum.band_ratio() == 0.0 and spectrum.dominant_frequency() == 0.0
@@ -0,0 +1,54 @@
+import asyncio
+import json
+from datetime import datetime
+
+from streaming import JobEventStream, encode
+
+def job(**fields):
+    record = {"job_id": "j1", "filename": "ward.mp4", "status": "running", "started_at": datetime.now().isoformat(),
+              "processed_frames": 0, "total_frames": 100, "alert_count": 0, "error": None}
+    record.update(fields)
+    return record
+
+def collect(events, **options):
+    """Push events (kind, job, payload) before reading, as a slow client would, and return the records"""
+    async def run():
+        stream = JobEventStream(asyncio.get_running_loop(), **options)
+        for kind, job_record, payload in events:
+            stream._push(kind, job_record, payload)
+        return [record async for record in stream.records()]
+    return asyncio.run(run())
+
+def test_progress_is_coalesced_to_the_latest():
+    done = job(status="completed", processed_frames=100, result={"alerts": [], "processed_frames": 100})
+    records = collect([("started", job(), None)] +
+                      [("progress", job(processed_frames=n), None) for n in (10, 20, 30)] +
+                      [("finished", done, None)])
+    assert [record["type"] for record in records] == ["started", "progress", "result"]
+    assert records[1]["processed_frames"] == 30 and records[1]["percent"] == 30.0
+    assert records[2]["alert_count"] == 0 and "alerts" not in records[2]
+
+def test_pending_alerts_are_capped_and_the_drop_reported():
+    alerts = [{"type": "FALL", "frame": n} for n in range(5)]
+    done = job(status="completed", result={"alerts": alerts})
+    records = collect([("alert", job(), alert) for alert in alerts] + [("finished", done, None)],
+                      max_pending_alerts=2)
+    assert [record["type"] for record in records] == ["alert", "alert", "dropped", "result"]
+    assert [record["frame"] for record in records[:2]] == [0, 1]
+    assert records[2]["alerts"] == 3
+
+def test_missing_alerts_are_waited_for_only_until_the_drain_deadline():
+    done = job(status="completed", result={"alerts": [{"type": "FALL"}]})
+    records = collect([("finished", done, None)], drain_seconds=0.05)
+    assert [record["type"] for record in records] == ["result"]
+
+def test_failed_and_cancelled_jobs():
+    assert collect([("finished", job(status="failed", error="boom"), None)])[-1] == \
+           {"type": "error", "success": False, "job_id": "j1", "error": "boom"}
+    assert collect([("finished", job(status="cancelled"), None)])[-1]["type"] == "cancelled"
+
+def test_encode():
+    assert json.loads(encode({"type": "progress"}, "ndjson")) == {"type": "progress"}
+    assert encode(None, "ndjson") == '{"type": "heartbeat"}\n'
+    assert encode({"type": "alert"}, "sse").startswith("event: alert\ndata: ")
+    assert encode(None, "sse") == ": heartbeat\n\n"
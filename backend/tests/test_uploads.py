@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from uploads import UploadError, UploadStore, UploadTooLarge
+
+BOUNDARY = "testboundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+def multipart(payload, filename="ward.mp4", field="file"):
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nbed 4\r\n"
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: video/mp4\r\n\r\n"
+    ).encode() + payload + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+async def pieces(body, size, read=None):
+    for start in range(0, len(body), size):
+        if read is not None:
+            read.append(start)
+        yield body[start:start + size]
+
+def test_saves_the_file_field_in_pieces(tmp_path):
+    store = UploadStore(tmp_path)
+    payload = bytes(range(256)) * 100
+    saved = asyncio.run(store.save(CONTENT_TYPE, pieces(multipart(payload, "../ward.mp4"), 7)))
+    assert saved["filename"] == "ward.mp4"
+    assert saved["size"] == len(payload)
+    assert (tmp_path / "ward.mp4").read_bytes() == payload
+    assert not list(store.partial_dir.iterdir())
+
+def test_refuses_an_oversized_body_while_reading_it(tmp_path):
+    store = UploadStore(tmp_path, max_bytes=1000)
+    body, read = multipart(b"x" * 100_000), []
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(store.save(CONTENT_TYPE, pieces(body, 100, read)))
+    assert len(read) < 20
+    assert not list(store.partial_dir.iterdir())
+    assert not (tmp_path / "ward.mp4").exists()
+
+def test_requires_a_file(tmp_path):
+    store = UploadStore(tmp_path)
+    with pytest.raises(UploadError):
+        asyncio.run(store.save(CONTENT_TYPE, pieces(multipart(b"data", field="video"), 64)))
+    with pytest.raises(UploadError):
+        asyncio.run(store.save("application/octet-stream", pieces(b"data", 64)))
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from result_cache import ResultCache, cache_key, image_hash
+from ward_batch import WardSweep, presence_prompt
+
+class FakeClient:
+    model = "test-model"
+
+    def __init__(self):
+        self.calls = []
+
+    async def generate(self, contents):
+        images = sum(1 for part in contents if not isinstance(part, str))
+        self.calls.append(images)
+        analysis = {"summary": "ok", "total_beds": 4, "occupied_beds": 4, "empty_beds": 0, "empty_spots": []}
+        return json.dumps([dict(analysis, image=n + 1) for n in range(images)] if images > 1 else analysis)
+
+class FakePreparer:
+    async def prepare(self, data):
+        return data, "image/jpeg", {"size": (320, 240)}
+
+def sweep(wards, client, cache):
+    async def run():
+        return [record async for record in WardSweep(client, FakePreparer(), cache).sweep(wards)]
+    return asyncio.run(run())
+
+def wards(*images):
+    return [{"index": n, "ward": f"ward {n}", "filename": f"{n}.jpg", "expected_beds": 4, "data": data}
+            for n, data in enumerate(images)]
+
+def test_packed_answers_are_not_served_to_single_image_requests():
+    client, cache = FakeClient(), ResultCache()
+    records = sweep(wards(b"first", b"second"), client, cache)
+    assert client.calls == [2]
+    assert all(record["success"] for record in records if record["type"] == "ward")
+
+    # The key analyze-ward-presence builds for the same image and beds
+    single = cache_key("presence", client.model, presence_prompt(4), 4, image_hash(b"first"))
+    assert cache.get(single) is None
+
+    # Another sweep still reuses the packed answers
+    records = sweep(wards(b"first", b"second"), client, cache)
+    assert client.calls == [2]
+    assert [record["cached"] for record in records if record["type"] == "ward"] == ["hit", "hit"]
+
+def test_single_image_answers_are_shared_with_single_image_requests():
+    client, cache = FakeClient(), ResultCache()
+    sweep(wards(b"only"), client, cache)
+    assert client.calls == [1]
+    assert cache.get(cache_key("presence", client.model, presence_prompt(4), 4, image_hash(b"only"))) is not None
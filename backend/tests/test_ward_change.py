@@ -0,0 +1,67 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import ward_change
+from ward_change import ChangeDetector
+
+def ward_image(seed=0):
+    rng = np.random.default_rng(seed)
+    image = np.full((768, 1024, 3), 180, np.uint8)
+    for bed in range(6):
+        x = 60 + bed * 160
+        cv2.rectangle(image, (x, 300), (x + 110, 560), (230, 230, 235), -1)
+        cv2.rectangle(image, (x, 300), (x + 110, 340), (200, 210, 240), -1)
+        cv2.rectangle(image, (x, 300), (x + 110, 560), (90, 90, 90), 3)
+    return np.clip(image + rng.normal(0, 4, image.shape), 0, 255).astype(np.uint8)
+
+def jpeg(image, seed=1):
+    noisy = np.clip(image + np.random.default_rng(seed).normal(0, 3, image.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(noisy).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+def test_a_small_change_across_grid_cells_is_found():
+    before = ward_image()
+    after = before.copy()
+    # 40x80 px on a bed, straddling the corner of four cells of the 4x6 grid
+    after[344:424, 321:361] = (205, 205, 210)
+    result = ChangeDetector().compare(jpeg(before), jpeg(after))
+    assert result["changed"]
+    assert result["crops"]
+
+def test_an_unchanged_pair_is_unchanged():
+    before = ward_image()
+    assert not ChangeDetector().compare(jpeg(before), jpeg(before, seed=2))["changed"]
+
+def test_a_pair_without_overlap_counts_as_changed(monkeypatch):
+    def align(before, after):
+        return after, np.zeros(before.shape, bool), False, np.eye(2, 3, dtype=np.float32)
+
+    monkeypatch.setattr(ward_change, "_align", align)
+    before = ward_image()
+    result = ChangeDetector().compare(jpeg(before), jpeg(before, seed=2))
+    assert result["changed"] and result["crops"] is None
+
+def test_after_crops_follow_the_alignment():
+    # Texture all over, so the alignment has something to hold on to in both directions
+    texture = cv2.GaussianBlur(np.random.default_rng(3).normal(0, 1, (768, 1024)).astype(np.float32), (0, 0), 12)
+    before = np.clip(ward_image() + texture[..., None] * (25 / texture.std()), 0, 255).astype(np.uint8)
+    after = before.copy()
+    after[380:460, 400:440] = (120, 90, 80)
+    # The camera was nudged: everything moved 48 px right and 24 px down
+    shifted = np.full_like(after, 180)
+    shifted[24:, 48:] = after[:-24, :-48]
+    result = ChangeDetector().compare(jpeg(before), jpeg(shifted))
+    assert result["aligned"] and result["crops"]
+    crop = next(crop for crop in result["crops"] if crop["box"][0] <= 420 / 1024 <= crop["box"][2])
+    x0, y0, x1, y1 = crop["after_box"]
+    assert abs(x0 - crop["box"][0] - 48 / 1024) < 0.01
+    assert abs(y0 - crop["box"][1] - 24 / 768) < 0.01
+    # The change sits inside the "after" crop
+    assert x0 * 1024 <= 448 and 488 <= x1 * 1024 and y0 * 768 <= 404 and 484 <= y1 * 768
+
+def test_after_box_is_the_box_without_a_warp():
+    assert ward_change._warp_box((0.1, 0.2, 0.5, 0.6), np.eye(2, 3), 480, 360) == (0.1, 0.2, 0.5, 0.6)
@@ -0,0 +1,335 @@
+"""
+Video uploads streamed to disk.
+
+Uploads are written in fixed-size chunks, never held in memory whole, capped
+at max_bytes and SHA-256 hashed as they arrive. One-shot uploads are parsed
+from the raw request body (not through Starlette's form parser, which spools
+the whole body before the handler runs), so the cap stops an oversized upload
+while it is still being read, whatever its Content-Length says. The hash is returned to the
+client and written next to the video (see landmark_cache.write_hash_sidecar),
+so later analyses key the landmark cache without reading the file again, and
+an upload whose content is already on disk is reported as a duplicate.
+
+Resumable uploads for unreliable ward networks: create a session, send the
+body in any number of pieces, each at the offset the server has received so
+far, then complete it. A piece cut off by a dropped connection keeps what
+arrived. Sessions outlive server restarts: their metadata is kept next to the
+partial file, which is re-hashed on the next append.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+import aiofiles
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart before 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from landmark_cache import HASH_SUFFIX, write_hash_sidecar
+
+class UploadError(Exception):
+    """An upload the client has to fix; status_code is the HTTP status to answer with"""
+    status_code = 400
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+class OffsetMismatch(UploadError):
+    """A resumable piece sent at the wrong offset; offset is where to resume"""
+    status_code = 409
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+class UploadStore:
+    def __init__(self, directory, max_bytes=4 * 1024 ** 3, chunk_size=1 << 20, session_ttl=24 * 3600):
+        self.directory = Path(directory)
+        self.partial_dir = self.directory / ".partial"
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.session_ttl = session_ttl
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self._sessions = {}  # upload_id -> session dict (with the running hasher)
+        self._locks = {}  # upload_id -> asyncio.Lock, so pieces of one upload never interleave
+
+    @staticmethod
+    def safe_name(filename):
+        """The bare file name, without any directory part"""
+        name = Path(filename or "").name
+        if not name or name.startswith(".") or name.endswith(HASH_SUFFIX):
+            raise UploadError(f"Invalid file name: {filename!r}")
+        return name
+
+    def _check_size(self, size):
+        if size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes // 2 ** 20} MB limit")
+
+    def duplicate_of(self, filename, digest):
+        """Another upload with the same content, or None"""
+        for sidecar in self.directory.glob(f"*{HASH_SUFFIX}"):
+            name = sidecar.name[:-len(HASH_SUFFIX)]
+            if name == filename or not (self.directory / name).is_file():
+                continue
+            try:
+                if sidecar.read_text().split()[0] == digest:
+                    return name
+            except (OSError, IndexError):
+                continue
+        return None
+
+    def _finish(self, partial, filename, digest, size):
+        """Move a complete upload into place and record its hash (blocking: run it in a thread)"""
+        file_path = self.directory / filename
+        os.replace(partial, file_path)
+        write_hash_sidecar(file_path, digest)
+        print(f"Upload {filename} complete: {size / 2 ** 20:.1f} MB, sha256 {digest[:12]}")
+        return {
+            "filename": filename,
+            "size": size,
+            "sha256": digest,
+            "duplicate_of": self.duplicate_of(filename, digest),
+        }
+
+    async def save(self, content_type, body, field="file"):
+        """
+        Stream the file in field of a multipart/form-data body (an async
+        iterator of byte chunks) to disk; returns filename, size, sha256 and
+        duplicate_of
+        """
+        media_type, options = parse_options_header(content_type or "")
+        if media_type != b"multipart/form-data" or b"boundary" not in options:
+            raise UploadError("Expected a multipart/form-data upload")
+        form = _FileField(field.encode())
+        parser = MultipartParser(options[b"boundary"], form.callbacks)
+        partial = self.partial_dir / f"{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        size = received = 0
+        try:
+            async with aiofiles.open(partial, "wb") as f:
+                async for chunk in body:
+                    # Other fields aren't kept, but they count against the limit too
+                    received += len(chunk)
+                    if received > self.max_bytes + 2 ** 20:
+                        self._check_size(received)
+                    parser.write(chunk)
+                    for data in form.take():
+                        size += len(data)
+                        self._check_size(size)
+                        digest.update(data)
+                        await f.write(data)
+                parser.finalize()
+            if form.filename is None:
+                raise UploadError(f"No file in field {field!r}")
+            filename = self.safe_name(form.filename)
+            return await asyncio.to_thread(self._finish, partial, filename, digest.hexdigest(), size)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    # Resumable uploads
+
+    def _paths(self, upload_id):
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        return self.partial_dir / f"{upload_id}.part", self.partial_dir / f"{upload_id}.json"
+
+    def _session(self, upload_id):
+        """The session for upload_id, reloaded from disk after a restart; raises KeyError"""
+        session = self._sessions.get(upload_id)
+        if session is None:
+            partial, meta = self._paths(upload_id)
+            try:
+                with open(meta) as f:
+                    session = json.load(f)
+                session["received"] = partial.stat().st_size
+            except (OSError, ValueError):
+                raise KeyError(upload_id)
+            session["hasher"] = None  # rebuilt from the partial file on the next append
+            self._sessions[upload_id] = session
+            self._locks[upload_id] = asyncio.Lock()
+        return session
+
+    def create(self, filename, size=None):
+        """Start a resumable upload of size bytes (None if unknown); returns its status"""
+        self.expire()
+        filename = self.safe_name(filename)
+        if size is not None:
+            self._check_size(size)
+        upload_id = uuid.uuid4().hex
+        partial, meta = self._paths(upload_id)
+        partial.touch()
+        session = {"upload_id": upload_id, "filename": filename, "size": size, "created_at": time.time()}
+        with open(meta, "w") as f:
+            json.dump(session, f)
+        self._sessions[upload_id] = dict(session, received=0, hasher=hashlib.sha256())
+        self._locks[upload_id] = asyncio.Lock()
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        session = self._session(upload_id)
+        return {
+            "upload_id": upload_id,
+            "filename": session["filename"],
+            "size": session["size"],
+            "offset": session["received"],
+            "chunk_size": self.chunk_size,
+            "max_bytes": self.max_bytes,
+        }
+
+    async def append(self, upload_id, offset, chunks):
+        """
+        Write the byte chunks of an async iterator at offset, which must be
+        the number of bytes received so far. Returns the new offset; what
+        arrived before a dropped connection is kept.
+        """
+        session = self._session(upload_id)
+        async with self._locks[upload_id]:
+            if offset != session["received"]:
+                raise OffsetMismatch(f"Expected offset {session['received']}, got {offset}", session["received"])
+            partial, _ = self._paths(upload_id)
+            if session["hasher"] is None:
+                session["hasher"] = await asyncio.to_thread(_hash_file, partial)
+            limit = session["size"] if session["size"] is not None else self.max_bytes
+            async with aiofiles.open(partial, "ab") as f:
+                async for chunk in chunks:
+                    if session["received"] + len(chunk) > limit:
+                        self._check_size(session["received"] + len(chunk))
+                        raise UploadError(f"Upload exceeds its declared size of {limit} bytes")
+                    await f.write(chunk)
+                    session["hasher"].update(chunk)
+                    session["received"] += len(chunk)
+            session["updated_at"] = time.time()
+            return session["received"]
+
+    async def complete(self, upload_id, sha256=None):
+        """
+        Finish a resumable upload; sha256 (optional) is checked against the
+        content. Returns filename, size, sha256 and duplicate_of.
+        """
+        session = self._session(upload_id)
+        async with self._locks[upload_id]:
+            if session["size"] is not None and session["received"] != session["size"]:
+                raise OffsetMismatch(
+                    f"Upload incomplete: {session['received']} of {session['size']} bytes", session["received"]
+                )
+            partial, meta = self._paths(upload_id)
+            if session["hasher"] is None:
+                session["hasher"] = await asyncio.to_thread(_hash_file, partial)
+            digest = session["hasher"].hexdigest()
+            if sha256 is not None and sha256.lower() != digest:
+                await asyncio.to_thread(self.abort, upload_id)
+                raise UploadError(f"Content hash mismatch: received {digest}")
+            result = await asyncio.to_thread(self._finish, partial, session["filename"], digest, session["received"])
+            self._forget(upload_id)
+            return result
+
+    def abort(self, upload_id):
+        """Drop a resumable upload and its partial file; returns False if unknown"""
+        try:
+            self._session(upload_id)
+        except KeyError:
+            return False
+        for path in self._paths(upload_id):
+            path.unlink(missing_ok=True)
+        self._forget(upload_id)
+        return True
+
+    def _forget(self, upload_id):
+        self._sessions.pop(upload_id, None)
+        self._locks.pop(upload_id, None)
+        _, meta = self._paths(upload_id)
+        meta.unlink(missing_ok=True)
+
+    def expire(self):
+        """Abort resumable uploads untouched for longer than session_ttl"""
+        cutoff = time.time() - self.session_ttl
+        for meta in self.partial_dir.glob("*.json"):
+            upload_id = meta.stem
+            partial, _ = self._paths(upload_id)
+            try:
+                last = max(meta.stat().st_mtime, partial.stat().st_mtime)
+            except OSError:
+                last = 0
+            if last < cutoff and not (upload_id in self._locks and self._locks[upload_id].locked()):
+                print(f"Upload {upload_id} expired")
+                self.abort(upload_id)
+        # Orphaned one-shot uploads from a crash
+        for partial in self.partial_dir.glob("*.part"):
+            if not (self.partial_dir / f"{partial.stem}.json").exists() and partial.stat().st_mtime < cutoff:
+                partial.unlink(missing_ok=True)
+
+    def stats(self):
+        return {
+            "sessions": len(list(self.partial_dir.glob("*.json"))),
+            "max_bytes": self.max_bytes,
+            "chunk_size": self.chunk_size,
+        }
+
+class _FileField:
+    """MultipartParser callbacks keeping the data of the first file in one field"""
+
+    def __init__(self, field):
+        self.field = field
+        self.filename = None
+        self._header = self._value = b""
+        self._headers = {}
+        self._inside = False
+        self._done = False
+        self._data = []
+        self.callbacks = {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def take(self):
+        """The file data parsed since the last call"""
+        data, self._data = self._data, []
+        return data
+
+    def _part_begin(self):
+        self._headers = {}
+        self._header = self._value = b""
+
+    def _header_field(self, data, start, end):
+        self._header += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._header.lower()] = self._value
+        self._header = self._value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if not self._done and options.get(b"name") == self.field and b"filename" in options:
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._inside = True
+
+    def _part_data(self, data, start, end):
+        if self._inside:
+            self._data.append(data[start:end])
+
+    def _part_end(self):
+        if self._inside:
+            self._inside = False
+            self._done = True
+
+def _hash_file(path):
+    """A sha256 object fed with a file's content so far, to continue hashing"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest
@@ -0,0 +1,273 @@
+"""
+Ward presence analysis for many wards at once (hospital-wide sweeps).
+
+A sweep used to be one analyze-ward-presence request, and one Gemini call,
+per ward, sent one after the other. WardSweep takes all the wards of a sweep
+and yields each ward's result as soon as it is known:
+- wards whose image was analysed recently come straight from the result
+  cache, and identical images within a sweep are analysed once. Answers to
+  the single-image prompt share analyze-ward-presence's entries; answers
+  from packed calls were asked with another prompt and are kept under keys
+  of their own, which only sweeps read;
+- the other images are prepared (see image_prep), then packed several per
+  Gemini call, up to token_budget estimated tokens and max_images images;
+- packs run concurrently, at most concurrency of them per sweep (the client
+  bounds the calls of all requests together).
+A packed answer that can't be matched back to its images is retried one
+image per call.
+"""
+import asyncio
+import json
+import math
+import time
+
+from gemini_client import ModelError, image_part
+from result_cache import cache_key, image_hash
+
+IMAGE_TILE = 768  # Gemini bills images by 768x768 tile...
+TILE_TOKENS = 258  # ...at this many tokens each (one tile up to 384 px)
+ANSWER_TOKENS = 400  # allowance for each image's part of the answer
+
+def presence_prompt(expected_beds):
+    return f"""Analyze this hospital ward image and identify patient presence at each bed location.
+
+Expected number of beds: {expected_beds}
+
+Please provide a detailed analysis in the following JSON format:
+{{
+    "summary": "Brief overview of the ward status",
+    "total_beds": number of beds visible in the image,
+    "occupied_beds": number of beds with patients present,
+    "empty_beds": number of empty beds,
+    "empty_spots": [
+        {{
+            "location": "Bed position (e.g., 'Bed 1 - Left side', 'Bed 3 - Center')",
+            "description": "Description of the empty bed location"
+        }}
+    ]
+}}
+
+Focus on:
+1. Identifying all bed locations in the ward
+2. Detecting human presence at each bed
+3. Noting which specific beds/spots are empty
+4. Providing clear location descriptions for empty beds
+
+Be specific about bed positions (left, right, center, near window, etc.) to help staff locate empty beds quickly."""
+
+def batch_prompt(expected_beds):
+    """Prompt for several ward images in one call; expected_beds lists each image's"""
+    images = "\n".join(f"Image {number + 1}: expected number of beds: {beds}"
+                       for number, beds in enumerate(expected_beds))
+    return f"""Analyze each of the following {len(expected_beds)} hospital ward images separately and identify
+patient presence at each bed location. Each image shows a different ward.
+
+{images}
+
+Reply with a JSON array holding one object per image, in the order of the images:
+[
+    {{
+        "image": image number,
+        "summary": "Brief overview of the ward status",
+        "total_beds": number of beds visible in the image,
+        "occupied_beds": number of beds with patients present,
+        "empty_beds": number of empty beds,
+        "empty_spots": [
+            {{
+                "location": "Bed position (e.g., 'Bed 1 - Left side', 'Bed 3 - Center')",
+                "description": "Description of the empty bed location"
+            }}
+        ]
+    }}
+]
+
+For every image, identify all bed locations, detect human presence at each bed and name
+the empty beds by position (left, right, center, near window, etc.)."""
+
+def extract_json(response_text):
+    """The JSON in a model answer, with or without a markdown code block"""
+    response_text = response_text.strip()
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + 7
+        response_text = response_text[json_start:response_text.find("```", json_start)].strip()
+    elif "```" in response_text:
+        json_start = response_text.find("```") + 3
+        response_text = response_text[json_start:response_text.find("```", json_start)].strip()
+    return json.loads(response_text)
+
+def image_tokens(size):
+    """Estimated input tokens of an image of size (width, height)"""
+    width, height = size
+    if max(width, height) <= IMAGE_TILE // 2:
+        return TILE_TOKENS
+    return math.ceil(width / IMAGE_TILE) * math.ceil(height / IMAGE_TILE) * TILE_TOKENS
+
+class WardSweep:
+    def __init__(self, client, preparer, cache, token_budget=6000, max_images=4, concurrency=4):
+        """
+        token_budget: estimated tokens (images and answers) per packed call
+        max_images: images per call at most
+        concurrency: calls in flight per sweep
+        """
+        self.client = client
+        self.preparer = preparer
+        self.cache = cache
+        self.token_budget = token_budget
+        self.max_images = max_images
+        self.concurrency = concurrency
+        self.sweeps = 0
+        self.wards = 0
+        self.calls = 0
+        self.packed_images = 0
+        self.fallbacks = 0
+
+    def _pack(self, items):
+        """Consecutive items grouped into calls within the token and image limits"""
+        packs, tokens = [], 0
+        for item in items:
+            cost = item["tokens"] + ANSWER_TOKENS
+            if not packs or len(packs[-1]) >= self.max_images or tokens + cost > self.token_budget:
+                packs.append([])
+                tokens = 0
+            packs[-1].append(item)
+            tokens += cost
+        return packs
+
+    async def _ask(self, pack, counts):
+        """One Gemini call for a pack; returns an analysis per item, or None if the answer doesn't match"""
+        self.calls += 1
+        counts["model_calls"] += 1
+        if len(pack) == 1:
+            item = pack[0]
+            response_text = await self.client.generate([item["prompt"], image_part(item["image"], item["mime_type"])])
+            try:
+                return [extract_json(response_text)]
+            except json.JSONDecodeError:
+                return [{
+                    "summary": response_text.strip()[:200],
+                    "total_beds": item["expected_beds"],
+                    "occupied_beds": 0,
+                    "empty_beds": 0,
+                    "empty_spots": [],
+                    "raw_response": response_text.strip(),
+                }]
+        contents = [batch_prompt([item["expected_beds"] for item in pack])]
+        for number, item in enumerate(pack):
+            contents += [f"Image {number + 1}:", image_part(item["image"], item["mime_type"])]
+        self.packed_images += len(pack)
+        try:
+            analyses = extract_json(await self.client.generate(contents))
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(analyses, list) or len(analyses) != len(pack):
+            return None
+        for analysis in analyses:
+            if isinstance(analysis, dict):
+                analysis.pop("image", None)
+        return analyses if all(isinstance(analysis, dict) for analysis in analyses) else None
+
+    async def _run_pack(self, pack, slots, counts):
+        """[(item, analysis, error)] for a pack, retried one image per call if need be"""
+        started = time.monotonic()
+        try:
+            async with slots:
+                analyses = await self._ask(pack, counts)
+        except Exception as e:
+            return [(item, None, e) for item in pack]
+        if analyses is None:
+            self.fallbacks += 1
+            print(f"Packed answer for {len(pack)} wards didn't match, asking one ward per call")
+            results = await asyncio.gather(*[self._run_pack([item], slots, counts) for item in pack])
+            return [result for pack_results in results for result in pack_results]
+        elapsed = (time.monotonic() - started) / len(pack)
+        for item, analysis in zip(pack, analyses):
+            if "raw_response" not in analysis:
+                self.cache.put(item["key"] if len(pack) == 1 else item["packed_key"], analysis, elapsed)
+        return [(item, analysis, None) for item, analysis in zip(pack, analyses)]
+
+    @staticmethod
+    def _records(item, analysis, error, cached):
+        for ward in item["wards"]:
+            record = {"type": "ward", "index": ward["index"], "ward": ward["ward"], "filename": ward["filename"]}
+            if error is None:
+                record.update(success=True, analysis=analysis, cached=cached)
+            elif isinstance(error, ModelError):
+                record.update(success=False, error=str(error), status_code=error.status_code)
+            else:
+                # OSError: an image PIL can't read
+                record.update(success=False, error=str(error), status_code=400 if isinstance(error, OSError) else 500)
+            yield record
+
+    async def sweep(self, wards):
+        """
+        Analyse wards ([{"index", "ward", "filename", "expected_beds", "data"}])
+        and yield a "ward" record for each as it finishes, then a "result" record
+        """
+        started = time.monotonic()
+        self.sweeps += 1
+        self.wards += len(wards)
+        yield {"type": "started", "wards": len(wards)}
+        hashes = await asyncio.gather(*[
+            asyncio.to_thread(image_hash, ward["data"], self.cache.perceptual) for ward in wards
+        ])
+        counts = {"succeeded": 0, "failed": 0, "cached": 0, "model_calls": 0}
+
+        def counted(records):
+            for record in records:
+                counts["succeeded" if record["success"] else "failed"] += 1
+                counts["cached"] += record.get("cached") == "hit"
+                yield record
+
+        pending = {}  # cache key -> item; identical images in the sweep share one
+        for ward, digest in zip(wards, hashes):
+            prompt = presence_prompt(ward["expected_beds"])
+            key = cache_key("presence", self.client.model, prompt, ward["expected_beds"], digest)
+            packed_key = cache_key("presence-packed", self.client.model, batch_prompt([ward["expected_beds"]]),
+                                   ward["expected_beds"], digest)
+            if key in pending:
+                pending[key]["wards"].append(ward)
+                continue
+            analysis = self.cache.get(key, packed_key)
+            if analysis is not None:
+                for record in counted(self._records({"wards": [ward]}, analysis, None, "hit")):
+                    yield record
+                continue
+            pending[key] = {"key": key, "packed_key": packed_key, "prompt": prompt, "expected_beds": ward["expected_beds"], "wards": [ward]}
+
+        items = list(pending.values())
+        prepared = await asyncio.gather(*[self.preparer.prepare(item["wards"][0]["data"]) for item in items],
+                                        return_exceptions=True)
+        ready = []
+        for item, result in zip(items, prepared):
+            if isinstance(result, Exception):
+                for record in counted(self._records(item, None, result, None)):
+                    yield record
+                continue
+            item["image"], item["mime_type"], info = result
+            item["tokens"] = image_tokens(info["size"])
+            ready.append(item)
+
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self._run_pack(pack, slots, counts)) for pack in self._pack(ready)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for item, analysis, error in await finished:
+                    for record in counted(self._records(item, analysis, error, "miss")):
+                        yield record
+        finally:
+            # The client went away: stop the calls not made yet
+            for task in tasks:
+                task.cancel()
+        yield dict(counts, type="result", wards=len(wards), seconds=round(time.monotonic() - started, 2))
+
+    def stats(self):
+        return {
+            "sweeps": self.sweeps,
+            "wards": self.wards,
+            "model_calls": self.calls,
+            "packed_images": self.packed_images,
+            "fallbacks": self.fallbacks,
+            "token_budget": self.token_budget,
+            "max_images": self.max_images,
+            "concurrency": self.concurrency,
+        }
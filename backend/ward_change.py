@@ -0,0 +1,234 @@
+"""
+Local change detection for before/after ward images.
+
+Most pairs sent to compare-ward-images show the same ward with nothing
+changed, and each used to cost a Gemini call. ChangeDetector compares the
+pair on the CPU first:
+- both images are decoded small (draft mode) in grayscale, upright;
+- the "after" image is aligned to the "before" one (ECC, shift, rotation
+  and zoom), so a nudged camera is not a change, and its brightness and
+  contrast are matched;
+- a per-pixel SSIM map is computed and, per region, the share of pixels
+  below ssim_threshold. Regions are a rows x cols grid, or calibrated bed
+  boxes per ward from a regions file.
+A pair with no changed region is answered locally (nothing missing); a pair
+that can't be compared (little overlap left after alignment, or a degenerate
+warp) counts as changed. When
+regions changed, only their crops are sent to the model (the "after" crop
+mapped back through the alignment, so it shows the same part of the ward),
+unless there are
+more than max_crops of them or they cover more than max_crop_area of the
+picture, in which case the whole images are.
+
+At the defaults (4x6 grid, min_changed 0.02) a change of about 40x80 px in a
+1024x768 picture is found even where it straddles four cells; smaller ones
+are not. Raise the grid or lower min_changed to see smaller changes, at the
+cost of more pairs sent to the model for noise.
+
+Regions file: {"ward 3": [{"bed": "Bed 1", "box": [x0, y0, x1, y1]}, ...]},
+boxes as fractions of the width and height.
+"""
+import asyncio
+import io
+import json
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+WORK_EDGE = 480  # longest side the comparison runs at
+CROP_MARGIN = 0.04  # added around each changed region, as a fraction of the picture
+MIN_OVERLAP = 0.5  # share of the picture that must still be comparable after alignment
+
+def load_regions(path):
+    """Calibrated bed boxes per ward from a JSON file; {} without a path"""
+    if not path:
+        return {}
+    with open(path) as f:
+        regions = json.load(f)
+    for ward, beds in regions.items():
+        for bed in beds:
+            x0, y0, x1, y1 = bed["box"]
+            if not 0 <= x0 < x1 <= 1 or not 0 <= y0 < y1 <= 1:
+                raise ValueError(f"Invalid box for {ward} {bed.get('bed')}: {bed['box']}")
+    return regions
+
+def _load_gray(data, edge=WORK_EDGE):
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", (edge, edge))
+    image = ImageOps.exif_transpose(image).convert("L")
+    image.thumbnail((edge, edge), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+def _align(before, after):
+    """after warped onto before, its valid-pixel mask, and whether ECC converged"""
+    warp = np.eye(2, 3, dtype=np.float32)
+    aligned = True
+    try:
+        criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4)
+        _, warp = cv2.findTransformECC(before, after, warp, cv2.MOTION_AFFINE, criteria, None, 5)
+    except cv2.error:
+        # Featureless or too different to align: compare as they are
+        warp = np.eye(2, 3, dtype=np.float32)
+        aligned = False
+    height, width = before.shape
+    flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+    warped = cv2.warpAffine(after, warp, (width, height), flags=flags, borderMode=cv2.BORDER_REPLICATE)
+    valid = cv2.warpAffine(np.ones_like(after), warp, (width, height), flags=flags) > 0.99
+    # Less the SSIM window along the edge, where it would see the replicated border
+    valid = cv2.erode(valid.astype(np.uint8), np.ones((11, 11), np.uint8)).astype(bool)
+    return warped, valid, aligned, warp
+
+def _ssim_map(a, b):
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur = lambda image: cv2.GaussianBlur(image, (11, 11), 1.5)
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a * mu_a
+    var_b = blur(b * b) - mu_b * mu_b
+    covariance = blur(a * b) - mu_a * mu_b
+    return ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+
+def _warp_box(box, warp, width, height):
+    """A box of the "before" picture as a box of the unaligned "after" one (fractions of each)"""
+    x0, y0, x1, y1 = box
+    corners = np.array([[x0, y0, 1], [x1, y0, 1], [x0, y1, 1], [x1, y1, 1]]) * [width, height, 1]
+    # The warp takes "before" pixel coordinates to "after" ones (see _align)
+    mapped = corners @ np.asarray(warp, dtype=np.float64).T / [width, height]
+    x0, y0 = np.clip(mapped.min(axis=0), 0.0, 1.0)
+    x1, y1 = np.clip(mapped.max(axis=0), 0.0, 1.0)
+    return (round(float(x0), 4), round(float(y0), 4), round(float(x1), 4), round(float(y1), 4))
+
+def _position(box):
+    """Where a box lies in the picture, in words"""
+    x, y = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+    row = "top" if y < 1 / 3 else "bottom" if y > 2 / 3 else "middle"
+    column = "left" if x < 1 / 3 else "right" if x > 2 / 3 else "center"
+    return "center" if (row, column) == ("middle", "center") else f"{row} {column}"
+
+class ChangeDetector:
+    def __init__(self, grid=(4, 6), ssim_threshold=0.5, min_changed=0.02, regions=None,
+                 max_crops=4, max_crop_area=0.5):
+        """
+        grid: (rows, cols) of the regions compared when a ward has no calibrated beds
+        ssim_threshold: pixels with a local SSIM below this count as changed
+        min_changed: share of changed pixels that makes a region changed
+        regions: calibrated bed boxes per ward, see load_regions
+        """
+        self.grid = grid
+        self.ssim_threshold = ssim_threshold
+        self.min_changed = min_changed
+        self.regions = regions or {}
+        self.max_crops = max_crops
+        self.max_crop_area = max_crop_area
+        self.pairs = 0
+        self.unchanged = 0
+        self.cropped = 0
+        self.full = 0
+        self.seconds = 0.0
+
+    def _regions(self, ward):
+        if ward is not None and ward in self.regions:
+            return [{"label": bed["bed"], "box": tuple(bed["box"]), "cell": None} for bed in self.regions[ward]]
+        rows, cols = self.grid
+        return [{"label": None, "box": (c / cols, r / rows, (c + 1) / cols, (r + 1) / rows), "cell": (r, c)}
+                for r in range(rows) for c in range(cols)]
+
+    def _crops(self, changed):
+        """Crop boxes of the changed regions: touching grid cells form one crop"""
+        groups = [[region] for region in changed if region["cell"] is None]
+        cells = {region["cell"]: region for region in changed if region["cell"] is not None}
+        if cells:
+            mask = np.zeros(self.grid, dtype=np.uint8)
+            for cell in cells:
+                mask[cell] = 1
+            count, labels = cv2.connectedComponents(mask, connectivity=8)
+            for label in range(1, count):
+                groups.append([cells[cell] for cell in zip(*np.nonzero(labels == label))])
+        crops = []
+        for group in groups:
+            x0 = max(0.0, min(region["box"][0] for region in group) - CROP_MARGIN)
+            y0 = max(0.0, min(region["box"][1] for region in group) - CROP_MARGIN)
+            x1 = min(1.0, max(region["box"][2] for region in group) + CROP_MARGIN)
+            y1 = min(1.0, max(region["box"][3] for region in group) + CROP_MARGIN)
+            box = (round(x0, 4), round(y0, 4), round(x1, 4), round(y1, 4))
+            labels = [region["label"] for region in group if region["label"]]
+            crops.append({"box": box, "location": ", ".join(labels) if labels else _position(box)})
+        return crops
+
+    def compare(self, before_data, after_data, ward=None):
+        """
+        Compare a before/after pair. Returns {"changed", "regions", "crops",
+        "aligned", ...}; crops is None when the whole images should be sent.
+        Each crop has a "box" of the before image and an "after_box" of the after one.
+        """
+        before, after = _load_gray(before_data), _load_gray(after_data)
+        height, width = before.shape
+        if abs(after.shape[1] / after.shape[0] - width / height) > 0.02:
+            # Different framing altogether: nothing to compare locally
+            return {"changed": True, "reason": "aspect ratios differ", "aligned": False,
+                    "regions": [], "crops": None}
+        if after.shape != before.shape:
+            after = cv2.resize(after, (width, height), interpolation=cv2.INTER_AREA)
+
+        after, valid, aligned, warp = _align(before, after)
+        if valid.mean() < MIN_OVERLAP or not np.isfinite(warp).all():
+            return {"changed": True, "reason": "too little overlap after alignment", "aligned": aligned,
+                    "regions": [], "crops": None}
+        # Match brightness and contrast, so lights dimmed for the night are not a change
+        mean_b, std_b = before[valid].mean(), before[valid].std() + 1e-6
+        mean_a, std_a = after[valid].mean(), after[valid].std() + 1e-6
+        after = (after - mean_a) * (std_b / std_a) + mean_b
+        # NaN compares as changed: a pixel that can't be judged is no proof of sameness
+        below = ~(_ssim_map(before, after) >= self.ssim_threshold) & valid
+
+        regions = []
+        for region in self._regions(ward):
+            x0, y0, x1, y1 = region["box"]
+            rows = slice(int(y0 * height), max(int(y1 * height), int(y0 * height) + 1))
+            cols = slice(int(x0 * width), max(int(x1 * width), int(x0 * width) + 1))
+            pixels = valid[rows, cols].sum()
+            share = float(below[rows, cols].sum() / pixels) if pixels else 1.0
+            regions.append(dict(region, changed_share=round(share, 3), changed=share >= self.min_changed))
+
+        changed = [region for region in regions if region["changed"]]
+        crops = self._crops(changed)
+        area = sum((box[2] - box[0]) * (box[3] - box[1]) for box in (crop["box"] for crop in crops))
+        if len(crops) > self.max_crops or area > self.max_crop_area:
+            crops = None
+        else:
+            for crop in crops:
+                crop["after_box"] = _warp_box(crop["box"], warp, width, height)
+        return {
+            "changed": bool(changed),
+            "aligned": aligned,
+            "shift": [round(float(warp[0, 2]) / width, 4), round(float(warp[1, 2]) / height, 4)],
+            "regions": [{key: region[key] for key in ("label", "box", "changed_share", "changed")}
+                        for region in regions],
+            "crops": crops,
+        }
+
+    async def check(self, before_data, after_data, ward=None):
+        """compare() in a worker thread, counted in stats()"""
+        started = time.monotonic()
+        result = await asyncio.to_thread(self.compare, before_data, after_data, ward)
+        self.seconds += time.monotonic() - started
+        self.pairs += 1
+        if not result["changed"]:
+            self.unchanged += 1
+        elif result["crops"] is None:
+            self.full += 1
+        else:
+            self.cropped += 1
+        return result
+
+    def stats(self):
+        return {
+            "grid": list(self.grid),
+            "calibrated_wards": len(self.regions),
+            "pairs": self.pairs,
+            "unchanged": self.unchanged,
+            "cropped": self.cropped,
+            "full": self.full,
+            "avg_ms": round(self.seconds / self.pairs * 1000, 1) if self.pairs else 0.0,
+        }